@@ -0,0 +1,67 @@
+"""Caller/callee (butterfly) view of a function in a nflxprofile profile."""
+
+__ALL__ = ['get_butterfly']
+
+from nflxprofile.flamegraph import StackProcessor, _aggregate_samples, _get_stack_resolver
+
+
+def _new_root(function_name):
+    return {
+        'name': function_name,
+        'libtype': '',
+        'value': 0,
+        'children': []
+    }
+
+
+def get_butterfly(profile, pid_comm, function_name, **args):
+    """Generate the callers and callees trees of a function.
+
+    Both trees are rooted at function_name, matched exactly against frame
+    names after stack processing. The callers tree is inverted: its children
+    are the direct callers of the function, their children the callers'
+    callers and so on. The callees tree holds everything called from the
+    function.
+
+    Recursive calls are merged: callers are taken above the outermost
+    occurrence of the function and callees below it, so each sample is
+    counted once in each tree. Direct recursion of the function is collapsed
+    in callees, f;f;g is a call of g, while indirect recursion is kept, the
+    callees of f in f;x;f;g are x and x;f;g. Sample filters and stack processors
+    are honored as in get_flame_graph, and all of it is computed from a single
+    pass over the unique aggregated stacks.
+    """
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+    # stacks are always resolved root first, each tree sets its own direction
+    args = dict(args, inverted=False)
+
+    aggregated_samples = _aggregate_samples(profile, **args)
+    get_stack = _get_stack_resolver(profile, pid_comm, **args)
+
+    callers_root = _new_root(function_name)
+    callees_root = _new_root(function_name)
+    # frames are inserted by other processors than the one processing them,
+    # per frame state (like argument adaptor counts) goes through frame extras
+    stack_processor = stack_processor_class(None, profile, **args)
+    callers_processor = stack_processor_class(callers_root, profile, **args)
+    callees_processor = stack_processor_class(callees_root, profile, **args)
+
+    total = 0
+    for sample_id, value in aggregated_samples.items():
+        frames = list(stack_processor.process_stack(get_stack(sample_id), value))
+        positions = [i for i, (frame, _) in enumerate(frames) if frame.function_name.strip() == function_name]
+        if not positions:
+            continue
+        total += value
+        callers_processor.insert(reversed(frames[:positions[0]]), value)
+        # occurrences right below an occurrence are direct recursion
+        recursive = {position for previous, position in zip(positions, positions[1:]) if position == previous + 1}
+        callees = [frame for i, frame in enumerate(frames[positions[0] + 1:], positions[0] + 1) if i not in recursive]
+        callees_processor.insert(callees, value)
+
+    return {
+        'name': function_name,
+        'value': total,
+        'callers': callers_root,
+        'callees': callees_root,
+    }
@@ -0,0 +1,300 @@
+"""Chunked, time-indexed container of nflxprofile profiles.
+
+A chunked file stores a long capture as consecutive Profile chunks, each one
+covering a time span, followed by an index of chunk offsets and times::
+
+    header:  MAGIC, version
+    chunk:   nodes record, samples record      (repeated)
+    index:   one INDEX_ENTRY per chunk
+    footer:  FOOTER, MAGIC
+
+Each nodes record is a Profile holding only the nodes that were not written
+by a previous chunk, so the node table is delta-encoded across chunks. Each
+samples record is a Profile holding the sample columns of the chunk, with
+time_deltas relative to its own start_time. Readers load every nodes record
+but decode only the samples records overlapping the requested range.
+"""
+
+__ALL__ = ['ChunkedProfileReader', 'ChunkedProfileWriter', 'split_profile', 'write_chunked']
+
+import collections
+import math
+import struct
+
+from nflxprofile import nflxprofile_pb2, ticks
+from nflxprofile.compact import get_parents
+from nflxprofile.flamegraph import get_flame_graph
+
+MAGIC = b'NFLXCHNK'
+VERSION = 1
+HEADER = struct.Struct('<8sH')
+# offset, nodes record size, samples record size, start time, end time, last sample time
+INDEX_ENTRY = struct.Struct('<QQQddd')
+# start time, end time, index offset, chunk count
+FOOTER = struct.Struct('<ddQQ')
+
+SAMPLE_COLUMNS = ['samples', 'time_deltas', 'samples_cpu', 'samples_pid', 'samples_tid', 'samples_value']
+# whole capture fields, stored with the first nodes record
+HISTOGRAM_FIELDS = ['sample_histogram', 'idle_histogram']
+
+ChunkInfo = collections.namedtuple(
+    'ChunkInfo', ['offset', 'nodes_size', 'samples_size', 'start_time', 'end_time', 'last_sample_time'])
+
+
+class ChunkedProfileWriter:
+    """Write profiles as chunks of a chunked container.
+
+    Node ids must be stable across chunks: a node id written by an earlier
+    chunk is assumed to describe the same node in later chunks.
+    """
+
+    def __init__(self, f):
+        """Constructor, f must be a binary file object."""
+        self.f = f
+        self.written_nodes = set()
+        self.index = []
+        self.start_time = None
+        self.end_time = None
+        self.f.write(HEADER.pack(MAGIC, VERSION))
+
+    def write_chunk(self, profile, nodes=None):
+        """Append profile as the next chunk.
+
+        Only the nodes (profile.nodes by default) not written by a previous
+        chunk are stored.
+        """
+        if nodes is None:
+            nodes = profile.nodes
+        if ticks.has_tick_runs(profile):
+            profile = ticks.expand(profile)
+        nodes_record = nflxprofile_pb2.Profile()
+        nodes_record.start_time = nodes_record.end_time = 0
+        if not self.index:
+            nodes_record.params.update(profile.params)
+            if profile.HasField('title'):
+                nodes_record.title = profile.title
+            if profile.HasField('description'):
+                nodes_record.description = profile.description
+            if profile.histogram_interval:
+                nodes_record.histogram_interval = profile.histogram_interval
+                for field in HISTOGRAM_FIELDS:
+                    getattr(nodes_record, field).extend(getattr(profile, field))
+        for node_id in nodes:
+            if node_id not in self.written_nodes:
+                nodes_record.nodes[node_id].CopyFrom(nodes[node_id])
+                self.written_nodes.add(node_id)
+
+        samples = nflxprofile_pb2.Profile()
+        samples.start_time = profile.start_time
+        samples.end_time = profile.end_time
+        for column in SAMPLE_COLUMNS:
+            getattr(samples, column).extend(getattr(profile, column))
+        if profile.HasField('idle_sample_count'):
+            samples.idle_sample_count = profile.idle_sample_count
+        if profile.HasField('program_sample_count'):
+            samples.program_sample_count = profile.program_sample_count
+
+        nodes_data = nodes_record.SerializeToString()
+        samples_data = samples.SerializeToString()
+        last_sample_time = profile.start_time + math.fsum(profile.time_deltas)
+
+        self.index.append(ChunkInfo(self.f.tell(), len(nodes_data), len(samples_data),
+                                    profile.start_time, profile.end_time, last_sample_time))
+        self.f.write(nodes_data)
+        self.f.write(samples_data)
+
+        if self.start_time is None or profile.start_time < self.start_time:
+            self.start_time = profile.start_time
+        if self.end_time is None or profile.end_time > self.end_time:
+            self.end_time = profile.end_time
+
+    def close(self):
+        """Write the index and footer. The file object is not closed."""
+        index_offset = self.f.tell()
+        for chunk in self.index:
+            self.f.write(INDEX_ENTRY.pack(*chunk))
+        self.f.write(FOOTER.pack(self.start_time or 0, self.end_time or 0, index_offset, len(self.index)))
+        self.f.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def split_profile(profile, chunk_duration):
+    """Split the samples of a profile into chunks of chunk_duration seconds.
+
+    Yields one Profile per non-empty time span. Chunks carry sample columns
+    only, nodes are left to the caller (see write_chunked).
+    """
+    if ticks.has_tick_runs(profile):
+        profile = ticks.expand(profile)
+    columns = [column for column in SAMPLE_COLUMNS if len(getattr(profile, column)) == len(profile.samples)]
+    start_time = profile.start_time
+
+    def make_chunk(first, last, reference_time, chunk_end):
+        chunk = nflxprofile_pb2.Profile()
+        chunk.start_time = reference_time
+        chunk.end_time = min(chunk_end, max(profile.end_time, reference_time))
+        for column in columns:
+            getattr(chunk, column).extend(getattr(profile, column)[first:last])
+        return chunk
+
+    first = 0
+    reference_time = previous_time = current_time = start_time
+    chunk_end = None
+    for index, time_delta in enumerate(profile.time_deltas):
+        current_time += time_delta
+        if chunk_end is not None and current_time >= chunk_end:
+            yield make_chunk(first, index, reference_time, chunk_end)
+            first = index
+            reference_time = previous_time
+            chunk_end = None
+        if chunk_end is None:
+            chunk_end = start_time + (math.floor((current_time - start_time) / chunk_duration) + 1) * chunk_duration
+        previous_time = current_time
+
+    if chunk_end is not None:
+        yield make_chunk(first, len(profile.time_deltas), reference_time, chunk_end)
+
+
+def write_chunked(profile, f, chunk_duration=60):
+    """Write profile to f as a chunked container of chunk_duration seconds chunks.
+
+    Nodes are written with the first chunk sampling them (or one of their
+    descendants), nodes no sample references with the last chunk.
+    """
+    parents = get_parents(profile, profile.params.get('has_parent') == 'true')
+    remaining = set(profile.nodes)
+
+    def get_chunk_nodes(node_ids):
+        nodes = {}
+        for node_id in node_ids:
+            # an ancestor already written was written along with its own ancestors
+            while node_id in remaining:
+                remaining.discard(node_id)
+                nodes[node_id] = profile.nodes[node_id]
+                node_id = parents.get(node_id)
+        return nodes
+
+    with ChunkedProfileWriter(f) as writer:
+        chunks = split_profile(profile, chunk_duration)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            first_chunk = nflxprofile_pb2.Profile()
+            first_chunk.start_time = profile.start_time
+            first_chunk.end_time = profile.end_time
+        first_chunk.params.update(profile.params)
+        if profile.HasField('title'):
+            first_chunk.title = profile.title
+        if profile.HasField('description'):
+            first_chunk.description = profile.description
+        if profile.histogram_interval:
+            first_chunk.histogram_interval = profile.histogram_interval
+            for field in HISTOGRAM_FIELDS:
+                getattr(first_chunk, field).extend(getattr(profile, field))
+        # idle and program samples have no time, they are counted with the first chunk
+        for field in ['idle_sample_count', 'program_sample_count']:
+            if profile.HasField(field):
+                setattr(first_chunk, field, getattr(profile, field))
+        previous_chunk = first_chunk
+        node_ids = [0] + list(first_chunk.samples)
+        for chunk in chunks:
+            writer.write_chunk(previous_chunk, nodes=get_chunk_nodes(node_ids))
+            previous_chunk = chunk
+            node_ids = chunk.samples
+        node_ids = list(node_ids) + sorted(remaining)
+        writer.write_chunk(previous_chunk, nodes=get_chunk_nodes(node_ids))
+        writer.start_time = profile.start_time
+        writer.end_time = profile.end_time
+
+
+class ChunkedProfileReader:
+    """Read a chunked container, decoding only the chunks needed for a range."""
+
+    def __init__(self, f):
+        """Constructor, f must be a seekable binary file object."""
+        self.f = f
+        f.seek(0)
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Not a chunked nflxprofile file")
+        if version != VERSION:
+            raise ValueError("Unsupported chunked nflxprofile version %d" % version)
+
+        f.seek(-(FOOTER.size + len(MAGIC)), 2)
+        footer = f.read(FOOTER.size + len(MAGIC))
+        if footer[FOOTER.size:] != MAGIC:
+            raise ValueError("Truncated chunked nflxprofile file")
+        self.start_time, self.end_time, index_offset, count = FOOTER.unpack(footer[:FOOTER.size])
+
+        f.seek(index_offset)
+        index = f.read(INDEX_ENTRY.size * count)
+        self.chunks = [ChunkInfo(*entry) for entry in INDEX_ENTRY.iter_unpack(index)]
+
+    def get_chunks(self, range_start=None, range_end=None):
+        """Return the chunks overlapping the range.
+
+        As in get_flame_graph, range_start and range_end are in seconds
+        relative to the start of the profile.
+        """
+        if range_start is None or range_end is None:
+            return list(self.chunks)
+        start_time = math.floor(self.start_time)
+        range_start = start_time + range_start
+        range_end = start_time + range_end
+        return [chunk for chunk in self.chunks
+                if chunk.start_time < range_end and chunk.last_sample_time >= range_start]
+
+    def load(self, range_start=None, range_end=None):
+        """Load a Profile with every node and the samples of overlapping chunks.
+
+        The returned profile keeps the start time of the whole capture, so
+        range_start and range_end mean the same thing when it is passed to
+        get_flame_graph.
+
+        Idle and program sample counts have no time, so they are only set
+        when every chunk is loaded. Histograms cover the whole capture: pass
+        the range to get_cpu_utilization for the utilization of a partial
+        load.
+        """
+        profile = nflxprofile_pb2.Profile()
+        for chunk in self.chunks:
+            self.f.seek(chunk.offset)
+            profile.MergeFromString(self.f.read(chunk.nodes_size))
+
+        idle_sample_count = program_sample_count = None
+        last_time = self.start_time
+        chunks = self.get_chunks(range_start, range_end)
+        for chunk in chunks:
+            self.f.seek(chunk.offset + chunk.nodes_size)
+            first_index = len(profile.time_deltas)
+            samples = nflxprofile_pb2.Profile()
+            samples.ParseFromString(self.f.read(chunk.samples_size))
+            for column in SAMPLE_COLUMNS:
+                getattr(profile, column).extend(getattr(samples, column))
+            if samples.HasField('idle_sample_count'):
+                idle_sample_count = (idle_sample_count or 0) + samples.idle_sample_count
+            if samples.HasField('program_sample_count'):
+                program_sample_count = (program_sample_count or 0) + samples.program_sample_count
+            if len(profile.time_deltas) > first_index:
+                # deltas are relative to the chunk start, rebase on the previous sample loaded
+                profile.time_deltas[first_index] += chunk.start_time - last_time
+                last_time = chunk.last_sample_time
+
+        profile.start_time = self.start_time
+        profile.end_time = self.end_time
+        if len(chunks) == len(self.chunks):
+            if idle_sample_count is not None:
+                profile.idle_sample_count = idle_sample_count
+            if program_sample_count is not None:
+                profile.program_sample_count = program_sample_count
+        return profile
+
+    def get_flame_graph(self, pid_comm, **args):
+        """Generate a flame graph, decoding only the chunks in the requested range."""
+        profile = self.load(args.get('range_start'), args.get('range_end'))
+        return get_flame_graph(profile, pid_comm, **args)
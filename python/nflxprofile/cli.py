@@ -1,39 +1,35 @@
 import argparse
-import functools
 import json
+import os
+import sys
 
-from nflxprofile.convert.v8_cpuprofile import parse as v8_parse
-from nflxprofile.flamegraph import JavaStackProcessor, NodeJsPackageStackProcessor, NodeJsStackProcessor, StackProcessor
-from nflxprofile.flamegraph import get_flame_graph
-from nflxprofile.nflxprofile_pb2 import Profile
-
-STACK_PROCESSOR = {
-    'default':  StackProcessor,
-    'java': JavaStackProcessor,
-    'nodejs':  NodeJsStackProcessor,
-    'nodejs-package':  NodeJsPackageStackProcessor,
-}
-
-
-def get_input_format(input_format, input_files=[]):
-    if input_format is None:
-        if functools.reduce(lambda a, b: a and b.endswith(".cpuprofile"), input_files, True):
-            input_format = 'v8'
-        elif len(input_files) != 1:
-            raise ValueError("Unable to infer input type. Please use --input-format")
-        elif input_files[0].endswith(".nflxprofile"):
-            input_format = 'nflxprofile'
-        else:
-            input_format = 'perf'
-    return input_format
+from nflxprofile.profile_io import PROFILE_EXTENSIONS
+from nflxprofile.registry import CHUNKED_EXTENSIONS, FOLDED_EXTENSIONS, INPUT_FORMATS, PPROF_EXTENSIONS
+from nflxprofile.registry import LazyRegistry, get_input_format
+
+# modules are imported when a processor is selected, plugins can add more
+# with entry points in the nflxprofile.stack_processors group
+STACK_PROCESSOR = LazyRegistry({
+    'default':  'nflxprofile.flamegraph:StackProcessor',
+    'java': 'nflxprofile.flamegraph:JavaStackProcessor',
+    'nodejs':  'nflxprofile.flamegraph:NodeJsStackProcessor',
+    'nodejs-package':  'nflxprofile.flamegraph:NodeJsPackageStackProcessor',
+    'rules': 'nflxprofile.flamegraph:RuleStackProcessor',
+}, 'nflxprofile.stack_processors')
 
 
 def get_output_format(output_format, output_file=None):
     if output_format is None:
-        if output_file is None or output_file.endswith(".nflxprofile"):
+        if output_file is None or output_file.endswith(PROFILE_EXTENSIONS):
             output_format = 'nflxprofile'
-        elif output_file.endswith(".json"):
+        elif output_file.endswith((".json", ".json.gz")):
             output_format = 'tree'
+        elif output_file.endswith(FOLDED_EXTENSIONS):
+            output_format = 'folded'
+        elif output_file.endswith(CHUNKED_EXTENSIONS):
+            output_format = 'chunked'
+        elif output_file.endswith(PPROF_EXTENSIONS):
+            output_format = 'pprof'
         else:
             raise ValueError("Unable to infer output type. Please use --output-format")
     return output_format
@@ -41,6 +37,9 @@ def get_output_format(output_format, output_file=None):
 
 def validate_input_output(input_format, output_format, input_files=[]):
     if input_format == 'nflxprofile':
+        if output_format not in ['nflxprofile', 'tree', 'folded', 'chunked', 'pprof', 'flamechart', 'trace']:
+            raise ValueError("Can't convert %s to %s" % (input_format, output_format))
+    elif input_format == 'chunked':
         if output_format != 'tree':
             raise ValueError("Can't convert %s to %s" % (input_format, output_format))
     else:
@@ -51,17 +50,102 @@ def validate_input_output(input_format, output_format, input_files=[]):
         raise ValueError("Only V8 .cpuprofile support multiple input files")
 
 
-def main():
+def info_main(argv):
+    parser = argparse.ArgumentParser(prog="nflxprofile info", description=('Print '
+                                     'the metadata of nflxprofile files as JSON'))
+    parser.add_argument('--count-samples', action="store_true")
+    parser.add_argument('input', nargs="+")
+
+    args = parser.parse_args(argv)
+
+    from nflxprofile.info import read_info
+
+    for filename in args.input:
+        info = read_info(filename, args.count_samples)
+        info['file'] = filename
+        print(json.dumps(info, sort_keys=True))
+
+
+def compact_main(argv):
+    parser = argparse.ArgumentParser(prog="nflxprofile compact", description=('Drop '
+                                     'unreferenced nodes and renumber node ids densely'))
+    parser.add_argument('--output')
+    parser.add_argument('input')
+
+    args = parser.parse_args(argv)
+
+    from nflxprofile.compact import compact
+    from nflxprofile.profile_io import dump as profile_dump, load as profile_load
+
+    out = args.output
+    if not out:
+        out = 'profile.nflxprofile'
+    profile_dump(compact(profile_load(args.input)), out)
+
+
+def watch_main(argv):
+    parser = argparse.ArgumentParser(prog="nflxprofile watch", description=('Convert the profiles '
+                                     'dropped into a directory, skipping the ones already converted'))
+    parser.add_argument('--output-dir')
+    parser.add_argument('--index', help='index of converted files, by default .nflxprofile-index in the output dir')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--max-pending', type=int)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--polling', action="store_true", help='poll the directory instead of using inotify')
+    parser.add_argument('--stats-interval', type=float)
+    parser.add_argument('--once', action="store_true", help='convert existing files and exit')
+    parser.add_argument('--extra-options', type=json.loads)
+    parser.add_argument('directory')
+
+    args = parser.parse_args(argv)
+
+    from nflxprofile.watch import ConversionDaemon
+
+    output_dir = args.output_dir or args.directory
+    index = args.index or os.path.join(output_dir, '.nflxprofile-index')
+    daemon = ConversionDaemon(args.directory, output_dir, args.workers, args.max_pending, index,
+                              **(args.extra_options or {}))
+
+    def report(stats):
+        print(json.dumps(stats, sort_keys=True), flush=True)
+
+    try:
+        if args.once:
+            daemon.scan()
+        else:
+            daemon.run(poll_interval=args.poll_interval, use_inotify=not args.polling,
+                       stats_interval=args.stats_interval, report=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.wait()
+        daemon.close()
+        report(daemon.get_stats())
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'info':
+        return info_main(argv[1:])
+    if argv and argv[0] == 'compact':
+        return compact_main(argv[1:])
+    if argv and argv[0] == 'watch':
+        return watch_main(argv[1:])
+
     parser = argparse.ArgumentParser(prog="nflxprofile", description=('Parse '
                                      'common profile/tracing formats into nflxprofile'))
     parser.add_argument('--output')
-    parser.add_argument('--input-format', choices=['v8', 'perf', 'nflxprofile'])
-    parser.add_argument('--output-format', choices=['nflxprofile', 'tree'])
+    # not restricted with choices, listing them would load every plugin
+    parser.add_argument('--input-format', help=('v8, perf, nflxprofile, folded, chunked, pprof or the name '
+                                                'of an input format plugin'))
+    parser.add_argument('--output-format', choices=['nflxprofile', 'tree', 'folded', 'chunked', 'pprof', 'flamechart',
+                                                    'trace'])
     parser.add_argument('--force', action="store_true")
     parser.add_argument('--extra-options', type=json.loads)
     parser.add_argument('input', nargs="+")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     input_format = get_input_format(args.input_format, args.input)
     output_format = get_output_format(args.output_format, args.output)
@@ -76,16 +160,13 @@ def main():
         filenames = args.input
         extra_options = args.extra_options or {}
 
-        profile = None
-        if input_format == 'v8':
-            profiles = []
-            for filename in filenames:
-                with open(filename, 'r') as f:
-                    profiles.append(json.loads(f.read()))
-            profile = v8_parse(profiles, **extra_options)
+        if input_format not in INPUT_FORMATS:
+            parser.error("unsupported input format: %s" % input_format)
+        profile = INPUT_FORMATS[input_format](filenames, **extra_options)
 
-        with open(out, 'wb') as f:
-            f.write(profile.SerializeToString())
+        from nflxprofile.profile_io import dump as profile_dump
+
+        profile_dump(profile, out)
 
     elif output_format == 'tree':
         out = args.output
@@ -95,14 +176,96 @@ def main():
         filename = args.input[0]
         extra_options = args.extra_options or {}
 
+        from nflxprofile.flamegraph import package_cache
+
         extra_options['stack_processor'] = STACK_PROCESSOR[extra_options.get('stack_processor', 'default')]
+        # package classifications persisted between runs
+        package_cache_file = extra_options.pop('package_cache_file', None)
+        if package_cache_file:
+            package_cache.load(package_cache_file)
 
         tree = {}
         if input_format == 'nflxprofile':
-            profile = Profile()
-            with open(filename, 'rb') as f:
-                profile.ParseFromString(f.read())
+            from nflxprofile.flamegraph import get_flame_graph
+            from nflxprofile.profile_io import load as profile_load
+
+            profile = profile_load(filename)
             tree = get_flame_graph(profile, {}, **extra_options)
+        elif input_format == 'chunked':
+            from nflxprofile.chunked import ChunkedProfileReader
+
+            with open(filename, 'rb') as f:
+                tree = ChunkedProfileReader(f).get_flame_graph({}, **extra_options)
+
+        from nflxprofile.tree_json import write_tree
+
+        write_tree(tree, out)
+        if package_cache_file:
+            package_cache.save(package_cache_file)
+
+    elif output_format == 'folded':
+        out = args.output
+        if not out:
+            out = 'profile.folded'
+
+        filename = args.input[0]
+        extra_options = args.extra_options or {}
+
+        if input_format == 'nflxprofile':
+            from nflxprofile.convert.folded import dump as folded_dump
+            from nflxprofile.profile_io import load as profile_load
+
+            profile = profile_load(filename)
+            with open(out, 'w') as f:
+                folded_dump(profile, f, **extra_options)
+
+    elif output_format == 'chunked':
+        out = args.output
+        if not out:
+            out = 'profile.nflxprofile-chunked'
+
+        filename = args.input[0]
+        extra_options = args.extra_options or {}
+
+        if input_format == 'nflxprofile':
+            from nflxprofile.chunked import write_chunked
+            from nflxprofile.profile_io import load as profile_load
+
+            profile = profile_load(filename)
+            with open(out, 'wb') as f:
+                write_chunked(profile, f, extra_options.get('chunk_duration', 60))
+
+    elif output_format == 'pprof':
+        out = args.output
+        if not out:
+            out = 'profile.pb.gz'
+
+        filename = args.input[0]
+        extra_options = args.extra_options or {}
+
+        if input_format == 'nflxprofile':
+            from nflxprofile.convert.pprof import dump as pprof_dump
+            from nflxprofile.profile_io import load as profile_load
+
+            profile = profile_load(filename)
+            with open(out, 'wb') as f:
+                pprof_dump(profile, f, **extra_options)
+
+    elif output_format in ['flamechart', 'trace']:
+        out = args.output
+        if not out:
+            out = 'profile.json'
+
+        filename = args.input[0]
+        extra_options = args.extra_options or {}
+
+        extra_options['stack_processor'] = STACK_PROCESSOR[extra_options.get('stack_processor', 'default')]
+        if input_format == 'nflxprofile':
+            from nflxprofile.flamechart import get_flame_chart, get_trace_events
+            from nflxprofile.profile_io import load as profile_load
+            from nflxprofile.tree_json import write_tree
 
-        with open(out, 'w') as f:
-            f.write(json.dumps(tree))
+            flame_chart = get_flame_chart(profile_load(filename), {}, **extra_options)
+            if output_format == 'trace':
+                flame_chart = get_trace_events(flame_chart)
+            write_tree(flame_chart, out)
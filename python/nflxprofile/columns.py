@@ -0,0 +1,170 @@
+"""Load the packed sample arrays of a profile as compact typed columns.
+
+Protobuf repeated fields hand back one Python object per element. Here the
+sample columns are decoded in bulk from the wire format instead: packed
+doubles are viewed in place, without a copy, and packed varints are decoded
+into array.array buffers, vectorized with NumPy when it is installed.
+"""
+
+__ALL__ = ['ColumnarProfile', 'load_columns', 'load']
+
+import array
+import mmap
+import sys
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.profile_io import COMPRESSION_MAGIC, _open_decompressed, _read_stream, get_compression
+from nflxprofile.wire import LENGTH_DELIMITED, iter_records
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# column -> array typecode of its varints
+VARINT_COLUMNS = {
+    'samples': 'I',
+    'samples_cpu': 'I',
+    'samples_pid': 'I',
+    'samples_tid': 'I',
+    'samples_value': 'Q',
+}
+DOUBLE_COLUMNS = ['time_deltas']
+
+_FIELD_COLUMNS = {
+    nflxprofile_pb2.Profile.DESCRIPTOR.fields_by_name[column].number: column
+    for column in list(VARINT_COLUMNS) + DOUBLE_COLUMNS
+}
+
+
+class ColumnarProfile:
+    """A Profile whose sample columns are typed arrays.
+
+    Sample columns (samples, time_deltas, samples_cpu, ...) are looked up in
+    columns, everything else (nodes, params, times, ...) comes from the
+    wrapped profile, so it can be passed to get_flame_graph and the other
+    functions taking a profile. Columns are read-only, and serializing the
+    wrapped profile doesn't include them.
+    """
+
+    def __init__(self, profile, columns, buffer=None):
+        """Constructor, buffer is the data columns are views of, kept alive with them."""
+        self.profile = profile
+        self.columns = columns
+        self.buffer = buffer
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        return getattr(self.profile, name)
+
+
+def _decode_varints_numpy(data, typecode):
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    if not len(raw):
+        return array.array(typecode)
+    # every varint ends with a byte without the continuation bit
+    ends = numpy.flatnonzero(raw < 0x80)
+    if not len(ends) or ends[-1] != len(raw) - 1:
+        raise ValueError("Truncated packed varints")
+    starts = numpy.concatenate(([0], ends[:-1] + 1)).astype(numpy.int64)
+    lengths = ends - starts + 1
+    if lengths.max() == 1:
+        values = raw.astype(numpy.uint64)
+    else:
+        positions = numpy.arange(len(raw)) - numpy.repeat(starts, lengths)
+        shifted = (raw & 0x7f).astype(numpy.uint64) << (positions.astype(numpy.uint64) * numpy.uint64(7))
+        values = numpy.add.reduceat(shifted, starts)
+    result = array.array(typecode)
+    result.frombytes(values.astype('=u%d' % result.itemsize).tobytes())
+    return result
+
+
+def _decode_varints_protobuf(record, column, typecode):
+    # let the protobuf C decoder parse a message holding only this field
+    profile = nflxprofile_pb2.Profile()
+    profile.MergeFromString(record)
+    return array.array(typecode, getattr(profile, column))
+
+
+def decode_varint_column(data, records, column):
+    """Decode the packed varint records of column into an array.
+
+    records is a list of ((value_start, value_end), record_start) pairs.
+    """
+    typecode = VARINT_COLUMNS[column]
+    result = array.array(typecode)
+    for (start, end), record_start in records:
+        if numpy is not None:
+            result.extend(_decode_varints_numpy(memoryview(data)[start:end], typecode))
+        else:
+            result.extend(_decode_varints_protobuf(bytes(data[record_start:end]), column, typecode))
+    return result
+
+
+def decode_double_column(data, records):
+    """Return the packed doubles of records, a view of data when possible."""
+    views = [memoryview(data)[start:end].cast('B').cast('d') for (start, end), _ in records]
+    if len(views) == 1 and sys.byteorder == 'little':
+        return views[0]
+    result = array.array('d')
+    for view in views:
+        result.frombytes(view)
+    if sys.byteorder != 'little':
+        result.byteswap()
+    return result
+
+
+def load_columns(data):
+    """Parse a serialized Profile, returning a ColumnarProfile.
+
+    Only the fields other than the sample columns are parsed by protobuf.
+    time_deltas is a memoryview of data, so data must stay unchanged while
+    the profile is used.
+    """
+    records = {}
+    # (start, end) spans of consecutive records which aren't sample columns
+    spans = []
+    for field_number, wire_type, value, record_start, record_end in iter_records(data):
+        column = _FIELD_COLUMNS.get(field_number)
+        if column is not None and wire_type == LENGTH_DELIMITED:
+            records.setdefault(column, []).append((value, record_start))
+        elif spans and spans[-1][1] == record_start:
+            spans[-1] = (spans[-1][0], record_end)
+        else:
+            spans.append((record_start, record_end))
+
+    profile = nflxprofile_pb2.Profile()
+    profile.ParseFromString(b''.join(bytes(data[start:end]) for start, end in spans))
+
+    columns = {}
+    for column in VARINT_COLUMNS:
+        if column in records:
+            columns[column] = decode_varint_column(data, records[column], column)
+        else:
+            # unpacked or missing, use whatever protobuf parsed
+            columns[column] = array.array(VARINT_COLUMNS[column], getattr(profile, column))
+    if 'time_deltas' in records:
+        columns['time_deltas'] = decode_double_column(data, records['time_deltas'])
+    else:
+        columns['time_deltas'] = array.array('d', profile.time_deltas)
+    return ColumnarProfile(profile, columns, data)
+
+
+def load(filename):
+    """Load filename as a ColumnarProfile, see profile_io.load.
+
+    Uncompressed files are memory-mapped and time_deltas is read straight
+    from the mapping.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(max(len(magic) for magic in COMPRESSION_MAGIC))
+        f.seek(0)
+        compression = get_compression(filename, header)
+        if compression is not None:
+            with _open_decompressed(f, compression) as stream:
+                return load_columns(_read_stream(stream))
+        if not header:
+            return load_columns(b'')
+        return load_columns(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
@@ -0,0 +1,96 @@
+"""Compaction of profiles: drop unused nodes and renumber the rest densely."""
+
+__ALL__ = ['compact', 'get_parents']
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import _get_sampled_node_ids, _has_aggregated_samples
+
+
+def get_parents(profile, has_parent):
+    """Return a {node_id: parent_id} dict, from parent pointers or children lists."""
+    parents = {}
+    for node_id, node in profile.nodes.items():
+        if has_parent:
+            if node.parent:
+                parents[node_id] = node.parent
+        else:
+            for child_id in node.children:
+                parents[child_id] = node_id
+    return parents
+
+
+def _get_stack_key(node):
+    return (node.pid, node.function_name, node.libtype) + tuple(
+        (frame.function_name, frame.libtype, frame.file.file_name, frame.file.line) for frame in node.stack)
+
+
+def compact(profile):
+    """Return a copy of profile without unreferenced nodes and with dense node ids.
+
+    Nodes no sample references (and that are not ancestors of one) are
+    dropped. Node 0, the root, keeps its id and the other nodes are numbered
+    from 1 in stack prefix order: depth first following children for
+    parent-pointer and children based profiles, by stack for profiles with
+    node stacks. samples, parent and children are rewritten and the
+    has_dense_ids param is set, letting readers index nodes by id.
+    """
+    has_node_stack = 'has_node_stack' in profile.params and profile.params['has_node_stack'] == 'true'
+    has_parent = 'has_parent' in profile.params and profile.params['has_parent'] == 'true'
+
+    kept = _get_sampled_node_ids(profile)
+    parents = {} if has_node_stack else get_parents(profile, has_parent)
+    for node_id in list(kept):
+        while node_id in parents and parents[node_id] not in kept:
+            node_id = parents[node_id]
+            kept.add(node_id)
+    kept.discard(0)
+    kept = [node_id for node_id in kept if node_id in profile.nodes]
+
+    if has_node_stack:
+        order = sorted(kept, key=lambda node_id: _get_stack_key(profile.nodes[node_id]))
+    else:
+        children = {}
+        for node_id in kept:
+            children.setdefault(parents.get(node_id, 0), []).append(node_id)
+        # keep the original sibling order when there are children lists
+        for parent_id, child_ids in children.items():
+            if not has_parent and parent_id in profile.nodes:
+                position = {child_id: index for index, child_id in enumerate(profile.nodes[parent_id].children)}
+                child_ids.sort(key=position.get)
+            else:
+                child_ids.sort()
+        order = []
+        pending = list(reversed(children.get(0, [])))
+        while pending:
+            node_id = pending.pop()
+            order.append(node_id)
+            pending.extend(reversed(children.get(node_id, [])))
+
+    new_ids = {0: 0}
+    for new_id, node_id in enumerate(order, 1):
+        new_ids[node_id] = new_id
+
+    compacted = nflxprofile_pb2.Profile()
+    compacted.CopyFrom(profile)
+    compacted.ClearField('nodes')
+    if 0 in profile.nodes:
+        compacted.nodes[0].CopyFrom(profile.nodes[0])
+    else:
+        compacted.nodes[0].function_name = 'root'
+        compacted.nodes[0].hit_count = 0
+    for node_id in order:
+        compacted.nodes[new_ids[node_id]].CopyFrom(profile.nodes[node_id])
+
+    for node in compacted.nodes.values():
+        if node.HasField('parent'):
+            node.parent = new_ids.get(node.parent, 0)
+        if node.children:
+            child_ids = [new_ids[child_id] for child_id in node.children if child_id in new_ids]
+            del node.children[:]
+            node.children.extend(child_ids)
+
+    if not _has_aggregated_samples(profile):
+        del compacted.samples[:]
+        compacted.samples.extend(new_ids[sample] for sample in profile.samples)
+    compacted.params['has_dense_ids'] = 'true'
+    return compacted
@@ -0,0 +1,122 @@
+__ALL__ = ['parse', 'dump']
+
+from nflxprofile import nflxprofile_pb2, ticks
+from nflxprofile.flamegraph import _aggregate_samples, _get_stack_resolver
+
+# libtype annotations used by flamegraph.pl (e.g. "do_syscall_64_[k]")
+ANNOTATION_LIBTYPES = {
+    '_[k]': 'kernel',
+    '_[j]': 'jit',
+    '_[i]': 'inlined',
+}
+
+LIBTYPE_ANNOTATIONS = {libtype: annotation for annotation, libtype in ANNOTATION_LIBTYPES.items()}
+
+
+def _split_annotation(frame):
+    annotation = frame[-4:]
+    if annotation in ANNOTATION_LIBTYPES:
+        return frame[:-4], ANNOTATION_LIBTYPES[annotation]
+    return frame, ''
+
+
+def _parse_line(line):
+    line = line.strip()
+    if not line:
+        return None, 0
+    stack, _, count = line.rpartition(' ')
+    if not stack:
+        return None, 0
+    try:
+        count = int(count)
+    except ValueError:
+        count = int(float(count))
+    return stack, count
+
+
+def parse(lines, **extra_options):
+    """Parse folded stacks into a nflxprofile profile.
+
+    Accepts any iterable of "frame;frame;frame count" lines (usually an open
+    file) and consumes it one line at a time. Frames are deduplicated into a
+    trie of parent-pointer nodes, and each unique stack becomes a single
+    sample whose count is stored in samples_value, so memory is bounded by
+    the number of unique frames rather than the size of the input.
+
+    With the tick_resolution extra option, samples are tick and run-length
+    encoded, see the ticks module. This is lossy: sample times are rounded
+    to ticks, and ValueError is raised if a delta between samples moves by
+    more than half a tick.
+    """
+    annotated = extra_options.get('annotated', True)
+
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = profile.end_time = 0
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    profile.params['has_parent'] = 'true'
+    profile.params['hasValues'] = 'true'
+
+    # (parent_id, function_name, libtype) -> node_id
+    trie = {}
+    values = {}
+
+    for line in lines:
+        stack, count = _parse_line(line)
+        if stack is None:
+            continue
+
+        parent_id = 0
+        for frame in stack.split(';'):
+            function_name, libtype = _split_annotation(frame) if annotated else (frame, '')
+            key = (parent_id, function_name, libtype)
+            node_id = trie.get(key)
+            if node_id is None:
+                node_id = len(trie) + 1
+                trie[key] = node_id
+                node = profile.nodes[node_id]
+                node.function_name = function_name
+                node.hit_count = 0
+                node.libtype = libtype
+                node.parent = parent_id
+            parent_id = node_id
+
+        values[parent_id] = values.get(parent_id, 0) + count
+
+    for node_id, value in values.items():
+        profile.samples.append(node_id)
+        profile.samples_value.append(value)
+        profile.time_deltas.append(0)
+        profile.nodes[node_id].hit_count += 1
+
+    tick_resolution = extra_options.get('tick_resolution', None)
+    if tick_resolution:
+        ticks.encode(profile, tick_resolution)
+
+    return profile
+
+
+def dump(profile, f, pid_comm=None, **args):
+    """Write a nflxprofile profile as folded stacks to the file object f.
+
+    One line is written per unique sampled stack, straight from
+    profile.nodes, with its aggregated value. Sample filters from
+    get_flame_graph (range_start/range_end, cpu, pid, tid) are honored.
+    """
+    annotated = args.get('annotated', True)
+    if 'hasValues' in profile.params and profile.params['hasValues'] == 'true':
+        args.setdefault('use_sample_value', True)
+    # folded stacks are always written root first
+    args['inverted'] = False
+
+    aggregated_samples = _aggregate_samples(profile, **args)
+    get_stack = _get_stack_resolver(profile, pid_comm or {}, **args)
+
+    for node_id, value in aggregated_samples.items():
+        frames = []
+        for frame in get_stack(node_id):
+            function_name = frame.function_name.replace(';', ':')
+            if annotated:
+                function_name += LIBTYPE_ANNOTATIONS.get(frame.libtype, '')
+            frames.append(function_name)
+        f.write('%s %d\n' % (';'.join(frames), value))
@@ -0,0 +1,303 @@
+"""Convert between pprof (profile.proto) and nflxprofile.
+
+pprof messages are read and written straight from the wire format, so no
+pprof bindings are needed and no message object is created per sample.
+"""
+
+__ALL__ = ['parse', 'dump']
+
+import gzip
+
+from nflxprofile import nflxprofile_pb2, ticks
+from nflxprofile.flamegraph import _aggregate_samples, _get_stack_resolver
+from nflxprofile.wire import LENGTH_DELIMITED, VARINT, encode_field, encode_varint, iter_fields, iter_packed_varints
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# profile.proto field numbers
+PROFILE_SAMPLE_TYPE = 1
+PROFILE_SAMPLE = 2
+PROFILE_LOCATION = 4
+PROFILE_FUNCTION = 5
+PROFILE_STRING_TABLE = 6
+PROFILE_TIME_NANOS = 9
+PROFILE_DURATION_NANOS = 10
+PROFILE_DEFAULT_SAMPLE_TYPE = 14
+VALUE_TYPE_TYPE = 1
+VALUE_TYPE_UNIT = 2
+SAMPLE_LOCATION_ID = 1
+SAMPLE_VALUE = 2
+LOCATION_ID = 1
+LOCATION_ADDRESS = 3
+LOCATION_LINE = 4
+LINE_FUNCTION_ID = 1
+FUNCTION_ID = 1
+FUNCTION_NAME = 2
+FUNCTION_FILENAME = 4
+FUNCTION_START_LINE = 5
+
+
+def _to_int64(value):
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _read_repeated_varints(data, wire_type, value):
+    """Return the values of a repeated varint field, packed or not."""
+    if wire_type == LENGTH_DELIMITED:
+        return list(iter_packed_varints(data, *value))
+    return [value]
+
+
+def _read_message(data, offsets, packed=()):
+    """Return a {field_number: [values]} dict of a small message.
+
+    Varints and the packed fields are decoded, other fields are left as
+    offsets into data.
+    """
+    fields = {}
+    for field_number, wire_type, value in iter_fields(data, *offsets):
+        if wire_type == VARINT or field_number in packed:
+            fields.setdefault(field_number, []).extend(_read_repeated_varints(data, wire_type, value))
+        else:
+            fields.setdefault(field_number, []).append(value)
+    return fields
+
+
+def _get_frames(location, functions, strings):
+    """Return the (function_name, libtype, file_name, line) frames of a location, caller first.
+
+    Locations without symbols (no line, or lines of unknown functions) get
+    a single frame named after their address, with the unknown libtype.
+    """
+    frames = []
+    lines = location.get(LOCATION_LINE, [])
+    for index, line in enumerate(lines):
+        function_id = line.get(LINE_FUNCTION_ID, [0])[0]
+        if function_id not in functions:
+            continue
+        name, file_name, start_line = functions[function_id]
+        # the last line is the function the address belongs to, the others were inlined into it
+        libtype = 'inlined' if index < len(lines) - 1 else ''
+        frames.append((strings[name], libtype, strings[file_name], start_line))
+    if not frames:
+        return [('0x%x' % location.get(LOCATION_ADDRESS, [0])[0], 'unknown', '', 0)]
+    return frames[::-1]
+
+
+def parse(data, **extra_options):
+    """Parse a pprof profile, gzip compressed or not, into a nflxprofile profile.
+
+    The string table, functions and locations are read first, then samples
+    are streamed from the buffer. Stacks are deduplicated into a trie of
+    parent-pointer nodes keyed by function, file and start line, and each
+    unique stack becomes one sample with its summed value in samples_value.
+
+    The sample_type extra option selects which pprof value is used (e.g.
+    "cpu" or "alloc_space"), by default the profile's default sample type or
+    its last one. Samples with a value of 0 or less are dropped, since
+    samples_value is unsigned.
+
+    With the tick_resolution extra option, samples are tick and run-length
+    encoded, see the ticks module. This is lossy: sample times are rounded
+    to ticks, and ValueError is raised if a delta between samples moves by
+    more than half a tick.
+    """
+    if bytes(data[:2]) == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    data = memoryview(data)
+
+    strings = []
+    sample_types = []
+    functions = {}
+    location_offsets = []
+    time_nanos = duration_nanos = 0
+    default_sample_type = None
+    for field_number, wire_type, value in iter_fields(data):
+        if field_number == PROFILE_STRING_TABLE:
+            strings.append(bytes(data[value[0]:value[1]]).decode('utf-8'))
+        elif field_number == PROFILE_SAMPLE_TYPE:
+            sample_types.append(_read_message(data, value).get(VALUE_TYPE_TYPE, [0])[0])
+        elif field_number == PROFILE_FUNCTION:
+            function = _read_message(data, value)
+            functions[function.get(FUNCTION_ID, [0])[0]] = (
+                function.get(FUNCTION_NAME, [0])[0],
+                function.get(FUNCTION_FILENAME, [0])[0],
+                function.get(FUNCTION_START_LINE, [0])[0])
+        elif field_number == PROFILE_LOCATION:
+            location_offsets.append(value)
+        elif field_number == PROFILE_TIME_NANOS:
+            time_nanos = _to_int64(value)
+        elif field_number == PROFILE_DURATION_NANOS:
+            duration_nanos = _to_int64(value)
+        elif field_number == PROFILE_DEFAULT_SAMPLE_TYPE:
+            default_sample_type = value
+
+    sample_type_names = [strings[sample_type] for sample_type in sample_types]
+    if 'sample_type' in extra_options:
+        value_index = sample_type_names.index(extra_options['sample_type'])
+    elif default_sample_type and strings[default_sample_type] in sample_type_names:
+        value_index = sample_type_names.index(strings[default_sample_type])
+    else:
+        value_index = len(sample_types) - 1
+
+    locations = {}
+    for offsets in location_offsets:
+        location = _read_message(data, offsets)
+        location[LOCATION_LINE] = [_read_message(data, line) for line in location.get(LOCATION_LINE, [])]
+        locations[location.get(LOCATION_ID, [0])[0]] = _get_frames(location, functions, strings)
+
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = time_nanos / 1e9
+    profile.end_time = (time_nanos + duration_nanos) / 1e9
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    profile.params['has_parent'] = 'true'
+    profile.params['has_node_file'] = 'true'
+    profile.params['hasValues'] = 'true'
+    if sample_type_names:
+        profile.params['sample_type'] = sample_type_names[value_index]
+
+    # (parent_id, function_name, libtype, file_name, line) -> node_id
+    trie = {}
+    # tuple of location ids, leaf first -> node_id
+    stack_nodes = {}
+    values = {}
+
+    def get_node(location_ids):
+        parent_id = 0
+        for location_id in reversed(location_ids):
+            for frame in locations.get(location_id, []):
+                key = (parent_id,) + frame
+                node_id = trie.get(key)
+                if node_id is None:
+                    node_id = len(trie) + 1
+                    trie[key] = node_id
+                    node = profile.nodes[node_id]
+                    node.function_name, node.libtype, file_name, line = frame
+                    node.hit_count = 0
+                    node.parent = parent_id
+                    if file_name:
+                        node.file.file_name = file_name
+                        node.file.line = line
+                parent_id = node_id
+        return parent_id
+
+    for field_number, _, offsets in iter_fields(data):
+        if field_number != PROFILE_SAMPLE:
+            continue
+        sample = _read_message(data, offsets, packed=(SAMPLE_LOCATION_ID, SAMPLE_VALUE))
+        sample_values = sample.get(SAMPLE_VALUE, [])
+        if value_index >= len(sample_values):
+            continue
+        value = _to_int64(sample_values[value_index])
+        if value <= 0:
+            continue
+        location_ids = tuple(sample.get(SAMPLE_LOCATION_ID, []))
+        node_id = stack_nodes.get(location_ids)
+        if node_id is None:
+            node_id = get_node(location_ids)
+            stack_nodes[location_ids] = node_id
+        values[node_id] = values.get(node_id, 0) + value
+
+    for node_id, value in values.items():
+        profile.samples.append(node_id)
+        profile.samples_value.append(value)
+        profile.time_deltas.append(0)
+        profile.nodes[node_id].hit_count += 1
+
+    tick_resolution = extra_options.get('tick_resolution', None)
+    if tick_resolution:
+        ticks.encode(profile, tick_resolution)
+
+    return profile
+
+
+class _StringTable:
+
+    def __init__(self):
+        self.strings = ['']
+        self.indexes = {'': 0}
+
+    def get_index(self, string):
+        index = self.indexes.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(string)
+            self.indexes[string] = index
+        return index
+
+
+def _encode_message(fields):
+    """Encode (field_number, value) pairs, ints as varints and bytes as length delimited."""
+    return b''.join(
+        encode_field(field_number, VARINT, value) if isinstance(value, int)
+        else encode_field(field_number, LENGTH_DELIMITED, value)
+        for field_number, value in fields)
+
+
+def _encode_packed(values):
+    return b''.join(encode_varint(value) for value in values)
+
+
+def dump(profile, f, pid_comm=None, **args):
+    """Write a nflxprofile profile to the binary file object f as a gzipped pprof.
+
+    Samples are aggregated per unique stack, honoring get_flame_graph's sample
+    filters, and encoded as they are resolved. Functions and locations (one
+    per distinct frame) and the shared string table are written after them.
+    The sample type is named by the sample_type and sample_unit options,
+    "samples" and "count" by default. Libtypes have no pprof equivalent and
+    are not written.
+    """
+    if 'hasValues' in profile.params and profile.params['hasValues'] == 'true':
+        args.setdefault('use_sample_value', True)
+    # pprof stacks are written leaf first from root first stacks
+    args['inverted'] = False
+
+    strings = _StringTable()
+    # (function_name, file_name, line) -> function id, which is also the location id
+    functions = {}
+
+    with gzip.GzipFile(fileobj=f, mode='wb') as stream:
+        sample_type = _encode_message([
+            (VALUE_TYPE_TYPE, strings.get_index(args.get('sample_type', 'samples'))),
+            (VALUE_TYPE_UNIT, strings.get_index(args.get('sample_unit', 'count'))),
+        ])
+        stream.write(encode_field(PROFILE_SAMPLE_TYPE, LENGTH_DELIMITED, sample_type))
+
+        aggregated_samples = _aggregate_samples(profile, **args)
+        get_stack = _get_stack_resolver(profile, pid_comm or {}, **args)
+        for node_id, value in aggregated_samples.items():
+            location_ids = []
+            for frame in get_stack(node_id):
+                key = (frame.function_name, frame.file.file_name, frame.file.line)
+                function_id = functions.get(key)
+                if function_id is None:
+                    function_id = len(functions) + 1
+                    functions[key] = function_id
+                location_ids.append(function_id)
+            sample = _encode_message([
+                (SAMPLE_LOCATION_ID, _encode_packed(reversed(location_ids))),
+                (SAMPLE_VALUE, _encode_packed([value])),
+            ])
+            stream.write(encode_field(PROFILE_SAMPLE, LENGTH_DELIMITED, sample))
+
+        for (function_name, file_name, line), function_id in functions.items():
+            line_message = _encode_message([(LINE_FUNCTION_ID, function_id)])
+            location = _encode_message([(LOCATION_ID, function_id), (LOCATION_LINE, line_message)])
+            stream.write(encode_field(PROFILE_LOCATION, LENGTH_DELIMITED, location))
+        for (function_name, file_name, line), function_id in functions.items():
+            function = _encode_message([
+                (FUNCTION_ID, function_id),
+                (FUNCTION_NAME, strings.get_index(function_name)),
+                (FUNCTION_FILENAME, strings.get_index(file_name)),
+                (FUNCTION_START_LINE, line),
+            ])
+            stream.write(encode_field(PROFILE_FUNCTION, LENGTH_DELIMITED, function))
+
+        for string in strings.strings:
+            stream.write(encode_field(PROFILE_STRING_TABLE, LENGTH_DELIMITED, string.encode('utf-8')))
+        time_nanos = int(round(profile.start_time * 1e9))
+        stream.write(encode_field(PROFILE_TIME_NANOS, VARINT, time_nanos))
+        stream.write(encode_field(PROFILE_DURATION_NANOS, VARINT,
+                                  int(round(profile.end_time * 1e9)) - time_nanos))
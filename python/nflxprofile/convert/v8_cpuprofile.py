@@ -1,6 +1,8 @@
 __ALL__ = ['parse']
 
-from nflxprofile import nflxprofile_pb2
+import math
+
+from nflxprofile import nflxprofile_pb2, ticks
 
 
 def get_cpuprofiles(v8_profile):
@@ -71,6 +73,10 @@ def get_idle_ids(nodes):
     return idle_ids
 
 
+def get_program_ids(nodes):
+    return [node['id'] for node in nodes if node['callFrame']['functionName'] == '(program)']
+
+
 def get_comm(v8_profile, index, **extra_options):
     comms = extra_options.get('comms', [])
     if len(comms) <= index:
@@ -85,17 +91,130 @@ def get_pid(v8_profile, index, **extra_options):
     return pids[index]
 
 
-def parse(data, **extra_options):
+def get_hit_counts(v8_profile, idle_ids):
+    """Count samples per node, using hitCount when there are no samples."""
+    hit_counts = {}
+    if 'samples' in v8_profile:
+        for node_id in v8_profile['samples']:
+            hit_counts[node_id] = hit_counts.get(node_id, 0) + 1
+    else:
+        for node in v8_profile['nodes']:
+            hit_counts[node['id']] = node.get('hitCount', 0)
+    for node_id in idle_ids:
+        hit_counts.pop(node_id, None)
+    return hit_counts
+
+
+def add_position_ticks(profile, node_id, v8_node):
+    """Add the positionTicks of v8_node to the line_ticks of node_id, merged by line.
+
+    A node shared by several V8 nodes (see dedupe_stacks) keeps one entry per line.
     """
+    node = profile.nodes[node_id]
+    lines = {line_ticks.line: line_ticks for line_ticks in node.line_ticks}
+    for position_tick in v8_node.get('positionTicks', []):
+        line_ticks = lines.get(position_tick['line'])
+        if line_ticks is None:
+            line_ticks = lines[position_tick['line']] = node.line_ticks.add()
+            line_ticks.line = position_tick['line']
+            line_ticks.ticks = 0
+        line_ticks.ticks += position_tick['ticks']
+
+
+def get_stack_key(comm, stack):
+    """Key identifying a stack by content, used to deduplicate nodes."""
+    return (comm,) + tuple(
+        (frame.function_name, frame.libtype, frame.file.file_name, frame.file.line, frame.file.column)
+        for frame in stack)
+
+
+def add_node(profile, node_id, comm, pid, stack, interned_stacks=None):
+    """Add a node for stack, returning its id.
+
+    With interned_stacks (a dict), identical stacks from any process share a
+    single node, and nodes don't record a pid.
+    """
+    if interned_stacks is not None:
+        key = get_stack_key(comm, stack)
+        if key in interned_stacks:
+            return interned_stacks[key]
+        interned_stacks[key] = node_id
+
+    profile.nodes[node_id].function_name = comm
+    if interned_stacks is None:
+        profile.nodes[node_id].pid = pid
+    profile.nodes[node_id].hit_count = 0
+    profile.nodes[node_id].stack.extend(stack)
+    return node_id
+
+
+def add_histograms(profile, samples, idle_samples, interval):
+    """Fill the per time bucket sample and idle histograms of profile.
+
+    Bucket i counts the samples between floor(start_time) + i * interval and
+    floor(start_time) + (i + 1) * interval seconds, so buckets line up with
+    the range_start and range_end options of get_flame_graph. (program)
+    samples are counted as busy.
+    """
+    origin = math.floor(profile.start_time)
+
+    def get_bucket(timestamp):
+        return max(int((timestamp / 1000000. - origin) // interval), 0)
+
+    timestamps = [timestamp for timestamp, _, _ in samples] + [timestamp for timestamp, _ in idle_samples]
+    size = max([get_bucket(profile.end_time * 1000000.)] + [get_bucket(timestamp) for timestamp in timestamps]) + 1
+    sample_histogram = [0] * size
+    idle_histogram = [0] * size
+    for timestamp, _, _ in samples:
+        sample_histogram[get_bucket(timestamp)] += 1
+    for timestamp, is_program in idle_samples:
+        if is_program:
+            sample_histogram[get_bucket(timestamp)] += 1
+        else:
+            idle_histogram[get_bucket(timestamp)] += 1
+
+    profile.histogram_interval = interval
+    profile.sample_histogram.extend(sample_histogram)
+    profile.idle_histogram.extend(idle_histogram)
+
+
+def parse(data, **extra_options):
+    """Parse one or more V8 CPU profiles into a nflxprofile profile.
+
+    Profiles without samples/timeDeltas (or all profiles, with the aggregated
+    extra option) are converted using each node's hitCount: nodes store
+    their sample count in hit_count and no per-sample arrays are written.
+    positionTicks are kept as per-line weights in the nodes' line_ticks.
+
+    With the dedupe_stacks extra option, identical stacks across all input
+    profiles share one node instead of one node per process. samples_pid
+    still records which process each sample came from.
+
+    (idle) and (program) samples are not converted to samples, they are
+    counted in idle_sample_count and program_sample_count. With the
+    histogram_interval extra option (in seconds), per time bucket counts of
+    busy and idle samples are kept too, see add_histograms.
+
+    With the tick_resolution extra option (in seconds, e.g. 0.000001 as V8
+    timestamps are in microseconds), samples are tick and run-length
+    encoded, see the ticks module. This is lossy: sample times are rounded
+    to ticks, and ValueError is raised if a delta between samples moves by
+    more than half a tick.
     """
     v8_profiles = get_cpuprofiles(data)
+    aggregated = extra_options.get('aggregated', False) or \
+        any('samples' not in v8_profile for v8_profile in v8_profiles)
+    interned_stacks = {} if extra_options.get('dedupe_stacks', False) else None
 
     profile = nflxprofile_pb2.Profile()
     profile.nodes[0].function_name = 'root'
     profile.nodes[0].hit_count = 0
     profile.params['has_node_stack'] = 'true'
-    profile.params['has_node_pid'] = 'true'
-    profile.params['has_samples_pid'] = 'true'
+    profile.params['has_node_pid'] = 'false' if interned_stacks is not None else 'true'
+    if aggregated:
+        profile.params['has_aggregated_samples'] = 'true'
+    else:
+        profile.params['has_samples_pid'] = 'true'
 
     root_ids = []
     base_ids = []
@@ -116,6 +235,9 @@ def parse(data, **extra_options):
         next_base_id += highest_id + 1
 
     samples = []
+    # (timestamp, is_program) of (idle) and (program) samples
+    idle_samples = []
+    idle_sample_count = program_sample_count = 0
 
     for v8_profile_idx, v8_profile in enumerate(v8_profiles):
         comm = get_comm(v8_profile, v8_profile_idx, **extra_options)
@@ -126,29 +248,45 @@ def parse(data, **extra_options):
         root_ids.append(base_id + 1)
         stacks = _generate_regular_stacks(v8_profile['nodes'], 1)
 
-        idle_ids = get_idle_ids(v8_profile['nodes'])
-
-        node_id_cache = []
+        idle_ids = set(get_idle_ids(v8_profile['nodes']))
+        program_ids = set(get_program_ids(v8_profile['nodes']))
+
+        if aggregated:
+            hit_counts = get_hit_counts(v8_profile, [])
+            for v8_node_id in idle_ids:
+                if v8_node_id in program_ids:
+                    program_sample_count += hit_counts.pop(v8_node_id, 0)
+                else:
+                    idle_sample_count += hit_counts.pop(v8_node_id, 0)
+            for v8_node in v8_profile['nodes']:
+                hit_count = hit_counts.get(v8_node['id'], 0)
+                if not hit_count:
+                    continue
+                node_id = add_node(profile, base_id + v8_node['id'], comm, pid, stacks[v8_node['id']],
+                                   interned_stacks)
+                profile.nodes[node_id].hit_count += hit_count
+                add_position_ticks(profile, node_id, v8_node)
+            continue
+
+        v8_nodes = {}
+        for v8_node in v8_profile['nodes']:
+            v8_nodes[v8_node['id']] = v8_node
+
+        # v8 node id -> nflxprofile node id
+        node_ids = {}
 
         last_timestamp = v8_profile['startTime']
-        for index, node_id in enumerate(v8_profile['samples']):
-            if node_id in idle_ids:
+        for index, v8_node_id in enumerate(v8_profile['samples']):
+            last_timestamp += v8_profile['timeDeltas'][index]
+            if v8_node_id in idle_ids:
+                idle_samples.append((last_timestamp, v8_node_id in program_ids))
                 continue
 
-            stack = None
-            if node_id not in node_id_cache:
-                stack = stacks[node_id]
-                node_id_cache.append(node_id)
-
-            node_id = base_id + node_id
-
-            if stack:
-                profile.nodes[node_id].function_name = comm
-                profile.nodes[node_id].pid = pid
-                profile.nodes[node_id].hit_count = 0
-                profile.nodes[node_id].stack.extend(stack)
-
-            last_timestamp += v8_profile['timeDeltas'][index]
+            node_id = node_ids.get(v8_node_id)
+            if node_id is None:
+                node_id = add_node(profile, base_id + v8_node_id, comm, pid, stacks[v8_node_id], interned_stacks)
+                add_position_ticks(profile, node_id, v8_nodes[v8_node_id])
+                node_ids[v8_node_id] = node_id
 
             samples.append((last_timestamp, node_id, pid))
             profile.nodes[node_id].hit_count += 1
@@ -164,4 +302,20 @@ def parse(data, **extra_options):
         profile.time_deltas.append(delta)
         last_timestamp = timestamp
 
+    for _, is_program in idle_samples:
+        if is_program:
+            program_sample_count += 1
+        else:
+            idle_sample_count += 1
+    profile.idle_sample_count = idle_sample_count
+    profile.program_sample_count = program_sample_count
+
+    histogram_interval = extra_options.get('histogram_interval', None)
+    if histogram_interval and not aggregated:
+        add_histograms(profile, samples, idle_samples, histogram_interval)
+
+    tick_resolution = extra_options.get('tick_resolution', None)
+    if tick_resolution and not aggregated:
+        ticks.encode(profile, tick_resolution)
+
     return profile
@@ -0,0 +1,220 @@
+"""Flame charts: which stack ran when, per process and thread."""
+
+__ALL__ = ['get_flame_chart', 'get_trace_events']
+
+import math
+
+from nflxprofile import ticks
+from nflxprofile.flamegraph import StackProcessor, _get_sample_filters, _get_sample_mask, _get_samples_value
+from nflxprofile.flamegraph import _get_stack_resolver, _has_aggregated_samples
+from nflxprofile.series import _get_sample_order
+
+
+def _has_param(profile, param):
+    return param in profile.params and profile.params[param] == 'true'
+
+
+def _get_lane_column(profile, column, samples_param, nodes_param, node_field):
+    """Return a function returning the pid or tid of a sample, from its column or its node."""
+    if _has_param(profile, samples_param) and len(getattr(profile, column)) == len(profile.samples):
+        values = getattr(profile, column)
+        return lambda index, node_id: values[index]
+    if _has_param(profile, nodes_param):
+        nodes = profile.nodes
+        return lambda index, node_id: getattr(nodes[node_id], node_field)
+    return lambda index, node_id: 0
+
+
+class _Lane:
+    """Open spans of one pid/tid while samples are walked."""
+
+    def __init__(self, pid, tid):
+        self.pid = pid
+        self.tid = tid
+        # [frame_id, depth, start, end, value], in the order they were opened
+        self.spans = []
+        # open spans, root first
+        self.stack = []
+        self.first_time = None
+        self.last_time = None
+        self.sample_count = 0
+
+    def close(self, depth, end):
+        """Close the open spans at depth and below."""
+        for span in self.stack[depth:]:
+            span[3] = end
+        del self.stack[depth:]
+
+    def add(self, frame_ids, time, value):
+        """Extend the open spans shared with frame_ids and open the others."""
+        stack = self.stack
+        common = 0
+        for span, frame_id in zip(stack, frame_ids):
+            if span[0] != frame_id:
+                break
+            common += 1
+        self.close(common, time)
+        for span in stack:
+            span[4] += value
+        for depth in range(common, len(frame_ids)):
+            span = [frame_ids[depth], depth, time, time, value]
+            self.spans.append(span)
+            stack.append(span)
+        if self.first_time is None:
+            self.first_time = time
+        self.last_time = time
+        self.sample_count += 1
+
+
+def get_flame_chart(profile, pid_comm, **args):
+    """Generate a flame chart from a nflxprofile profile.
+
+    Samples are walked once in time order. Each pid/tid pair is a lane, and a
+    frame stays one span as long as consecutive samples of the lane share
+    the stack prefix leading to it. Returns a dict with:
+
+    - frames: the distinct [name, libtype, file] frames.
+    - lanes: one {'pid', 'tid', 'spans'} dict per lane, where spans are
+      [frame index, depth, start, end, value] lists ordered by start, then
+      depth. Times are in seconds relative to the start of the profile (as
+      get_flame_graph ranges), value is the sample count or the sum of
+      samples_value with use_sample_value.
+
+    A span ends with the first sample of its lane not sharing its prefix. The
+    last sample of a lane lasts the interval option (in seconds), by default
+    the mean interval between the lane's samples. With the max_gap option,
+    spans are also ended at the last sample plus interval when the lane has
+    no sample for more than max_gap seconds. Other get_flame_graph options
+    (filters, stack processors, ignore_libtype) apply.
+
+    Stack processors only shape the frames of spans: stacks are processed
+    once per node id, with a value of 0, and never inserted. Processor
+    extras (process_extras, like NodeJsStackProcessor's argumentAdaptor or
+    collapse_recursion counts) are not kept, and stateful should_skip_frame
+    implementations see each node once rather than once per sample.
+    """
+    if _has_aggregated_samples(profile):
+        raise ValueError("Profile has no per-sample times, can't generate a flame chart")
+    if ticks.has_tick_runs(profile):
+        profile = ticks.expand(profile)
+
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+    ignore_libtype = args.get("ignore_libtype", False)
+    weighted = args.get("use_sample_value", False) or args.get("weighted", False)
+    interval = args.get("interval", None)
+    max_gap = args.get("max_gap", None)
+    # stacks are always root first here
+    args = dict(args, inverted=False)
+
+    sample_filters = _get_sample_filters(profile, **args)
+    mask, other_filters = _get_sample_mask(sample_filters)
+    samples_value = _get_samples_value(profile) if weighted else None
+    samples = profile.samples
+    times, order = _get_sample_order(profile)
+    origin = math.floor(profile.start_time)
+
+    get_stack = _get_stack_resolver(profile, pid_comm, **args)
+    get_pid = _get_lane_column(profile, 'samples_pid', 'has_samples_pid', 'has_node_pid', 'pid')
+    get_tid = _get_lane_column(profile, 'samples_tid', 'has_samples_tid', 'has_node_tid', 'tid')
+    stack_processor = stack_processor_class(None, profile, **args)
+
+    frames = []
+    frame_ids = {}
+    # node id -> tuple of frame ids, stacks are processed once per node id and extras are dropped
+    stacks = {}
+
+    def get_frame_ids(node_id):
+        stack = stacks.get(node_id)
+        if stack is None:
+            stack = []
+            for frame, _ in stack_processor.process_stack(get_stack(node_id), 0):
+                filename = frame.file.file_name or ""
+                if filename:
+                    filename = "%s:%d" % (filename, frame.file.line or 0)
+                key = (frame.function_name.strip(), "" if ignore_libtype else frame.libtype, filename)
+                frame_id = frame_ids.get(key)
+                if frame_id is None:
+                    frame_id = len(frames)
+                    frames.append(list(key))
+                    frame_ids[key] = frame_id
+                stack.append(frame_id)
+            stack = tuple(stack)
+            stacks[node_id] = stack
+        return stack
+
+    lanes = {}
+    # spans ended by a gap, closed once the lane's interval is known
+    gap_ends = []
+    for index in order:
+        if mask is not None and not mask[index]:
+            continue
+        node_id = samples[index]
+        time = times[index]
+        if any(sample_filter.should_skip(node_id, index, time) for sample_filter in other_filters):
+            continue
+        time -= origin
+        lane_key = (get_pid(index, node_id), get_tid(index, node_id))
+        lane = lanes.get(lane_key)
+        if lane is None:
+            lane = _Lane(*lane_key)
+            lanes[lane_key] = lane
+        elif max_gap is not None and time - lane.last_time > max_gap:
+            gap_ends.append((lane, lane.stack, lane.last_time))
+            lane.stack = []
+        value = 1 if samples_value is None else samples_value[index]
+        lane.add(get_frame_ids(node_id), time, value)
+
+    def get_interval(lane):
+        if interval is not None:
+            return interval
+        if lane.sample_count < 2:
+            return 0
+        return (lane.last_time - lane.first_time) / (lane.sample_count - 1)
+
+    for lane, stack, last_time in gap_ends:
+        end = last_time + get_interval(lane)
+        for span in stack:
+            span[3] = end
+    result_lanes = []
+    for lane in lanes.values():
+        lane.close(0, lane.last_time + get_interval(lane))
+        result_lanes.append({'pid': lane.pid, 'tid': lane.tid, 'spans': lane.spans})
+    return {'frames': frames, 'lanes': result_lanes}
+
+
+def get_trace_events(flame_chart, pid_comm=None):
+    """Convert a flame chart into the Chrome trace event format.
+
+    Each span becomes a complete ("X") event, with the libtype as category
+    and the sample value in args. Process names are taken from pid_comm, a
+    {pid: name} dict, when given. The result can be written with
+    tree_json.write_tree and loaded into chrome://tracing or Perfetto.
+    """
+    events = []
+    frames = flame_chart['frames']
+    pid_comm = pid_comm or {}
+    pids = set()
+    for lane in flame_chart['lanes']:
+        pid = lane['pid']
+        tid = lane['tid']
+        if pid in pid_comm and pid not in pids:
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': pid_comm[pid]}})
+        pids.add(pid)
+        for frame_id, _, start, end, value in lane['spans']:
+            name, libtype, filename = frames[frame_id]
+            event_args = {'value': value}
+            if filename:
+                event_args['file'] = filename
+            events.append({
+                'name': name,
+                'cat': libtype or 'default',
+                'ph': 'X',
+                # trace event times are in microseconds
+                'ts': start * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': event_args,
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
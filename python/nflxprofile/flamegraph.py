@@ -4,13 +4,26 @@ __ALL__ = ['get_flame_graph',
            'StackProcessor',
            'JavaStackProcessor',
            'NodeJsStackProcessor',
-           'NodeJsPackageStackProcessor']
-
+           'NodeJsPackageStackProcessor',
+           'RuleStackProcessor',
+           'PackageCache',
+           'FrameIndex',
+           'get_frame_index',
+           'get_cpu_utilization']
+
+import array
+import bisect
+import collections
+import itertools
+import json
 import math
+import operator
 import os
 import pathlib
+import re
+import weakref
 
-from nflxprofile import nflxprofile_pb2
+from nflxprofile import nflxprofile_pb2, ticks
 
 
 def _get_child(node, frame, ignore_libtype):
@@ -78,10 +91,100 @@ def _generate_stacks(nflxprofile_nodes, root_node_id, package_name=False):
     return _generate_regular_stacks(nflxprofile_nodes, root_node_id)
 
 
-def _get_stack(nflxprofile_nodes, node_id, has_node_stack=False, pid_comm=None, **args):
-    """Get node stack using parent pointers or predefined stack."""
+class _CollapsedStack(list):
+    """Stack with collapse_recursion applied.
+
+    recursion maps the index of a frame to the number of directly recursive
+    frames merged into it.
+    """
+
+    def __init__(self, frames, recursion):
+        super().__init__(frames)
+        self.recursion = recursion
+
+
+def _limit_stack(stack, max_depth=None, collapse_recursion=False):
+    """Apply the max_depth and collapse_recursion options to a stack, in display order."""
+    if collapse_recursion:
+        frames = []
+        recursion = {}
+        previous_key = None
+        for frame in stack:
+            key = (frame.function_name, frame.libtype, frame.file.file_name)
+            if key == previous_key:
+                recursion[len(frames) - 1] = recursion.get(len(frames) - 1, 0) + 1
+                continue
+            if max_depth is not None and len(frames) == max_depth:
+                break
+            frames.append(frame)
+            previous_key = key
+        return _CollapsedStack(frames, recursion)
+    if max_depth is not None:
+        return stack[:max_depth]
+    return stack
+
+
+def _get_node_frame(nflxprofile_node, has_node_file=False):
+    stack_frame = nflxprofile_pb2.StackFrame()
+    stack_frame.function_name = nflxprofile_node.function_name
+    stack_frame.libtype = nflxprofile_node.libtype
+    if has_node_file and nflxprofile_node.HasField('file'):
+        stack_frame.file.CopyFrom(nflxprofile_node.file)
+    return stack_frame
+
+
+def _get_limited_parent_stack(nflxprofile_nodes, node_id, inverted, max_depth, collapse_recursion,
+                              has_node_file=False):
+    """Get node stack using parent pointers, applying max_depth and collapse_recursion while walking.
+
+    Frames are only built for the nodes kept. Inverted stacks keep the leaf
+    side, so the walk stops after max_depth frames. Other stacks keep the
+    root side: every parent is walked, but only the last max_depth are kept.
+    """
+    # [node_id, repeats] pairs from the leaf, bounded to the root side ones
+    entries = collections.deque(maxlen=None if inverted else max_depth)
+    previous_key = None
+    while True:
+        nflxprofile_node = nflxprofile_nodes[node_id]
+        key = None
+        if collapse_recursion:
+            key = (nflxprofile_node.function_name, nflxprofile_node.libtype,
+                   nflxprofile_node.file.file_name if has_node_file else '')
+        if key is not None and key == previous_key:
+            entries[-1][1] += 1
+        else:
+            if inverted and max_depth is not None and len(entries) == max_depth:
+                break
+            entries.append([node_id, 0])
+            previous_key = key
+        if not nflxprofile_node.parent:
+            break
+        node_id = nflxprofile_node.parent
+
+    if not inverted:
+        entries.reverse()
+    stack = []
+    recursion = {}
+    for index, (node_id, repeats) in enumerate(entries):
+        stack.append(_get_node_frame(nflxprofile_nodes[node_id], has_node_file))
+        if repeats:
+            recursion[index] = repeats
+    if collapse_recursion:
+        return _CollapsedStack(stack, recursion)
+    return stack
+
+
+def _get_stack(nflxprofile_nodes, node_id, has_node_stack=False, pid_comm=None, has_node_file=False, **args):
+    """Get node stack using parent pointers or predefined stack.
+
+    The max_depth and collapse_recursion options are applied as the stack is
+    resolved, see get_flame_graph. With has_node_file, parent pointer frames
+    get the file of their node.
+    """
     inverted = args.get("inverted", False)
     package_name = args.get("package_name", False)
+    max_depth = args.get("max_depth", None)
+    collapse_recursion = args.get("collapse_recursion", False)
 
     stack = []
 
@@ -100,8 +203,8 @@ def _get_stack(nflxprofile_nodes, node_id, has_node_stack=False, pid_comm=None,
             stack_frame.libtype = nflxprofile_nodes[node_id].libtype
             stack.append(stack_frame)
         if inverted:
-            return stack[::-1]
-        return stack
+            stack = stack[::-1]
+        return _limit_stack(stack, max_depth, collapse_recursion)
 
     # has node stack calculated, returning that
     if has_node_stack:
@@ -114,16 +217,21 @@ def _get_stack(nflxprofile_nodes, node_id, has_node_stack=False, pid_comm=None,
         stack_frame.libtype = nflxprofile_nodes[node_id].libtype
         stack = [stack_frame] + list(nflxprofile_nodes[node_id].stack)
         if inverted:
-            return stack[::-1]
-        return stack
+            stack = stack[::-1]
+        return _limit_stack(stack, max_depth, collapse_recursion)
 
     # need to use parent id
+    if max_depth is not None or collapse_recursion:
+        return _get_limited_parent_stack(nflxprofile_nodes, node_id, inverted, max_depth, collapse_recursion,
+                                         has_node_file)
     nflxprofile_node_id = node_id
     while True:
         nflxprofile_node = nflxprofile_nodes[nflxprofile_node_id]
         stack_frame = nflxprofile_pb2.StackFrame()
         stack_frame.function_name = nflxprofile_node.function_name
         stack_frame.libtype = nflxprofile_node.libtype
+        if has_node_file and nflxprofile_node.HasField('file'):
+            stack_frame.file.CopyFrom(nflxprofile_node.file)
         if inverted:
             stack.append(stack_frame)
         else:
@@ -143,6 +251,8 @@ class FrameExtras:
         self.javascript = False
         self.real_name = ""
         self.optimized = None
+        self.recursion = 0
+        self.argument_adaptor = None
 
     def __repr__(self):
         return ("FrameExtras(v8_jit=%s, javascript=%s, real_name=%s, optimized=%s)"
@@ -184,18 +294,25 @@ class StackProcessor:
                 extras['file'] = frame.file.file_name
                 if extras['file']:
                     extras['file'] = ('%s:%d' % (extras['file'], frame.file.line))
+        if frame_extras.recursion:
+            extras['recursion'] = max(extras.get('recursion', 0), frame_extras.recursion)
         if bool(extras):
             child['extras'] = extras
 
-    def process(self, stack, value):
-        """Processes a stack trace.
+    def process_stack(self, stack, value):
+        """Yield the processed (frame, frame_extras) pairs of a stack.
 
-        You probably want to avoid overriding this method. Override other
-        methods to customize behavior instead.
+        Skipped frames and frames removed by middle out merging are not
+        yielded. Frames are produced lazily, so stateful processors see
+        should_skip_frame and process_extras calls interleaved in stack order.
         """
         middle_out_filter = True
+        # directly recursive frames merged into each frame, by index, with collapse_recursion
+        recursion = getattr(stack, 'recursion', None)
         for i, frame in enumerate(stack):
             frame, frame_extras = self.process_frame(frame)
+            if recursion and i in recursion:
+                frame_extras.recursion = recursion[i]
             if self.should_skip_frame(frame, frame_extras, value):
                 continue
 
@@ -216,6 +333,15 @@ class StackProcessor:
                     # skip frame
                     continue
 
+            yield frame, frame_extras
+
+    def insert(self, frames, value, count=None):
+        """Insert processed (frame, frame_extras) pairs into the tree.
+
+        When count is given, it is added to the node's 'samples' next to its
+        value, for weighted flame graphs.
+        """
+        for frame, frame_extras in frames:
             child = _get_child(self.current_node, frame, self.ignore_libtype)
             if child is None:
                 child = {
@@ -230,9 +356,19 @@ class StackProcessor:
         # if the whole stack was skipped, current_node is still root
         # value goes to root
         self.current_node['value'] = self.current_node['value'] + value
+        if count is not None:
+            self.current_node['samples'] = self.current_node.get('samples', 0) + count
         # set current node back to root
         self.current_node = self.root_node
 
+    def process(self, stack, value, count=None):
+        """Processes a stack trace.
+
+        You probably want to avoid overriding this method. Override other
+        methods to customize behavior instead.
+        """
+        self.insert(self.process_stack(stack, value), value, count)
+
 
 class JavaStackProcessor(StackProcessor):
     """Java stack processor.
@@ -276,49 +412,132 @@ class JavaStackProcessor(StackProcessor):
         return processed_frame, FrameExtras()
 
 
-class NodeJsPackageStackProcessor(StackProcessor):
+def _classify_package(name, libtype):
+    """Return the package (or pseudo package) a Node.js frame belongs to."""
+    package = None
+    if name.startswith("LazyCompile:") or name.startswith("InterpretedFunction:"):
+        name = name[name.index(":") + 1:]
+        if name and name[0] == '*':
+            name = name[1:]
+
+        if " " in name:
+            package = name[name.index(" ") + 1:]
+
+    if package is not None:
+        if ":" in package:
+            package = package.rsplit(":", 1)[0]
+        if "node_modules" in package:
+            package = pathlib.Path(package.rsplit("node_modules", 1)[1])
+            if package.parts[1].startswith("@"):
+                package = os.path.join(*package.parts[1:3])
+            else:
+                package = package.parts[1]
+        elif package.startswith("/") or "[eval" in package:
+            return "(app code)"
+        else:
+            package = "(node api)"
+    else:
+        if libtype == 'kernel':
+            return '(kernel)'
+        else:
+            return '(native)'
 
-    def __init__(self, root, profile, **args):
-        """Constructor."""
-        super().__init__(root, profile, **args)
-        self.current_package = None
-        self.packages_cache = {}
+    return package
 
-    def get_package(self, frame):
-        name = frame.function_name
-        if name in self.packages_cache:
-            return self.packages_cache[name]
 
-        package = None
-        if name.startswith("LazyCompile:") or name.startswith("InterpretedFunction:"):
-            name = name[name.index(":") + 1:]
-            if name and name[0] == '*':
-                name = name[1:]
+PACKAGE_CACHE_SIZE = 65536
 
-            if " " in name:
-                package = name[name.index(" ") + 1:]
 
-        if package is not None:
-            if ":" in package:
-                package = package.rsplit(":", 1)[0]
-            if "node_modules" in package:
-                package = pathlib.Path(package.rsplit("node_modules", 1)[1])
-                if package.parts[1].startswith("@"):
-                    package = os.path.join(*package.parts[1:3])
-                else:
-                    package = package.parts[1]
-            elif package.startswith("/") or "[eval" in package:
-                return "(app code)"
-            else:
-                package = "(node api)"
-        else:
-            if frame.libtype == 'kernel':
-                return '(kernel)'
-            else:
-                return '(native)'
+class PackageCache:
+    """Bounded LRU cache of package classifications, keyed by (function_name, libtype).
 
+    Counts hits and misses, and can be saved to and loaded from a JSON file
+    so classifications are reused between runs.
+    """
+
+    def __init__(self, max_size=PACKAGE_CACHE_SIZE):
+        """Constructor."""
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_package(self, function_name, libtype):
+        """Return the package of a frame, classifying it on a cache miss."""
+        key = (function_name, libtype)
+        package = self.entries.get(key)
+        if package is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return package
+        self.misses += 1
+        package = _classify_package(function_name, libtype)
+        self.entries[key] = package
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
         return package
 
+    @property
+    def hit_rate(self):
+        """Fraction of lookups served from the cache, None before any lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def get_stats(self):
+        """Return the cache size, hits, misses and hit rate."""
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+    def clear(self):
+        """Drop every entry and reset the metrics."""
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def load(self, filename):
+        """Add the entries saved in filename, ignoring a missing file."""
+        try:
+            with open(filename, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        for function_name, libtype, package in entries[-self.max_size:]:
+            self.entries[(function_name, libtype)] = package
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def save(self, filename):
+        """Write the entries to filename, least recently used first."""
+        temporary_filename = filename + '.tmp'
+        with open(temporary_filename, 'w') as f:
+            json.dump([[function_name, libtype, package]
+                       for (function_name, libtype), package in self.entries.items()], f)
+        os.replace(temporary_filename, filename)
+
+
+# shared by every NodeJsPackageStackProcessor unless one is passed with package_cache
+package_cache = PackageCache()
+
+
+class NodeJsPackageStackProcessor(StackProcessor):
+
+    def __init__(self, root, profile, **args):
+        """Constructor.
+
+        Classifications are cached in args['package_cache'], a PackageCache,
+        or in the module wide package_cache shared across instances.
+        """
+        super().__init__(root, profile, **args)
+        self.current_package = None
+        self.packages_cache = args.get("package_cache", None) or package_cache
+
+    def get_package(self, frame):
+        return self.packages_cache.get_package(frame.function_name, frame.libtype)
+
     def should_skip(self, name):
         # We'll skip for known, non-expensive builtins which can appear between
         # JS frames. Showing those would fragment the FlameGraph unecessarily.
@@ -335,30 +554,158 @@ class NodeJsPackageStackProcessor(StackProcessor):
             return True
         return False
 
-    def process(self, stack, value):
+    def process_stack(self, stack, value):
+        """Yield the processed frames of the packages of the stack.
+
+        With collapse_recursion, the recursive frames merged into the frames
+        of a package are carried by the package frame.
+        """
         # We always start with native
         current_frame = nflxprofile_pb2.StackFrame()
         current_frame.function_name = "(native)"
         current_frame.libtype = ""
         processed_stack = []
         current_stack = []
-        for frame in stack:
+        recursion = getattr(stack, 'recursion', None)
+        processed_recursion = {}
+        for i, frame in enumerate(stack):
             package = self.get_package(frame)
 
             if package == current_frame.function_name or self.should_skip(frame.function_name):
                 current_stack.append(frame)
-                continue
+            else:
+                processed_stack.append(current_frame)
 
-            processed_stack.append(current_frame)
+                current_frame = nflxprofile_pb2.StackFrame()
+                current_frame.function_name = package
+                current_frame.libtype = ""
+                current_stack = []
 
-            current_frame = nflxprofile_pb2.StackFrame()
-            current_frame.function_name = package
-            current_frame.libtype = ""
-            current_stack = []
+            if recursion and i in recursion:
+                # current_frame is appended next, at this index
+                index = len(processed_stack)
+                processed_recursion[index] = processed_recursion.get(index, 0) + recursion[i]
 
         processed_stack.append(current_frame)
 
-        return super().process(processed_stack, value)
+        if recursion is not None:
+            processed_stack = _CollapsedStack(processed_stack, processed_recursion)
+        return super().process_stack(processed_stack, value)
+
+
+RULE_ACTIONS = ['skip', 'rename', 'collapse', 'group']
+
+# global inline flags at the start of a rule pattern, like (?i)
+_RULE_INLINE_FLAGS = re.compile(r'\(\?([aimsux]+)\)')
+
+
+class RuleStackProcessor(StackProcessor):
+    """Stack processor configured with declarative frame rules.
+
+    args['rules'] is a list of {'action', 'pattern', 'replacement'} dicts,
+    applied to function names:
+
+    - skip: the frame is removed.
+    - rename: the matched part of the name is replaced by replacement.
+    - collapse: consecutive frames with the same name are merged.
+    - group: the frame is renamed to replacement (expanded from the match,
+      so it can use groups like \\1), and consecutive frames of the same
+      group are merged.
+
+    The first rule whose pattern matches (re.search) applies. Patterns are
+    compiled into a single regex, with one lookahead branch per rule, tried
+    in order: this saves a Python level loop over the rules, but each branch
+    still scans the name, so matching a name is O(rules * name length) in
+    the worst case. Results are memoized per function name. Patterns can't
+    use backreferences, and inline flags like (?i) are only allowed at the
+    start of a pattern, where they are scoped to the rule. If the combined
+    regex can't be compiled, e.g. when two rules use the same group name,
+    the rules are tried one by one instead.
+    """
+
+    def __init__(self, root, profile, **args):
+        """Constructor."""
+        super().__init__(root, profile, **args)
+        self.rules = []
+        branches = []
+        for index, rule in enumerate(args.get("rules", [])):
+            action = rule.get('action')
+            if action not in RULE_ACTIONS:
+                raise ValueError("Unknown rule action %s, expected one of %s" % (action, RULE_ACTIONS))
+            pattern = re.compile(rule['pattern'])
+            self.rules.append((action, pattern, rule.get('replacement', '')))
+            branches.append('(?=(?s:.*?)(?P<rule%d>%s))' % (index, self._scope_flags(rule['pattern'])))
+        try:
+            self.matcher = re.compile('|'.join(branches)) if branches else None
+        except re.error:
+            # each pattern compiles on its own, group names collide across rules
+            self.matcher = None
+        # function name -> (rule index or None, processed name)
+        self.results = {}
+
+    @staticmethod
+    def _scope_flags(pattern):
+        """Turn the global inline flags of pattern into flags scoped to it, (?i)a into (?i:a)."""
+        match = _RULE_INLINE_FLAGS.match(pattern)
+        if match is not None:
+            pattern = '(?%s:%s)' % (match.group(1), pattern[match.end():])
+        if re.compile(pattern).flags & ~re.UNICODE:
+            raise ValueError("Rule pattern %s has inline flags which are not at its start" % pattern)
+        return pattern
+
+    def match_frame(self, function_name):
+        """Return the index of the rule applying to function_name (or None) and the processed name."""
+        result = self.results.get(function_name)
+        if result is not None:
+            return result
+        result = (None, function_name)
+        if self.matcher is not None:
+            match = self.matcher.match(function_name)
+            index = int(match.lastgroup[len('rule'):]) if match is not None else None
+        else:
+            index = next((i for i, (_, pattern, _) in enumerate(self.rules) if pattern.search(function_name)), None)
+        if index is not None:
+            action, pattern, replacement = self.rules[index]
+            if action == 'rename':
+                result = (index, pattern.sub(replacement, function_name, count=1))
+            elif action == 'group':
+                result = (index, pattern.search(function_name).expand(replacement))
+            else:
+                result = (index, function_name)
+        self.results[function_name] = result
+        return result
+
+    def process_stack(self, stack, value):
+        """Yield the processed frames of the stack, with the rules applied.
+
+        With collapse_recursion, the recursive frames merged into a skipped
+        frame are dropped with it, and those merged into collapsed or
+        grouped frames are added to the frame they are merged into.
+        """
+        processed_stack = []
+        previous = None
+        recursion = getattr(stack, 'recursion', None)
+        processed_recursion = {}
+        for i, frame in enumerate(stack):
+            index, function_name = self.match_frame(frame.function_name)
+            action = self.rules[index][0] if index is not None else None
+            if action == 'skip':
+                continue
+            if not (action in ('collapse', 'group') and previous == (index, function_name)):
+                previous = (index, function_name)
+                if function_name != frame.function_name:
+                    renamed_frame = nflxprofile_pb2.StackFrame()
+                    renamed_frame.CopyFrom(frame)
+                    renamed_frame.function_name = function_name
+                    frame = renamed_frame
+                processed_stack.append(frame)
+            if recursion and i in recursion:
+                last = len(processed_stack) - 1
+                processed_recursion[last] = processed_recursion.get(last, 0) + recursion[i]
+
+        if recursion is not None:
+            processed_stack = _CollapsedStack(processed_stack, processed_recursion)
+        return super().process_stack(processed_stack, value)
 
 
 class NodeJsStackProcessor(StackProcessor):
@@ -389,6 +736,19 @@ class NodeJsStackProcessor(StackProcessor):
             return True
         return False
 
+    def process_stack(self, stack, value):
+        """Yield the processed frames, with skipped ArgumentsAdaptorTrampoline counts in their extras.
+
+        The count is carried by the extras of the frame following the
+        trampoline, so it is kept when frames are inserted by another
+        processor or out of order.
+        """
+        self.argument_adaptor = None
+        for frame, frame_extras in super().process_stack(stack, value):
+            frame_extras.argument_adaptor = self.argument_adaptor
+            self.argument_adaptor = None
+            yield frame, frame_extras
+
     def process_extras(self, child, frame, frame_extras, value):
         """Add Node.js specific extras.
 
@@ -401,9 +761,8 @@ class NodeJsStackProcessor(StackProcessor):
         extras['v8_jit'] = frame_extras.v8_jit
         extras['optimized'] = extras['optimized'] + (frame_extras.optimized and value or 0)
         extras['realName'] = frame_extras.real_name
-        if self.argument_adaptor:
-            extras['argumentAdaptor'] = extras.get('argumentAdaptor', 0) + self.argument_adaptor
-            self.argument_adaptor = None
+        if frame_extras.argument_adaptor:
+            extras['argumentAdaptor'] = extras.get('argumentAdaptor', 0) + frame_extras.argument_adaptor
         child['extras'] = extras
         super().process_extras(child, frame, frame_extras, value)
 
@@ -465,10 +824,56 @@ class NodeJsStackProcessor(StackProcessor):
         return processed_frame, frame_extras
 
 
+def _get_selection_predicate(selection):
+    """Return a predicate checking if a value is in a CPU/PID/TID selection.
+
+    A selection is an int, a range, an iterable of ints, or a string such as
+    "0-3,8". Strings starting with "!" select everything but the given values.
+    """
+    negate = False
+    values = set()
+    ranges = []
+    if isinstance(selection, str):
+        selection = selection.strip()
+        if selection.startswith('!'):
+            negate = True
+            selection = selection[1:]
+        for part in selection.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-', 1)
+                ranges.append(range(int(start), int(end) + 1))
+            else:
+                values.add(int(part))
+    elif isinstance(selection, int):
+        values.add(selection)
+    elif isinstance(selection, range):
+        ranges.append(selection)
+    else:
+        values.update(selection)
+
+    def predicate(value):
+        return (value in values or any(value in value_range for value_range in ranges)) != negate
+    return predicate
+
+
+def _build_mask(column, keep_value):
+    """Build a bytearray with 1 for each entry of column to keep.
+
+    keep_value is evaluated once per distinct value, then looked up per entry.
+    """
+    lookup = {value: 1 if keep_value(value) else 0 for value in set(column)}
+    return bytearray(map(lookup.__getitem__, column))
+
+
 class SampleFilter:
     """Interface for sample filters.
 
     Extend this class and override should_skip to create a new filter.
+    Filters that don't depend on time can also override get_mask, so they are
+    evaluated once up front instead of once per sample.
     """
 
     # pylint: disable=unused-argument
@@ -481,6 +886,11 @@ class SampleFilter:
         """Returns false if a given sample shouldn't be processed."""
         return False
 
+    # pylint: disable=no-self-use
+    def get_mask(self):
+        """Returns a bytearray with 1 for each sample to keep, or None."""
+        return None
+
 
 class RangeSampleFilter(SampleFilter):
     """Filter all samples within a given range."""
@@ -501,96 +911,283 @@ class RangeSampleFilter(SampleFilter):
             return False
         return not self.range_start <= current_time < self.range_end
 
+    def get_mask(self):
+        """Returns a mask of the samples in range.
 
-class CPUSampleFilter(SampleFilter):
-    """Filter all samples for a given CPU."""
+        Sample times are accumulated in bulk and, since they are sorted, the
+        range bounds are found by bisection.
+        """
+        if self.range_start is None or self.range_end is None:
+            return None
+        time_deltas = self.profile.time_deltas
+        if time_deltas and min(time_deltas) < 0:
+            # samples out of order, fall back to should_skip
+            return None
+        # times[0] is the start time, times[i] the time of the sample i - 1
+        times = array.array('d', itertools.accumulate(itertools.chain([self.profile.start_time], time_deltas)))
+        first = bisect.bisect_left(times, self.range_start, 1)
+        last = max(bisect.bisect_left(times, self.range_end, 1), first)
+        mask = bytearray(len(time_deltas))
+        mask[first - 1:last - 1] = b'\x01' * (last - first)
+        return mask
+
+
+class ColumnSampleFilter(SampleFilter):
+    """Filter samples on a per-sample column (samples_cpu, samples_pid, ...).
+
+    The selection accepts anything _get_selection_predicate does: a single
+    value, a set or range of values, or a string like "0-3,8" or "!0-3".
+    """
 
-    def __init__(self, profile, cpu=None, **args):
-        """CPU filter constructor."""
+    column = None
+    param = None
+
+    def __init__(self, profile, selection=None):
+        """Column filter constructor."""
         super().__init__(profile)
-        self.cpu = cpu
-        self.samples_cpu = None
+        self.values = None
+        self.mask = None
 
-        if 'has_samples_cpu' not in profile.params:
+        if selection is None:
+            return
+        if self.param not in profile.params:
             return
-        if profile.params['has_samples_cpu'] != 'true':
+        if profile.params[self.param] != 'true':
             return
 
-        self.samples_cpu = profile.samples_cpu
+        self.values = getattr(profile, self.column)
+        self.mask = _build_mask(self.values, _get_selection_predicate(selection))
 
     def should_skip(self, sample, index, current_time):
-        """Returns false if a given sample was not running on this CPU."""
-        if self.cpu is None or self.samples_cpu is None:
+        """Returns false if a given sample is in the selection."""
+        if self.mask is None:
             return False
-        return self.cpu != self.samples_cpu[index]
+        return not self.mask[index]
+
+    def get_mask(self):
+        """Returns the precomputed selection mask."""
+        return self.mask
+
 
+class CPUSampleFilter(ColumnSampleFilter):
+    """Filter all samples for a given CPU or set of CPUs."""
 
-class PIDSampleFilter(SampleFilter):
-    """Filter all samples for a given PID."""
+    column = 'samples_cpu'
+    param = 'has_samples_cpu'
+
+    def __init__(self, profile, cpu=None, **args):
+        """CPU filter constructor."""
+        super().__init__(profile, cpu)
+        self.cpu = cpu
+        self.samples_cpu = self.values
+
+
+class PIDSampleFilter(ColumnSampleFilter):
+    """Filter all samples for a given PID or set of PIDs."""
+
+    column = 'samples_pid'
+    param = 'has_samples_pid'
 
     def __init__(self, profile, pid=None, **args):
         """PID filter constructor."""
-        super().__init__(profile)
+        super().__init__(profile, pid)
         self.pid = pid
-        self.samples_pid = None
-
-        if 'has_samples_pid' not in profile.params:
-            return
-        if profile.params['has_samples_pid'] != 'true':
-            return
-
-        self.samples_pid = profile.samples_pid
+        self.samples_pid = self.values
 
-    def should_skip(self, sample, index, current_time):
-        """Returns false if a given sample doesn't include PID."""
-        if self.pid is None or self.samples_pid is None:
-            return False
-        return self.pid != self.samples_pid[index]
 
+class TIDSampleFilter(ColumnSampleFilter):
+    """Filter all samples for a given TID or set of TIDs."""
 
-class TIDSampleFilter(SampleFilter):
-    """Filter all samples for a given TID."""
+    column = 'samples_tid'
+    param = 'has_samples_tid'
 
     def __init__(self, profile, tid=None, **args):
-        """PID filter constructor."""
-        super().__init__(profile)
+        """TID filter constructor."""
+        super().__init__(profile, tid)
         self.tid = tid
-        self.samples_tid = None
+        self.samples_tid = self.values
 
-        if 'has_samples_tid' not in profile.params:
-            return
-        if profile.params['has_samples_tid'] != 'true':
-            return
 
-        self.samples_tid = profile.samples_tid
+class FrameIndex:
+    """Inverted index from frame names to the sampled node ids containing them.
+
+    Stacks go through the stack processor's process_stack, so the index
+    matches the names shown in the flame graph, including frames renamed or
+    merged by processors like RuleStackProcessor.
+    """
+
+    def __init__(self, profile, **args):
+        """Build the index from every node referenced by a sample."""
+        stack_processor_class = args.get("stack_processor", StackProcessor)
+        stack_processor = stack_processor_class(None, profile, **args)
+        get_stack = _get_stack_resolver(profile, None, **args)
+
+        self.frames = {}
+        for node_id in _get_sampled_node_ids(profile):
+            for frame, frame_extras in stack_processor.process_stack(get_stack(node_id), 1):
+                name = frame.function_name.strip()
+                if name not in self.frames:
+                    self.frames[name] = set()
+                self.frames[name].add(node_id)
+
+    def find(self, name):
+        """Return the node ids whose stacks contain a frame named name."""
+        return self.frames.get(name, set())
+
+    def search(self, pattern):
+        """Return the node ids whose stacks contain a frame matching pattern."""
+        regex = re.compile(pattern)
+        node_ids = set()
+        for name, name_node_ids in self.frames.items():
+            if regex.search(name):
+                node_ids.update(name_node_ids)
+        return node_ids
+
+
+# options changing the frames indexed, the other ones (filters, ranges, ...) don't
+FRAME_INDEX_OPTIONS = ['stack_processor', 'package_name', 'rules', 'ignore_libtype', 'middle_out', 'inverted',
+                       'max_depth', 'collapse_recursion']
+FRAME_INDEX_CACHE_SIZE = 8
+
+# profile -> {options key: FrameIndex}, for profiles which can be weakly referenced
+_frame_index_cache = weakref.WeakKeyDictionary()
+# id(profile) -> (profile, {options key: FrameIndex}), least recently used first, for protobuf messages
+_message_frame_index_cache = collections.OrderedDict()
+
+
+def _freeze(value):
+    """Return a hashable equivalent of an option value made of dicts and lists."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _get_frame_indexes(profile):
+    try:
+        return _frame_index_cache.setdefault(profile, {})
+    except TypeError:
+        pass
+    # protobuf messages can't be weakly referenced, the last ones used are
+    # kept alive instead, so their ids can't be reused while cached
+    entry = _message_frame_index_cache.get(id(profile))
+    if entry is not None and entry[0] is profile:
+        _message_frame_index_cache.move_to_end(id(profile))
+        return entry[1]
+    frame_indexes = {}
+    _message_frame_index_cache[id(profile)] = (profile, frame_indexes)
+    if len(_message_frame_index_cache) > FRAME_INDEX_CACHE_SIZE:
+        _message_frame_index_cache.popitem(last=False)
+    return frame_indexes
+
+
+def get_frame_index(profile, **args):
+    """Return the FrameIndex for a profile, building it on first use.
+
+    Indexes are cached per profile and FRAME_INDEX_OPTIONS values. Profiles
+    which can be weakly referenced (e.g. ColumnarProfile) keep their indexes
+    as long as they are alive, protobuf messages are kept alive by the cache
+    for the last FRAME_INDEX_CACHE_SIZE ones used. An index can also be passed
+    back with the frame_index option. Profiles are assumed not to change once
+    indexed.
+    """
+    frame_index = args.get("frame_index", None)
+    if frame_index is not None:
+        return frame_index
+    key = tuple(_freeze(args.get(option)) for option in FRAME_INDEX_OPTIONS)
+    frame_indexes = _get_frame_indexes(profile)
+    if key not in frame_indexes:
+        frame_indexes[key] = FrameIndex(profile, **args)
+    return frame_indexes[key]
+
+
+class FrameSampleFilter(SampleFilter):
+    """Filter samples by the frames in their stacks.
+
+    focus keeps only samples with a frame matching the regular expression,
+    exclude drops samples with a frame matching it.
+    """
+
+    def __init__(self, profile, focus=None, exclude=None, **args):
+        """Frame filter constructor."""
+        super().__init__(profile)
+        self.focus_ids = None
+        self.exclude_ids = None
+        if focus is None and exclude is None:
+            return
+        frame_index = get_frame_index(profile, **args)
+        if focus is not None:
+            self.focus_ids = frame_index.search(focus)
+        if exclude is not None:
+            self.exclude_ids = frame_index.search(exclude)
 
     def should_skip(self, sample, index, current_time):
-        """Returns false if a given sample doesn't include TID."""
-        if self.tid is None or self.samples_tid is None:
-            return False
-        return self.tid != self.samples_tid[index]
+        """Returns true if a given sample is out of focus or excluded."""
+        if self.focus_ids is not None and sample not in self.focus_ids:
+            return True
+        if self.exclude_ids is not None and sample in self.exclude_ids:
+            return True
+        return False
 
+    def get_mask(self):
+        """Returns a mask of the samples in focus and not excluded."""
+        if self.focus_ids is None and self.exclude_ids is None:
+            return None
+        return _build_mask(self.profile.samples, lambda sample: not self.should_skip(sample, None, None))
 
-# pylint: disable=too-many-locals
-# pylint: disable=too-many-branches
-# pylint: disable=too-many-statements
-def get_flame_graph(profile, pid_comm, **args):
-    """Generate flame graph from a nflxprofile profile."""
-    inverted = args.get("inverted", False)
-    package_name = args.get("package_name", False)
-    use_sample_value = args.get("use_sample_value", False)
+
+def _has_aggregated_samples(profile):
+    return 'has_aggregated_samples' in profile.params and profile.params['has_aggregated_samples'] == 'true'
+
+
+def _has_dense_ids(profile):
+    """Check if node ids are 0 to len(nodes) - 1, as written by compact."""
+    return 'has_dense_ids' in profile.params and profile.params['has_dense_ids'] == 'true'
+
+
+def _get_sampled_node_ids(profile):
+    """Return the set of node ids referenced by samples."""
+    if _has_aggregated_samples(profile):
+        return set(node_id for node_id, node in profile.nodes.items() if node.hit_count)
+    return set(profile.samples)
+
+
+def _get_samples_value(profile):
+    """Return the samples_value column, raising ValueError if it is missing."""
+    samples_value = profile.samples_value
+    if len(samples_value) != len(profile.samples):
+        raise ValueError("Profile has no samples_value column, can't aggregate sample values")
+    return samples_value
+
+
+def _aggregate_hit_counts(profile, use_node_value=False, **args):
+    """Aggregate a profile without per-sample arrays, using node hit counts.
+
+    Range, CPU, PID and TID filters need per-sample data and don't apply.
+    With use_node_value, each node's value is used instead of its hit count,
+    falling back to the hit count for nodes without a value (e.g. V8 ones).
+    """
+    frame_filter = FrameSampleFilter(profile, **args)
+    aggregated_samples = {}
+    for node_id, node in profile.nodes.items():
+        if node.hit_count and not frame_filter.should_skip(node_id, None, None):
+            if use_node_value and node.HasField('value'):
+                aggregated_samples[node_id] = node.value
+            else:
+                aggregated_samples[node_id] = node.hit_count
+    return aggregated_samples
+
+
+def _get_sample_filters(profile, **args):
+    """Return the sample filters selected by get_flame_graph options."""
+    range_start = args.get("range_start", None)
+    range_end = args.get("range_end", None)
     cpu = args.get("cpu", None)
     pid = args.get("pid", None)
     tid = args.get("tid", None)
-    stack_processor_class = args.get("stack_processor", StackProcessor)
-
-    nodes = profile.nodes
-    root_id = 0
-
-    samples = profile.samples
-    time_deltas = profile.time_deltas
-    start_time = profile.start_time
-    current_time = start_time
+    focus = args.get("focus", None)
+    exclude = args.get("exclude", None)
 
     has_samples_cpu = \
         'has_samples_cpu' in profile.params and profile.params['has_samples_cpu'] == 'true'
@@ -601,51 +1198,291 @@ def get_flame_graph(profile, pid_comm, **args):
     has_samples_tid = \
         'has_samples_tid' in profile.params and profile.params['has_samples_tid'] == 'true'
 
-    has_node_stack = \
-        'has_node_stack' in profile.params and profile.params['has_node_stack'] == 'true'
-    has_parent = \
-        'has_parent' in profile.params and profile.params['has_parent'] == 'true'
-
-    samples_value = None
-    if 'hasValues' in profile.params and profile.params['hasValues'] == 'true':
-        samples_value = profile.samples_value
+    sample_filters = []
 
-    sample_filters = [
-        RangeSampleFilter(profile, **args)
-    ]
-
-    if has_samples_cpu and cpu:
+    if range_start is not None and range_end is not None:
+        sample_filters.append(RangeSampleFilter(profile, **args))
+    if has_samples_cpu and cpu is not None:
         sample_filters.append(CPUSampleFilter(profile, **args))
-    if has_samples_pid and pid:
+    if has_samples_pid and pid is not None:
         sample_filters.append(PIDSampleFilter(profile, **args))
-    if has_samples_tid and tid:
+    if has_samples_tid and tid is not None:
         sample_filters.append(TIDSampleFilter(profile, **args))
+    if focus is not None or exclude is not None:
+        sample_filters.append(FrameSampleFilter(profile, **args))
+    return sample_filters
+
+
+def _get_sample_mask(sample_filters):
+    """Combine filter masks into one, returning it and the filters without a mask.
+
+    Each sample then checks a single byte instead of calling every filter.
+    """
+    mask = None
+    time_filters = []
+    for sample_filter in sample_filters:
+        filter_mask = sample_filter.get_mask()
+        if filter_mask is None:
+            time_filters.append(sample_filter)
+        elif mask is None:
+            mask = filter_mask
+        else:
+            mask = bytearray(map(operator.and_, mask, filter_mask))
+    return mask, time_filters
+
+
+def _aggregate(profile, samples_value, sample_filters):
+    """Sum samples_value (or count samples, if None) per node id for kept samples."""
+    samples = profile.samples
+    mask, time_filters = _get_sample_mask(sample_filters)
+
+    if time_filters:
+        aggregated_samples = {}
+        current_time = profile.start_time
+        time_deltas = profile.time_deltas
+        for index, sample in enumerate(samples):
+            current_time += time_deltas[index]
+
+            if mask is not None and not mask[index]:
+                continue
+
+            should_skip = False
+            for sample_filter in time_filters:
+                should_skip = sample_filter.should_skip(sample, index, current_time)
+                if should_skip:
+                    break
+            if should_skip:
+                continue
+
+            sample_value = 1 if samples_value is None else samples_value[index]
+            aggregated_samples[sample] = aggregated_samples.get(sample, 0) + sample_value
+        return aggregated_samples
+
+    if samples_value is None:
+        # counting is done in bulk by Counter
+        if mask is not None:
+            samples = itertools.compress(samples, mask)
+        return collections.Counter(samples)
+
+    # python ints don't overflow, so summing uint64 values is safe
+    aggregated_samples = {}
+    pairs = zip(samples, samples_value)
+    if mask is not None:
+        pairs = itertools.compress(pairs, mask)
+    for sample, sample_value in pairs:
+        aggregated_samples[sample] = aggregated_samples.get(sample, 0) + sample_value
+    return aggregated_samples
+
+
+def _aggregate_runs(profile, samples_value, sample_filters):
+    """Aggregate a tick run encoded profile (see ticks) without expanding it.
+
+    Each run is counted once, for the part of it in range. Returns None if a
+    filter needs per-sample times, or samples are not sorted by time.
+    """
+    index_range = None
+    other_filters = []
+    for sample_filter in sample_filters:
+        if isinstance(sample_filter, RangeSampleFilter) and sample_filter.range_start is not None:
+            index_range = ticks.get_index_range(profile, sample_filter.range_start, sample_filter.range_end)
+            if index_range is None:
+                return None
+        else:
+            other_filters.append(sample_filter)
+    # masks of the other filters are per run, as their columns
+    mask, time_filters = _get_sample_mask(other_filters)
+    if time_filters:
+        return None
+
+    sample_runs = profile.sample_runs
+    first, last = index_range if index_range is not None else (0, sum(sample_runs))
+    aggregated_samples = {}
+    run_end = 0
+    for run_index, (sample, run) in enumerate(zip(profile.samples, sample_runs)):
+        run_start = run_end
+        run_end += run
+        if run_end <= first:
+            continue
+        if run_start >= last:
+            break
+        if mask is not None and not mask[run_index]:
+            continue
+        count = min(run_end, last) - max(run_start, first)
+        value = count if samples_value is None else count * samples_value[run_index]
+        aggregated_samples[sample] = aggregated_samples.get(sample, 0) + value
+    return aggregated_samples
+
+
+def _aggregate_samples(profile, **args):
+    """Aggregate filtered samples by node id, returning a {node_id: value} dict.
+
+    Values are sample counts, or the sum of samples_value with
+    use_sample_value or weighted.
+    """
+    weighted = args.get("use_sample_value", False) or args.get("weighted", False)
+    if _has_aggregated_samples(profile):
+        return _aggregate_hit_counts(profile, weighted, **args)
+
+    if ticks.has_tick_runs(profile):
+        samples_value = _get_samples_value(profile) if weighted else None
+        aggregated_samples = _aggregate_runs(profile, samples_value, _get_sample_filters(profile, **args))
+        if aggregated_samples is not None:
+            return aggregated_samples
+        profile = ticks.expand(profile)
+
+    samples_value = _get_samples_value(profile) if weighted else None
+    return _aggregate(profile, samples_value, _get_sample_filters(profile, **args))
+
+
+def _aggregate_weighted_samples(profile, **args):
+    """Aggregate filtered samples by node id into weights and sample counts.
+
+    Returns two {node_id: value} dicts, the sum of samples_value and the
+    number of samples. Raises ValueError if the profile has no samples_value.
+    """
+    if _has_aggregated_samples(profile):
+        return _aggregate_hit_counts(profile, True, **args), _aggregate_hit_counts(profile, False, **args)
+
+    if ticks.has_tick_runs(profile):
+        samples_value = _get_samples_value(profile)
+        sample_filters = _get_sample_filters(profile, **args)
+        weights = _aggregate_runs(profile, samples_value, sample_filters)
+        if weights is not None:
+            return weights, _aggregate_runs(profile, None, sample_filters)
+        profile = ticks.expand(profile)
+
+    samples_value = _get_samples_value(profile)
+    sample_filters = _get_sample_filters(profile, **args)
+    return _aggregate(profile, samples_value, sample_filters), _aggregate(profile, None, sample_filters)
+
+
+def _get_stack_resolver(profile, pid_comm, **args):
+    """Return a function resolving a node id into its stack of frames."""
+    inverted = args.get("inverted", False)
+    package_name = args.get("package_name", False)
+    max_depth = args.get("max_depth", None)
+    collapse_recursion = args.get("collapse_recursion", False)
+    has_limits = max_depth is not None or collapse_recursion
+
+    nodes = profile.nodes
+    root_id = 0
+
+    has_node_stack = \
+        'has_node_stack' in profile.params and profile.params['has_node_stack'] == 'true'
+    has_parent = \
+        'has_parent' in profile.params and profile.params['has_parent'] == 'true'
+    # files of parent pointer nodes are only used by the profiles flagged as setting them
+    has_node_file = \
+        'has_node_file' in profile.params and profile.params['has_node_file'] == 'true'
 
-    stacks = None
     if (not has_node_stack) and (not has_parent):
         # don't have stacks or parent pointer, generating stacks manually
         # case for very old nflxprofile
         stacks = _generate_stacks(nodes, root_id, package_name)
+        if has_limits:
+            return lambda node_id: _limit_stack(stacks[node_id][::-1] if inverted else stacks[node_id],
+                                                max_depth, collapse_recursion)
+        if inverted:
+            return lambda node_id: stacks[node_id][::-1]
+        return lambda node_id: stacks[node_id]
 
-    aggregated_samples = {}
-    for index, sample in enumerate(samples):
-        current_time += time_deltas[index]
+    if _has_dense_ids(profile) and not package_name and not has_node_stack and not has_limits:
+        return _get_dense_parent_stack_resolver(nodes, inverted, has_node_file)
 
-        should_skip = False
-        for sample_filter in sample_filters:
-            should_skip = sample_filter.should_skip(sample, index, current_time)
-            if should_skip:
+    return lambda node_id: _get_stack(nodes, node_id, has_node_stack, pid_comm, has_node_file, **args)
+
+
+def _get_dense_parent_stack_resolver(nodes, inverted, has_node_file=False):
+    """Return a stack resolver for profiles with dense ids and parent pointers.
+
+    Each node's frame and parent are read once, on first use, into lists
+    indexed by node id. Stacks sharing a prefix then walk plain lists instead
+    of looking nodes up in the protobuf map and building frames again.
+    """
+    frames = [None] * len(nodes)
+    parents = array.array('l', [-1]) * len(nodes)
+
+    def get_stack(node_id):
+        stack = []
+        while True:
+            stack_frame = frames[node_id]
+            if stack_frame is None:
+                node = nodes[node_id]
+                stack_frame = nflxprofile_pb2.StackFrame()
+                stack_frame.function_name = node.function_name
+                stack_frame.libtype = node.libtype
+                if has_node_file and node.HasField('file'):
+                    stack_frame.file.CopyFrom(node.file)
+                frames[node_id] = stack_frame
+                parents[node_id] = node.parent
+            stack.append(stack_frame)
+            node_id = parents[node_id]
+            if not node_id:
                 break
-        if should_skip:
-            continue
+        if inverted:
+            return stack
+        return stack[::-1]
+    return get_stack
+
 
-        sample_value = 1
-        if use_sample_value:
-            sample_value = samples_value[index] if samples_value else None
+def get_cpu_utilization(profile, range_start=None, range_end=None):
+    """Return the fraction of samples which were not idle, or None if unknown.
+
+    Only the idle counters and histograms filled by converters are read, not
+    the samples. With range_start and range_end (relative to the start of the
+    profile, as in get_flame_graph) the histogram buckets overlapping the
+    range are used, and None is returned for profiles without histograms.
+    """
+    if range_start is not None and range_end is not None:
+        interval = profile.histogram_interval
+        if not interval:
+            return None
+        first = max(int(math.floor(range_start / interval)), 0)
+        last = max(int(math.ceil(range_end / interval)), first)
+        busy = sum(profile.sample_histogram[first:last])
+        idle = sum(profile.idle_histogram[first:last])
+    elif profile.histogram_interval:
+        busy = sum(profile.sample_histogram)
+        idle = sum(profile.idle_histogram)
+    elif profile.HasField('idle_sample_count'):
+        if _has_aggregated_samples(profile):
+            busy = sum(node.hit_count for node in profile.nodes.values())
+        elif ticks.has_tick_runs(profile):
+            busy = sum(profile.sample_runs)
+        else:
+            busy = len(profile.samples)
+        busy += profile.program_sample_count
+        idle = profile.idle_sample_count
+    else:
+        return None
+    if busy + idle == 0:
+        return None
+    return busy / (busy + idle)
 
-        if sample not in aggregated_samples:
-            aggregated_samples[sample] = 0
-        aggregated_samples[sample] += sample_value
+
+def get_flame_graph(profile, pid_comm, **args):
+    """Generate flame graph from a nflxprofile profile.
+
+    With the cpu_utilization option, the root also carries the CPU
+    utilization of the selected range, see get_cpu_utilization.
+
+    The max_depth option caps stacks to their first max_depth frames, the
+    root side ones or, with inverted, the leaf side ones; values of deeper
+    frames go to the last kept frame. With collapse_recursion, consecutive
+    frames with the same function, libtype and file are merged into one
+    node, whose 'recursion' extra is the most frames merged into it. Both
+    are applied while stacks are resolved, so frames past the limit are
+    never built.
+    """
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+    weighted = args.get("weighted", False)
+
+    sample_counts = None
+    if weighted:
+        aggregated_samples, sample_counts = _aggregate_weighted_samples(profile, **args)
+    else:
+        aggregated_samples = _aggregate_samples(profile, **args)
+    get_stack = _get_stack_resolver(profile, pid_comm, **args)
 
     root = {
         'name': 'root',
@@ -658,11 +1495,11 @@ def get_flame_graph(profile, pid_comm, **args):
 
     for sample_id in aggregated_samples:
         sample_value = aggregated_samples[sample_id]
+        sample_count = sample_counts[sample_id] if sample_counts is not None else None
+        stack_processor.process(get_stack(sample_id), sample_value, sample_count)
 
-        if stacks:
-            stack = stacks[sample_id] if not inverted else stacks[sample_id][::-1]
-        else:
-            stack = _get_stack(nodes, sample_id, has_node_stack, pid_comm, **args)
-
-        stack_processor.process(stack, sample_value)
+    if args.get("cpu_utilization", False):
+        range_start = args.get("range_start", None)
+        range_end = args.get("range_end", None)
+        root['cpu_utilization'] = get_cpu_utilization(profile, range_start, range_end)
     return root
@@ -0,0 +1,40 @@
+"""Source line hotspots from per-line sample weights."""
+
+__ALL__ = ['get_line_hotspots']
+
+from nflxprofile.flamegraph import _aggregate_samples
+
+
+def get_line_hotspots(profile, **args):
+    """Return a table of the source lines where samples were taken.
+
+    Uses the line_ticks stored in each node (from V8 positionTicks), weighted
+    per line rather than per sample. Each row is a dict with function_name,
+    file, line and ticks, hottest first. Ticks from different stacks hitting
+    the same line of the same function are added together. Only nodes kept by
+    the sample filters (see get_flame_graph) are counted.
+    """
+    sampled_node_ids = _aggregate_samples(profile, **args)
+
+    hotspots = {}
+    for node_id in sampled_node_ids:
+        node = profile.nodes[node_id]
+        if not node.line_ticks:
+            continue
+        function_name = node.function_name
+        file_name = ''
+        if node.stack:
+            function_name = node.stack[-1].function_name
+            file_name = node.stack[-1].file.file_name
+        for line_ticks in node.line_ticks:
+            key = (function_name, file_name, line_ticks.line)
+            hotspots[key] = hotspots.get(key, 0) + line_ticks.ticks
+
+    rows = [{
+        'function_name': function_name,
+        'file': file_name,
+        'line': line,
+        'ticks': ticks,
+    } for (function_name, file_name, line), ticks in hotspots.items()]
+    rows.sort(key=lambda row: row['ticks'], reverse=True)
+    return rows
@@ -0,0 +1,127 @@
+"""Profile metadata, read straight from the wire format."""
+
+__ALL__ = ['get_info', 'read_info']
+
+import mmap
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.profile_io import COMPRESSION_MAGIC, _open_decompressed, _read_stream, get_compression
+from nflxprofile.wire import DOUBLE, FIXED64, LENGTH_DELIMITED, VARINT, count_varints, iter_fields, iter_packed_varints
+
+_FIELDS = nflxprofile_pb2.Profile.DESCRIPTOR.fields_by_name
+
+
+def _field_number(name):
+    return _FIELDS[name].number
+
+
+START_TIME = _field_number('start_time')
+END_TIME = _field_number('end_time')
+SAMPLES = _field_number('samples')
+TIME_DELTAS = _field_number('time_deltas')
+NODES = _field_number('nodes')
+TITLE = _field_number('title')
+DESCRIPTION = _field_number('description')
+PARAMS = _field_number('params')
+IDLE_SAMPLE_COUNT = _field_number('idle_sample_count')
+SAMPLE_RUNS = _field_number('sample_runs')
+
+
+def _decode_string(data, offsets):
+    start, end = offsets
+    return bytes(data[start:end]).decode('utf-8')
+
+
+def _decode_map_entry(data, offsets):
+    key = value = ''
+    for field_number, _, entry_offsets in iter_fields(data, *offsets):
+        if field_number == 1:
+            key = _decode_string(data, entry_offsets)
+        elif field_number == 2:
+            value = _decode_string(data, entry_offsets)
+    return key, value
+
+
+def get_info(data, count_samples=False):
+    """Summarize a serialized Profile without parsing it.
+
+    data is any buffer (bytes, memoryview, mmap) holding the Profile. Fields
+    are scanned one by one: nodes and sample arrays are skipped using their
+    length prefix, only the fixed-size fields, title, description and params
+    are decoded.
+
+    The sample count is the size of time_deltas divided by 8, as doubles are
+    fixed-size. Profiles without time_deltas have a sample_count of None,
+    unless count_samples is set, in which case the packed samples varints are
+    counted (without decoding them). For tick run encoded profiles (see
+    ticks), count_samples sums the sample runs instead.
+    """
+    info = {
+        'start_time': None,
+        'end_time': None,
+        'title': None,
+        'description': None,
+        'params': {},
+        'node_count': 0,
+        'sample_count': None,
+        'idle_sample_count': None,
+    }
+    time_deltas_size = 0
+    samples_count = 0
+    has_samples = False
+    has_sample_runs = False
+    for field_number, wire_type, value in iter_fields(data):
+        if field_number == START_TIME and wire_type == FIXED64:
+            info['start_time'] = DOUBLE.unpack_from(data, value[0])[0]
+        elif field_number == END_TIME and wire_type == FIXED64:
+            info['end_time'] = DOUBLE.unpack_from(data, value[0])[0]
+        elif field_number == NODES:
+            info['node_count'] += 1
+        elif field_number == TIME_DELTAS:
+            # packed arrays may be split in several records
+            time_deltas_size += value[1] - value[0] if wire_type == LENGTH_DELIMITED else 8
+        elif field_number == SAMPLES:
+            has_samples = True
+            if count_samples and not has_sample_runs:
+                samples_count += count_varints(data, *value) if wire_type == LENGTH_DELIMITED else 1
+        elif field_number == SAMPLE_RUNS:
+            # tick run encoded, samples holds runs, count the samples of every run instead
+            if not has_sample_runs:
+                has_sample_runs = True
+                samples_count = 0
+            if count_samples:
+                samples_count += sum(iter_packed_varints(data, *value)) if wire_type == LENGTH_DELIMITED else value
+        elif field_number == TITLE:
+            info['title'] = _decode_string(data, value)
+        elif field_number == DESCRIPTION:
+            info['description'] = _decode_string(data, value)
+        elif field_number == PARAMS:
+            key, param = _decode_map_entry(data, value)
+            info['params'][key] = param
+        elif field_number == IDLE_SAMPLE_COUNT and wire_type == VARINT:
+            info['idle_sample_count'] = value
+
+    if time_deltas_size:
+        info['sample_count'] = time_deltas_size // DOUBLE.size
+    elif count_samples or not has_samples:
+        info['sample_count'] = samples_count
+    return info
+
+
+def read_info(filename, count_samples=False):
+    """Summarize the profile stored in filename, see get_info.
+
+    Uncompressed files are memory-mapped, so only the pages holding field
+    headers are read. Compressed files have to be decompressed first.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(max(len(magic) for magic in COMPRESSION_MAGIC))
+        f.seek(0)
+        compression = get_compression(filename, header)
+        if compression is not None:
+            with _open_decompressed(f, compression) as stream:
+                return get_info(_read_stream(stream), count_samples)
+        if not header:
+            return get_info(b'', count_samples)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return get_info(data, count_samples)
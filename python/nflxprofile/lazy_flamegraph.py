@@ -0,0 +1,218 @@
+"""Lazy flame graph, materializing subtrees only when they are requested."""
+
+__ALL__ = ['LazyFlameGraph', 'get_lazy_flame_graph']
+
+import array
+
+from nflxprofile.flamegraph import StackProcessor, _aggregate_samples, _get_stack_resolver
+from nflxprofile.tree_json import dump_tree
+
+
+class LazyFlameGraph:
+    """Flame graph stored as a compact trie.
+
+    Nodes are kept in flat arrays (parent, frame, first child, next sibling,
+    self value and total value) instead of nested dicts. Totals of any node
+    are available immediately; dicts in the get_flame_graph format are only
+    built for the subtree and depth asked for.
+
+    Values are unsigned 64-bit arrays, switched to lists of Python ints if
+    a value doesn't fit. Only the 'file' extra is kept, processor specific
+    extras (e.g. the NodeJsStackProcessor ones) are not aggregated.
+    """
+
+    def __init__(self, ignore_libtype=False):
+        """Constructor, creating an empty trie with a root node."""
+        self.ignore_libtype = ignore_libtype
+        # frame id -> (name, libtype, file)
+        self.frames = [('root', '', '')]
+        self._frame_ids = {self.frames[0]: 0}
+        # (parent index, frame id) -> node index, dropped once the trie is complete
+        self._child_index = {}
+        self.parents = array.array('l', [-1])
+        self.node_frames = array.array('L', [0])
+        self.first_child = array.array('l', [-1])
+        self.last_child = array.array('l', [-1])
+        self.next_sibling = array.array('l', [-1])
+        self.values = array.array('Q', [0])
+        self.totals = None
+
+    def _get_frame_id(self, frame):
+        name = frame.function_name.strip()
+        libtype = "" if self.ignore_libtype else frame.libtype
+        filename = frame.file.file_name or ""
+        if filename:
+            filename = "%s:%d" % (filename, frame.file.line or 0)
+        key = (name, libtype, filename)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = len(self.frames)
+            self.frames.append(key)
+            self._frame_ids[key] = frame_id
+        return frame_id
+
+    def _get_child(self, node, frame_id):
+        child = self._child_index.get((node, frame_id))
+        if child is None:
+            child = len(self.parents)
+            self.parents.append(node)
+            self.node_frames.append(frame_id)
+            self.first_child.append(-1)
+            self.last_child.append(-1)
+            self.next_sibling.append(-1)
+            self.values.append(0)
+            if self.last_child[node] == -1:
+                self.first_child[node] = child
+            else:
+                self.next_sibling[self.last_child[node]] = child
+            self.last_child[node] = child
+            self._child_index[(node, frame_id)] = child
+        return child
+
+    def add(self, frames, value):
+        """Add processed (frame, frame_extras) pairs with value, returning the leaf node."""
+        node = 0
+        for frame, _ in frames:
+            node = self._get_child(node, self._get_frame_id(frame))
+        self.add_value(node, value)
+        return node
+
+    def add_value(self, node, value):
+        """Add value (possibly negative) to the self value of node."""
+        try:
+            self.values[node] += value
+        except OverflowError:
+            # out of the unsigned 64-bit range
+            self.values = list(self.values)
+            self.values[node] += value
+
+    def finish(self):
+        """Compute totals and drop the lookup tables only needed while building."""
+        self._child_index = None
+        self._frame_ids = None
+        self.update_totals()
+
+    def update_totals(self):
+        """Recompute every node's total value from the self values."""
+        totals = list(self.values)
+        # children are always created after their parents
+        for node in range(len(self.parents) - 1, 0, -1):
+            totals[self.parents[node]] += totals[node]
+        try:
+            self.totals = array.array('Q', totals)
+        except OverflowError:
+            self.totals = totals
+
+    @property
+    def total(self):
+        """Total value of the flame graph."""
+        return self.totals[0]
+
+    def get_children(self, node):
+        """Return the indexes of the children of node."""
+        children = []
+        child = self.first_child[node]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def find(self, path):
+        """Return the index of the node at path, a sequence of frames below root.
+
+        Frames are (name, libtype, file) tuples, as nodes are keyed in the
+        trie, or names, matching the only child with that name.
+        """
+        node = 0
+        for frame in path:
+            if isinstance(frame, str):
+                children = [child for child in self.get_children(node)
+                            if self.frames[self.node_frames[child]][0] == frame]
+                if len(children) > 1:
+                    raise KeyError("Frame %s is ambiguous in path %s, use (name, libtype, file)" % (frame, list(path)))
+            else:
+                children = [child for child in self.get_children(node)
+                            if self.frames[self.node_frames[child]] == tuple(frame)]
+            if not children:
+                raise KeyError("No frame %s in path %s" % (frame, list(path)))
+            node = children[0]
+        return node
+
+    def get_path(self, node, keys=False):
+        """Return the frame names from below root to node.
+
+        With keys, frames are returned as (name, libtype, file) tuples instead.
+        """
+        path = []
+        while node > 0:
+            frame = self.frames[self.node_frames[node]]
+            path.append(frame if keys else frame[0])
+            node = self.parents[node]
+        return path[::-1]
+
+    def _node_dict(self, node, value):
+        name, libtype, filename = self.frames[self.node_frames[node]]
+        node_dict = {
+            'name': name,
+            'value': value,
+            'children': [],
+            'libtype': libtype,
+        }
+        if filename:
+            node_dict['extras'] = {'file': filename}
+        return node_dict
+
+    def children(self, path=()):
+        """Return one level of children below path, with self and total values."""
+        children = []
+        for child in self.get_children(self.find(path)):
+            child_dict = self._node_dict(child, self.values[child])
+            child_dict['total'] = self.totals[child]
+            del child_dict['children']
+            children.append(child_dict)
+        return children
+
+    def to_dict(self, path=(), max_depth=None, skip_empty=False):
+        """Materialize the subtree at path in the get_flame_graph format.
+
+        With max_depth, nodes at that depth below path have no children and
+        their value is their total, so totals are preserved in the output.
+        With skip_empty, nodes with a total of 0 are left out.
+        """
+        root = self.find(path)
+        root_dict = self._node_dict(root, self.values[root])
+        pending = [(root, root_dict, 0)]
+        while pending:
+            node, node_dict, depth = pending.pop()
+            if max_depth is not None and depth >= max_depth:
+                node_dict['value'] = self.totals[node]
+                continue
+            for child in self.get_children(node):
+                if skip_empty and not self.totals[child]:
+                    continue
+                child_dict = self._node_dict(child, self.values[child])
+                node_dict['children'].append(child_dict)
+                pending.append((child, child_dict, depth + 1))
+        return root_dict
+
+    def dump(self, f, path=(), max_depth=None):
+        """Write the subtree at path as JSON to f, see to_dict."""
+        dump_tree(self.to_dict(path, max_depth), f)
+
+
+def get_lazy_flame_graph(profile, pid_comm, **args):
+    """Generate a LazyFlameGraph from a nflxprofile profile.
+
+    Accepts the same options as get_flame_graph.
+    """
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+
+    aggregated_samples = _aggregate_samples(profile, **args)
+    get_stack = _get_stack_resolver(profile, pid_comm, **args)
+
+    flame_graph = LazyFlameGraph(args.get("ignore_libtype", False))
+    stack_processor = stack_processor_class(None, profile, **args)
+    for sample_id, value in aggregated_samples.items():
+        flame_graph.add(stack_processor.process_stack(get_stack(sample_id), value), value)
+    flame_graph.finish()
+    return flame_graph
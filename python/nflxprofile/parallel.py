@@ -0,0 +1,140 @@
+"""Process-parallel flame graph generation."""
+
+__ALL__ = ['get_flame_graph_parallel', 'merge_flame_graphs']
+
+import multiprocessing
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import StackProcessor, _aggregate_samples, _aggregate_weighted_samples
+from nflxprofile.flamegraph import _get_stack_resolver
+
+# extras which are only metadata about the frame, everything else numeric is summed
+_METADATA_EXTRAS = ['file']
+# extras which are maximums, like the recursion depth of collapse_recursion
+_MAX_EXTRAS = ['recursion']
+
+_worker_state = {}
+
+
+def _node_key(node, ignore_libtype):
+    libtype = "" if ignore_libtype else node.get('libtype', "")
+    return (node['name'].strip(), libtype, node.get('extras', {}).get('file', ""))
+
+
+def _merge_extras(target, source):
+    if 'extras' not in source:
+        return
+    if 'extras' not in target:
+        target['extras'] = dict(source['extras'])
+        return
+    extras = target['extras']
+    for key, value in source['extras'].items():
+        if key not in extras or key in _METADATA_EXTRAS:
+            extras[key] = value
+        elif key in _MAX_EXTRAS:
+            extras[key] = max(extras[key], value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            # counters such as NodeJsStackProcessor's optimized and argumentAdaptor
+            extras[key] = extras[key] + value
+
+
+def merge_flame_graphs(target, source, ignore_libtype=False):
+    """Merge the flame graph source into target, in place, and return target.
+
+    Nodes are matched by name, libtype (unless ignore_libtype) and file, the
+    same rules StackProcessor uses when building a tree. Values, sample
+    counts and numeric extras are summed.
+    """
+    pending = [(target, source)]
+    while pending:
+        target_node, source_node = pending.pop()
+        target_node['value'] = target_node['value'] + source_node['value']
+        if 'samples' in source_node:
+            target_node['samples'] = target_node.get('samples', 0) + source_node['samples']
+
+        children = {}
+        for child in target_node['children']:
+            children[_node_key(child, ignore_libtype)] = child
+        for source_child in source_node['children']:
+            key = _node_key(source_child, ignore_libtype)
+            target_child = children.get(key)
+            if target_child is None:
+                target_node['children'].append(source_child)
+                children[key] = source_child
+                continue
+            _merge_extras(target_child, source_child)
+            pending.append((target_child, source_child))
+    return target
+
+
+def _new_root():
+    return {
+        'name': 'root',
+        'libtype': '',
+        'value': 0,
+        'children': []
+    }
+
+
+def _init_worker(profile_data, pid_comm, args):
+    profile = nflxprofile_pb2.Profile()
+    profile.ParseFromString(profile_data)
+    _worker_state['profile'] = profile
+    _worker_state['args'] = args
+    _worker_state['get_stack'] = _get_stack_resolver(profile, pid_comm, **args)
+
+
+def _build_tree(profile, get_stack, args, shard):
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+
+    root = _new_root()
+    stack_processor = stack_processor_class(root, profile, **args)
+    for sample_id, sample_value, sample_count in shard:
+        stack_processor.process(get_stack(sample_id), sample_value, sample_count)
+    return root
+
+
+def _build_shard(shard):
+    return _build_tree(_worker_state['profile'], _worker_state['get_stack'], _worker_state['args'], shard)
+
+
+def _merge_pair(target, source):
+    return merge_flame_graphs(target, source, _worker_state['args'].get("ignore_libtype", False))
+
+
+def get_flame_graph_parallel(profile, pid_comm, processes=None, **args):
+    """Generate a flame graph using a pool of processes.
+
+    Accepts the same options as get_flame_graph. Samples are aggregated once,
+    the unique stacks are split into one shard per process, each shard is
+    turned into a partial tree by the stack processor, and partial trees are
+    merged pairwise in a tree reduction. Children may be ordered differently
+    than in get_flame_graph's output.
+    """
+    processes = processes or multiprocessing.cpu_count()
+
+    sample_counts = None
+    if args.get("weighted", False):
+        aggregated_samples, sample_counts = _aggregate_weighted_samples(profile, **args)
+    else:
+        aggregated_samples = _aggregate_samples(profile, **args)
+    items = [(sample_id, value, sample_counts[sample_id] if sample_counts is not None else None)
+             for sample_id, value in aggregated_samples.items()]
+
+    shard_count = max(1, min(processes, len(items)))
+    shards = [items[index::shard_count] for index in range(shard_count)]
+
+    if shard_count == 1:
+        # not worth a pool, built in this process from the profile itself
+        return _build_tree(profile, _get_stack_resolver(profile, pid_comm, **args), args, shards[0])
+
+    initargs = (profile.SerializeToString(), pid_comm, args)
+    with multiprocessing.Pool(shard_count, _init_worker, initargs) as pool:
+        trees = pool.map(_build_shard, shards)
+        while len(trees) > 1:
+            pairs = list(zip(trees[0::2], trees[1::2]))
+            merged = pool.starmap(_merge_pair, pairs)
+            if len(trees) % 2:
+                merged.append(trees[-1])
+            trees = merged
+    return trees[0]
@@ -0,0 +1,131 @@
+"""Read and write .nflxprofile files, optionally compressed."""
+
+__ALL__ = ['load', 'dump', 'get_compression', 'PROFILE_EXTENSIONS']
+
+import gzip
+import lzma
+import mmap
+import os
+
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.xz': 'xz',
+}
+
+COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\xfd7zXZ\x00': 'xz',
+}
+
+PROFILE_EXTENSIONS = ('.nflxprofile',) + tuple('.nflxprofile' + ext for ext in COMPRESSION_EXTENSIONS)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _get_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def get_compression(filename, header=None):
+    """Return the compression used by filename, or None if uncompressed.
+
+    Magic bytes take precedence over the file extension when a header is given.
+    """
+    if header is not None:
+        for magic, compression in COMPRESSION_MAGIC.items():
+            if header.startswith(magic):
+                return compression
+        return None
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(filename)[1])
+
+
+def _open_decompressed(f, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(f, mode='rb')
+    if compression == 'zstd':
+        return _get_zstd().ZstdDecompressor().stream_reader(f)
+    raise ValueError("Unsupported compression %s" % compression)
+
+
+def _open_compressed(f, compression, level=None):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9 if level is None else level)
+    if compression == 'xz':
+        return lzma.LZMAFile(f, mode='wb', preset=level)
+    if compression == 'zstd':
+        zstandard = _get_zstd()
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(f)
+    raise ValueError("Unsupported compression %s" % compression)
+
+
+def _read_stream(stream):
+    data = bytearray()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def load(filename, profile=None):
+    """Load a profile from filename.
+
+    Compressed files (gzip, zstd, xz) are detected by their magic bytes and
+    decompressed in chunks. Uncompressed files are memory-mapped and parsed
+    in place, without reading them into an intermediate bytes object.
+    """
+    if profile is None:
+        # imported here so the CLI can read PROFILE_EXTENSIONS without loading protobuf
+        from nflxprofile import nflxprofile_pb2
+
+        profile = nflxprofile_pb2.Profile()
+    with open(filename, 'rb') as f:
+        header = f.read(max(len(magic) for magic in COMPRESSION_MAGIC))
+        f.seek(0)
+        compression = get_compression(filename, header)
+
+        if compression is not None:
+            with _open_decompressed(f, compression) as stream:
+                data = _read_stream(stream)
+            profile.ParseFromString(memoryview(data))
+            return profile
+
+        if not header:
+            profile.ParseFromString(b'')
+            return profile
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                profile.ParseFromString(view)
+            finally:
+                view.release()
+    return profile
+
+
+def dump(profile, filename, compression=None, level=None):
+    """Write a profile to filename.
+
+    If compression is not given it is inferred from the file extension, so
+    "profile.nflxprofile.gz" is written gzip compressed.
+    """
+    if compression is None:
+        compression = get_compression(filename)
+    data = profile.SerializeToString()
+    with open(filename, 'wb') as f:
+        if compression is None:
+            f.write(data)
+            return
+        with _open_compressed(f, compression, level) as stream:
+            view = memoryview(data)
+            for offset in range(0, len(view), CHUNK_SIZE):
+                stream.write(view[offset:offset + CHUNK_SIZE])
@@ -0,0 +1,149 @@
+"""Registries of lazily imported converters and stack processors, extendable by plugins."""
+
+__ALL__ = ['LazyRegistry', 'load_object', 'INPUT_FORMATS', 'get_input_format']
+
+import collections.abc
+import functools
+import importlib
+import json
+
+from nflxprofile.profile_io import PROFILE_EXTENSIONS
+
+FOLDED_EXTENSIONS = ('.folded', '.collapsed')
+CHUNKED_EXTENSIONS = ('.nflxprofile-chunked',)
+PPROF_EXTENSIONS = ('.pprof', '.pprof.gz', '.pb.gz')
+
+
+def load_object(reference):
+    """Import a 'module:attribute' reference and return the attribute."""
+    module_name, _, attribute = reference.partition(':')
+    value = importlib.import_module(module_name)
+    for name in attribute.split('.') if attribute else []:
+        value = getattr(value, name)
+    return value
+
+
+def _get_entry_points(group):
+    # importlib.metadata is slow to import, only load it when plugins are looked up
+    try:
+        from importlib import metadata
+    except ImportError:
+        # python < 3.8, entry point plugins are not supported
+        return []
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=group))
+    # python < 3.10 returns a {group: entry points} dict
+    return list(entry_points.get(group, []))
+
+
+class LazyRegistry(collections.abc.Mapping):
+    """Read-only mapping of names to objects, imported on first lookup.
+
+    builtins maps names to 'module:attribute' references (or to the objects
+    themselves). Entry points of group are only scanned when a name is not a
+    builtin or when the registry is iterated, and can't shadow builtins.
+    """
+
+    def __init__(self, builtins, group=None):
+        """Constructor."""
+        self.builtins = dict(builtins)
+        self.group = group
+        self._loaded = {}
+        self._entry_points = None
+
+    def _get_entry_points(self):
+        if self._entry_points is None:
+            self._entry_points = {}
+            if self.group is not None:
+                for entry_point in _get_entry_points(self.group):
+                    if entry_point.name not in self.builtins:
+                        self._entry_points.setdefault(entry_point.name, entry_point)
+        return self._entry_points
+
+    def __getitem__(self, name):
+        if name in self._loaded:
+            return self._loaded[name]
+        if name in self.builtins:
+            value = self.builtins[name]
+            if isinstance(value, str):
+                value = load_object(value)
+        else:
+            entry_point = self._get_entry_points().get(name)
+            if entry_point is None:
+                raise KeyError(name)
+            value = entry_point.load()
+        self._loaded[name] = value
+        return value
+
+    def __contains__(self, name):
+        # checked without importing anything
+        return name in self.builtins or name in self._get_entry_points()
+
+    def __iter__(self):
+        yield from self.builtins
+        yield from self._get_entry_points()
+
+    def __len__(self):
+        return len(self.builtins) + len(self._get_entry_points())
+
+
+def _parse_v8(filenames, **extra_options):
+    from nflxprofile.convert.v8_cpuprofile import parse
+
+    profiles = []
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            profiles.append(json.loads(f.read()))
+    return parse(profiles, **extra_options)
+
+
+def _parse_folded(filenames, **extra_options):
+    from nflxprofile.convert.folded import parse
+
+    with open(filenames[0], 'r') as f:
+        return parse(f, **extra_options)
+
+
+def _parse_pprof(filenames, **extra_options):
+    from nflxprofile.convert.pprof import parse
+
+    with open(filenames[0], 'rb') as f:
+        return parse(f.read(), **extra_options)
+
+
+def _load_profile(filenames, **extra_options):
+    from nflxprofile.profile_io import load
+
+    # recompress an existing profile
+    return load(filenames[0])
+
+
+# functions converting a list of input files into a profile, plugins can add
+# formats with entry points in the nflxprofile.input_formats group
+INPUT_FORMATS = LazyRegistry({
+    'v8': _parse_v8,
+    'folded': _parse_folded,
+    'pprof': _parse_pprof,
+    'nflxprofile': _load_profile,
+}, 'nflxprofile.input_formats')
+
+
+def get_input_format(input_format, input_files=[]):
+    """Return input_format, or the format inferred from the input file names if it's None."""
+    if input_format is None:
+        if functools.reduce(lambda a, b: a and b.endswith(".cpuprofile"), input_files, True):
+            input_format = 'v8'
+        elif len(input_files) != 1:
+            raise ValueError("Unable to infer input type. Please use --input-format")
+        elif input_files[0].endswith(PROFILE_EXTENSIONS):
+            input_format = 'nflxprofile'
+        elif input_files[0].endswith(FOLDED_EXTENSIONS):
+            input_format = 'folded'
+        elif input_files[0].endswith(CHUNKED_EXTENSIONS):
+            input_format = 'chunked'
+        elif input_files[0].endswith(PPROF_EXTENSIONS):
+            input_format = 'pprof'
+        else:
+            input_format = 'perf'
+    return input_format
@@ -0,0 +1,116 @@
+"""Series of flame graphs over a sliding time window."""
+
+__ALL__ = ['get_flame_graph_series']
+
+import itertools
+import math
+
+from nflxprofile import ticks
+from nflxprofile.flamegraph import StackProcessor, _get_sample_filters, _get_sample_mask, _get_samples_value
+from nflxprofile.flamegraph import _get_stack_resolver, _has_aggregated_samples
+from nflxprofile.lazy_flamegraph import LazyFlameGraph
+
+
+def _get_sample_order(profile):
+    """Return the absolute time of each sample and the sample indexes in time order."""
+    # accumulated as in RangeSampleFilter, so window bounds match get_flame_graph ranges
+    times = list(itertools.accumulate(itertools.chain([profile.start_time], profile.time_deltas)))[1:]
+    order = range(len(times))
+    if any(previous > current for previous, current in zip(times, times[1:])):
+        order = sorted(order, key=times.__getitem__)
+    return times, order
+
+
+def get_flame_graph_series(profile, pid_comm, window, step, **args):
+    """Generate flame graphs of a window sliding over the profile.
+
+    Yields one dict per step, with the range_start and range_end of the
+    window (in seconds relative to the start of the profile, as in
+    get_flame_graph) and its flame_graph. With the deltas option, frames
+    carry a list of changes instead, one {'path', 'value'} per node whose
+    self value changed since the previous frame, where path is the list of
+    (name, libtype, file) frames below root, so nodes with the same names but
+    other libtypes or files aren't mixed up. libtype is '' with
+    ignore_libtype, and file is '' when unknown.
+
+    Samples are walked once in time order: samples entering the window are
+    added to a running trie and samples leaving it are subtracted. The series
+    covers range_start to range_end when given, the whole profile otherwise.
+    Other get_flame_graph options (filters, stack processors, weights) apply.
+    """
+    if _has_aggregated_samples(profile):
+        raise ValueError("Profile has no per-sample times, can't generate a series")
+    if window <= 0 or step <= 0:
+        raise ValueError("window and step must be positive")
+    if ticks.has_tick_runs(profile):
+        profile = ticks.expand(profile)
+
+    stack_processor_class = args.get("stack_processor", StackProcessor)
+    deltas = args.get("deltas", False)
+    weighted = args.get("use_sample_value", False) or args.get("weighted", False)
+
+    origin = math.floor(profile.start_time)
+    range_start = args.get("range_start", None)
+    range_end = args.get("range_end", None)
+    if range_start is None or range_end is None:
+        range_start = 0
+        range_end = profile.end_time - origin
+
+    # every filter but the range one applies to the whole series
+    sample_filters = _get_sample_filters(profile, **dict(args, range_start=None, range_end=None))
+    mask, other_filters = _get_sample_mask(sample_filters)
+    samples_value = _get_samples_value(profile) if weighted else None
+    samples = profile.samples
+    times, order = _get_sample_order(profile)
+
+    def is_kept(index):
+        if mask is not None and not mask[index]:
+            return False
+        for sample_filter in other_filters:
+            if sample_filter.should_skip(samples[index], index, times[index]):
+                return False
+        return True
+
+    get_stack = _get_stack_resolver(profile, pid_comm, **args)
+    stack_processor = stack_processor_class(None, profile, **args)
+    flame_graph = LazyFlameGraph(args.get("ignore_libtype", False))
+    # node id -> trie leaf, stacks are processed once per node id
+    leaves = {}
+    changes = {}
+
+    def update(index, sign):
+        if not is_kept(index):
+            return
+        node_id = samples[index]
+        leaf = leaves.get(node_id)
+        if leaf is None:
+            leaf = flame_graph.add(stack_processor.process_stack(get_stack(node_id), 0), 0)
+            leaves[node_id] = leaf
+        value = sign * (1 if samples_value is None else samples_value[index])
+        flame_graph.add_value(leaf, value)
+        changes[leaf] = changes.get(leaf, 0) + value
+
+    entering = leaving = 0
+    for step_index in itertools.count():
+        frame_start = range_start + step_index * step
+        if frame_start >= range_end:
+            break
+        frame_end = min(frame_start + window, range_end)
+        while leaving < len(order) and times[order[leaving]] < origin + frame_start:
+            if leaving < entering:
+                update(order[leaving], -1)
+            leaving += 1
+        entering = max(entering, leaving)
+        while entering < len(order) and times[order[entering]] < origin + frame_end:
+            update(order[entering], 1)
+            entering += 1
+
+        frame = {'range_start': frame_start, 'range_end': frame_end}
+        if deltas:
+            frame['changes'] = [{'path': flame_graph.get_path(leaf, keys=True), 'value': value}
+                                for leaf, value in changes.items() if value]
+        else:
+            flame_graph.update_totals()
+            frame['flame_graph'] = flame_graph.to_dict(skip_empty=True)
+        changes = {}
+        yield frame
@@ -0,0 +1,168 @@
+"""Integer tick, run-length encoded sample times and ids.
+
+Profiles with the has_tick_runs param store their samples this way:
+
+- time_deltas is empty. Sample times are integer ticks of tick_resolution
+  seconds since start_time, stored as the run-length encoded deltas
+  between consecutive samples: tick_deltas[i] repeated tick_delta_runs[i]
+  times.
+- samples and the other per-sample columns (samples_cpu, samples_pid,
+  samples_tid, samples_value) hold one entry per run of consecutive
+  identical samples, repeated sample_runs[i] times.
+
+Sampling profilers have near-constant intervals and often repeat the same
+stack, so both run lists are short. Readers can expand the profile (expand),
+iterate it lazily (iter_samples) or work on the runs (get_index_range).
+"""
+
+__ALL__ = ['has_tick_runs', 'encode', 'expand', 'iter_samples', 'get_index_range']
+
+import itertools
+import math
+
+from nflxprofile import nflxprofile_pb2
+
+RUN_COLUMNS = ['samples', 'samples_cpu', 'samples_pid', 'samples_tid', 'samples_value']
+
+
+def has_tick_runs(profile):
+    """Check if profile samples are tick and run-length encoded."""
+    return 'has_tick_runs' in profile.params and profile.params['has_tick_runs'] == 'true'
+
+
+def _encode_runs(values):
+    """Return (values, run lengths) of consecutive equal values."""
+    run_values = []
+    runs = []
+    for value, group in itertools.groupby(values):
+        run_values.append(value)
+        runs.append(sum(1 for _ in group))
+    return run_values, runs
+
+
+def encode(profile, tick_resolution):
+    """Encode the samples of profile in place, with ticks of tick_resolution seconds.
+
+    Times are rounded to the closest tick from the start of the profile,
+    so rounding errors don't accumulate. Encoding is lossy: raises
+    ValueError if rounding changes the delta between two samples by more
+    than half a tick, tick_resolution is too coarse for the profile then.
+    """
+    if has_tick_runs(profile):
+        return profile
+    if len(profile.time_deltas) != len(profile.samples):
+        raise ValueError("Profile has no time_deltas column, can't encode it")
+    columns = [column for column in RUN_COLUMNS if len(getattr(profile, column)) == len(profile.samples)]
+
+    times = itertools.accumulate(itertools.chain([profile.start_time], profile.time_deltas))
+    next(times)
+    ticks = [int(round((time - profile.start_time) / tick_resolution)) for time in times]
+    tick_deltas = [current - previous for previous, current in zip([0] + ticks, ticks)]
+    # with a small margin for floating point errors on exact multiples of tick_resolution
+    max_error = tick_resolution * (0.5 + 1e-6)
+    for index, (tick_delta, time_delta) in enumerate(zip(tick_deltas, profile.time_deltas)):
+        if abs(tick_delta * tick_resolution - time_delta) > max_error:
+            raise ValueError("Sample %d moves by more than half a tick of %g seconds, use a finer tick_resolution"
+                             % (index, tick_resolution))
+    tick_deltas, tick_delta_runs = _encode_runs(tick_deltas)
+
+    rows, sample_runs = _encode_runs(zip(*(getattr(profile, column) for column in columns)))
+    for column, values in zip(columns, zip(*rows) if rows else [[] for _ in columns]):
+        profile.ClearField(column)
+        getattr(profile, column).extend(values)
+
+    profile.ClearField('time_deltas')
+    profile.tick_resolution = tick_resolution
+    profile.tick_deltas.extend(tick_deltas)
+    profile.tick_delta_runs.extend(tick_delta_runs)
+    profile.sample_runs.extend(sample_runs)
+    profile.params['has_tick_runs'] = 'true'
+    return profile
+
+
+def _iter_ticks(profile):
+    """Yield the tick of every sample."""
+    tick = 0
+    for tick_delta, run in zip(profile.tick_deltas, profile.tick_delta_runs):
+        for _ in range(run):
+            tick += tick_delta
+            yield tick
+
+
+def iter_samples(profile):
+    """Yield (sample, time, run_index) for every sample, without expanding the profile.
+
+    run_index is the index of the sample's run, which holds its other columns
+    (e.g. profile.samples_cpu[run_index]).
+    """
+    start_time = profile.start_time
+    tick_resolution = profile.tick_resolution
+    ticks = _iter_ticks(profile)
+    for run_index, (sample, run) in enumerate(zip(profile.samples, profile.sample_runs)):
+        for tick in itertools.islice(ticks, run):
+            yield sample, start_time + tick * tick_resolution, run_index
+
+
+def expand(profile):
+    """Return a copy of profile with plain, one entry per sample, columns."""
+    expanded = nflxprofile_pb2.Profile()
+    expanded.CopyFrom(profile)
+    if not has_tick_runs(profile):
+        return expanded
+    for field in ['tick_resolution', 'tick_deltas', 'tick_delta_runs', 'sample_runs'] + RUN_COLUMNS:
+        expanded.ClearField(field)
+    del expanded.params['has_tick_runs']
+
+    runs = profile.sample_runs
+    for column in RUN_COLUMNS:
+        values = getattr(profile, column)
+        if len(values) == len(runs):
+            getattr(expanded, column).extend(
+                itertools.chain.from_iterable(itertools.repeat(value, run) for value, run in zip(values, runs)))
+
+    previous_time = profile.start_time
+    time_deltas = []
+    for tick in _iter_ticks(profile):
+        time = profile.start_time + tick * profile.tick_resolution
+        time_deltas.append(time - previous_time)
+        previous_time = time
+    expanded.time_deltas.extend(time_deltas)
+    return expanded
+
+
+def _count_before(profile, bound):
+    """Count the samples before time bound, with sorted sample times."""
+    start_time = profile.start_time
+    tick_resolution = profile.tick_resolution
+    # last tick before bound, corrected for floating point rounding of the division
+    bound_tick = math.ceil((bound - start_time) / tick_resolution) - 1
+    while start_time + bound_tick * tick_resolution >= bound:
+        bound_tick -= 1
+    while start_time + (bound_tick + 1) * tick_resolution < bound:
+        bound_tick += 1
+    count = 0
+    tick = 0
+    for tick_delta, run in zip(profile.tick_deltas, profile.tick_delta_runs):
+        # samples of the run are at tick + tick_delta * (i + 1), i < run
+        if tick_delta == 0:
+            before = run if tick <= bound_tick else 0
+        else:
+            before = min(max((bound_tick - tick) // tick_delta, 0), run)
+        count += before
+        if before < run:
+            break
+        tick += tick_delta * run
+    return count
+
+
+def get_index_range(profile, range_start, range_end):
+    """Return the (first, last) sample indexes with times in [range_start, range_end).
+
+    Times are absolute, in seconds. The range is computed from the tick runs
+    alone, without expanding them. Returns None if samples are not sorted by
+    time.
+    """
+    if any(tick_delta < 0 for tick_delta in profile.tick_deltas):
+        return None
+    first = _count_before(profile, range_start)
+    return first, max(_count_before(profile, range_end), first)
@@ -0,0 +1,173 @@
+"""Streaming JSON serialization of flame graph trees."""
+
+__ALL__ = ['dump_tree', 'iterencode_tree', 'write_tree']
+
+import gc
+import gzip
+import json
+
+# Siblings with at most this many containers in total are encoded in one call
+# to the C accelerated json.dumps, bigger subtrees are streamed level by level.
+SUBTREE_LIMIT = 1024
+
+BUFFER_SIZE = 64 * 1024
+
+
+def _count_containers(obj, limit):
+    """Count the dicts and lists of obj, itself included, stopping once past limit.
+
+    The tree is walked level by level with gc.get_referents, so containers
+    are visited from C rather than one by one from Python.
+    """
+    count = 0
+    level = [obj]
+    while level:
+        count += len(level)
+        if count > limit:
+            break
+        level = [referent for referent in gc.get_referents(*level) if isinstance(referent, (dict, list))]
+    return count
+
+
+def _get_sizes(tree, limit):
+    """Return {id(container): count of its dicts and lists} for the children of the large containers of tree.
+
+    Containers with more than limit dicts and lists are large. Counts are
+    computed once, bottom-up, in a single walk of the tree.
+    """
+    # containers in breadth first order, parents before their children
+    order = [tree]
+    parents = [-1]
+    index = 0
+    while index < len(order):
+        current = order[index]
+        for value in (current.values() if isinstance(current, dict) else current):
+            if isinstance(value, (dict, list)):
+                order.append(value)
+                parents.append(index)
+        index += 1
+    sizes = [1] * len(order)
+    for index in range(len(order) - 1, 0, -1):
+        sizes[parents[index]] += sizes[index]
+    return {id(order[index]): sizes[index] for index in range(1, len(order)) if sizes[parents[index]] > limit}
+
+
+def _encode_key(key):
+    if isinstance(key, str):
+        return json.dumps(key)
+    # same coercion as json.dumps for non string keys (numbers, booleans, None)
+    return json.dumps({key: 0})[1:-4]
+
+
+def _iter_batches(container, limit, sizes=None):
+    """Yield the entries of container, encoded or to encode.
+
+    Runs of small entries are yielded encoded together, as (string, None),
+    large ones as (key prefix, value). Entry sizes are looked up in sizes
+    (see _get_sizes), or counted.
+    """
+    is_dict = isinstance(container, dict)
+    batch = {} if is_dict else []
+    batch_size = 0
+    for key, value in (container.items() if is_dict else enumerate(container)):
+        if not isinstance(value, (dict, list)):
+            size = 0
+        elif sizes is not None:
+            size = sizes[id(value)]
+        else:
+            size = _count_containers(value, limit)
+        # non string keys are coerced, they could collide with string ones in a batch
+        batchable = size <= limit and (not is_dict or isinstance(key, str))
+        if batch and (not batchable or batch_size + size > limit):
+            yield json.dumps(batch)[1:-1], None
+            batch = {} if is_dict else []
+            batch_size = 0
+        if not batchable:
+            prefix = _encode_key(key) + ': ' if is_dict else ''
+            if size <= limit:
+                yield prefix + json.dumps(value), None
+            else:
+                yield prefix, value
+            continue
+        if is_dict:
+            batch[key] = value
+        else:
+            batch.append(value)
+        batch_size += size
+    if batch:
+        yield json.dumps(batch)[1:-1], None
+
+
+def iterencode_tree(tree, subtree_limit=SUBTREE_LIMIT):
+    """Yield chunks of the JSON encoding of tree.
+
+    The concatenated chunks are identical to json.dumps(tree). Runs of
+    siblings with at most subtree_limit containers in total are encoded in
+    one json.dumps call, so the largest chunk is bounded regardless of the
+    size of the tree.
+
+    The children of the root are sized by counting their containers, up to
+    subtree_limit, which is cheap for wide trees of small subtrees. Subtrees
+    below a large child are sized once, bottom-up, so deep trees aren't
+    counted again at every level.
+    """
+    if not isinstance(tree, (dict, list)) or _count_containers(tree, subtree_limit) <= subtree_limit:
+        yield json.dumps(tree)
+        return
+
+    def open_container(container, sizes):
+        brackets = ('{', '}') if isinstance(container, dict) else ('[', ']')
+        return brackets, _iter_batches(container, subtree_limit, sizes)
+
+    (opening, closing), batches = open_container(tree, None)
+    yield opening
+    # (closing, batches, first, sizes) of the containers being encoded
+    stack = [[closing, batches, True, None]]
+    while stack:
+        entry = stack[-1]
+        closing, batches, first, sizes = entry
+        chunk, value = next(batches, (None, None))
+        if chunk is None:
+            stack.pop()
+            yield closing
+            continue
+        if not first:
+            yield ', '
+        entry[2] = False
+        if value is None:
+            yield chunk
+            continue
+        if sizes is None:
+            sizes = _get_sizes(value, subtree_limit)
+        (opening, value_closing), value_batches = open_container(value, sizes)
+        yield chunk + opening
+        stack.append([value_closing, value_batches, True, sizes])
+
+
+def dump_tree(tree, f, subtree_limit=SUBTREE_LIMIT):
+    """Write the JSON encoding of tree to the text file object f.
+
+    Output is identical to f.write(json.dumps(tree)), but it's written in
+    chunks, without building the whole string in memory.
+    """
+    buffer = []
+    buffered = 0
+    for chunk in iterencode_tree(tree, subtree_limit):
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= BUFFER_SIZE:
+            f.write(''.join(buffer))
+            buffer = []
+            buffered = 0
+    if buffer:
+        f.write(''.join(buffer))
+
+
+def write_tree(tree, filename):
+    """Write tree as JSON to filename, gzip compressed if it ends in .gz."""
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'wt', encoding='ascii') as f:
+            dump_tree(tree, f)
+    else:
+        with open(filename, 'w') as f:
+            dump_tree(tree, f)
@@ -0,0 +1,349 @@
+"""Watch a directory and convert the profiles dropped into it."""
+
+__ALL__ = ['ConversionIndex', 'ConversionDaemon']
+
+import concurrent.futures
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from nflxprofile.registry import INPUT_FORMATS, get_input_format
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# files being written, by the daemon or by whoever drops inputs, ignored until renamed
+TEMPORARY_SUFFIX = '.tmp'
+# seconds between checks of the stop event while waiting for a conversion slot
+SLOT_TIMEOUT = 0.1
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def _hash_file(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _log_stats(stats):
+    logger.info("conversion stats: %s", json.dumps(stats, sort_keys=True))
+
+
+class ConversionIndex:
+    """Content hashes of the inputs already converted, kept in a local file.
+
+    The file has one JSON object per line, appended as conversions finish,
+    so recording a conversion doesn't rewrite the index. Inputs are also
+    indexed by path, size and modification time, so unchanged files are
+    skipped without hashing them again.
+    """
+
+    def __init__(self, filename=None):
+        """Constructor, loading filename if it exists. Without filename the index is kept in memory."""
+        self.filename = filename
+        self.hashes = {}
+        self.inputs = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename, 'r') as f:
+                for line in f:
+                    try:
+                        self._add(json.loads(line))
+                    except ValueError:
+                        # partially written last line
+                        continue
+
+    def _add(self, entry):
+        self.hashes[entry['hash']] = entry['output']
+        self.inputs[entry['input']] = (entry['size'], entry['mtime_ns'])
+
+    def __contains__(self, digest):
+        return digest in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def is_unchanged(self, filename, stat):
+        """Check if filename was converted and hasn't changed since."""
+        return self.inputs.get(filename) == (stat.st_size, stat.st_mtime_ns)
+
+    def add(self, digest, filename, stat, output):
+        """Record the conversion of filename, with content hash digest, into output."""
+        entry = {'hash': digest, 'input': filename, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'output': output}
+        self._add(entry)
+        if self.filename is not None:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+class _Inotify:
+    """Minimal inotify wrapper, through ctypes, reporting files written or moved into a directory."""
+
+    def __init__(self, directory):
+        """Constructor, raises OSError (or AttributeError without inotify in libc) if unavailable."""
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        watch = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed for %s" % directory)
+
+    def read(self, timeout):
+        """Return the names of the files written within timeout seconds, or None if events were lost."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _convert(input_format, filename, output, extra_options):
+    """Convert filename into the profile output, in a worker process.
+
+    The profile is written to a temporary file renamed to output, so output
+    is never seen partially written.
+    """
+    from nflxprofile.profile_io import dump
+
+    temporary_output = output + TEMPORARY_SUFFIX
+    try:
+        dump(INPUT_FORMATS[input_format]([filename], **extra_options), temporary_output)
+        os.replace(temporary_output, output)
+    except BaseException:
+        if os.path.exists(temporary_output):
+            os.remove(temporary_output)
+        raise
+
+
+class ConversionDaemon:
+    """Convert the profiles dropped into a directory, once each.
+
+    Files are converted with the CLI input formats (plugins included),
+    picked by extension, on a pool of worker processes. At most max_pending
+    conversions are queued or running, submitting more blocks. Inputs whose
+    content hash is in the index are skipped, so restarting over an archive
+    only converts new files. nflxprofile files are not inputs by default, so
+    outputs can be written to the watched directory: the daemon's own
+    outputs, temporary files and files of formats not selected as inputs are
+    ignored, only files no converter supports are counted as unsupported.
+    """
+
+    def __init__(self, directory, output_directory, workers=None, max_pending=None, index_file=None,
+                 input_formats=None, **extra_options):
+        """Constructor, extra_options are passed to the converters."""
+        self.directory = directory
+        self.output_directory = output_directory
+        self.workers = workers or os.cpu_count() or 1
+        self.index = ConversionIndex(index_file)
+        self.input_formats = input_formats
+        self.extra_options = extra_options
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        # queued plus running conversions
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * self.workers)
+        self.lock = threading.Lock()
+        # notified when a conversion finishes
+        self.finished = threading.Condition(self.lock)
+        # content hash -> future of the conversions in flight
+        self.pending = {}
+        # file name -> (size, mtime) when it was last handled or seen
+        self.handled = {}
+        self.candidates = {}
+        # outputs of this daemon, never inputs
+        self.outputs = set()
+        # set to stop, see run
+        self.stop_event = threading.Event()
+        self.started = time.time()
+        self.counters = {'converted': 0, 'skipped': 0, 'failed': 0, 'unsupported': 0, 'bytes': 0}
+        self.errors = {}
+
+    def _is_input_format(self, input_format):
+        if self.input_formats is not None:
+            return input_format in self.input_formats
+        return input_format != 'nflxprofile' and input_format in INPUT_FORMATS
+
+    def submit(self, name):
+        """Queue the file name of the watched directory for conversion, unless it is known.
+
+        Returns the future of the conversion, or None if the file is skipped.
+        Waiting for a conversion slot is given up once stop_event is set.
+        """
+        if name.startswith('.') or name.endswith(TEMPORARY_SUFFIX):
+            return None
+        path = os.path.join(self.directory, name)
+        if path in self.outputs:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if not os.path.isfile(path) or self.handled.get(name) == (stat.st_size, stat.st_mtime_ns):
+            return None
+        self.handled[name] = (stat.st_size, stat.st_mtime_ns)
+
+        input_format = get_input_format(None, [path])
+        if not self._is_input_format(input_format):
+            if input_format not in INPUT_FORMATS:
+                with self.lock:
+                    self.counters['unsupported'] += 1
+            return None
+        if self.index.is_unchanged(path, stat):
+            with self.lock:
+                self.counters['skipped'] += 1
+            return None
+        digest = _hash_file(path)
+        with self.lock:
+            if digest in self.index or digest in self.pending:
+                self.counters['skipped'] += 1
+                return None
+
+        while not self.slots.acquire(timeout=SLOT_TIMEOUT):
+            if self.stop_event.is_set():
+                # not handled, so it is submitted again by a later scan
+                del self.handled[name]
+                return None
+        stem = name.split('.', 1)[0] or name
+        output = os.path.join(self.output_directory, '%s-%s.nflxprofile' % (stem, digest[:12]))
+        self.outputs.add(output)
+        try:
+            future = self.executor.submit(_convert, input_format, path, output, self.extra_options)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending[digest] = future
+        future.add_done_callback(lambda future: self._done(future, digest, path, stat, output))
+        return future
+
+    def _done(self, future, digest, path, stat, output):
+        self.slots.release()
+        with self.lock:
+            del self.pending[digest]
+            error = future.exception()
+            if error is not None:
+                self.counters['failed'] += 1
+                self.errors[path] = repr(error)
+            else:
+                self.index.add(digest, path, stat, output)
+                self.counters['converted'] += 1
+                self.counters['bytes'] += stat.st_size
+            self.finished.notify_all()
+
+    def scan(self, stable_only=False):
+        """Submit the files of the directory which changed since they were handled.
+
+        With stable_only, as used when polling, a file is only submitted once
+        its size and modification time are the same on two scans in a row, so
+        files still being written are not converted.
+        """
+        for name in sorted(os.listdir(self.directory)):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            key = (stat.st_size, stat.st_mtime_ns)
+            if self.handled.get(name) == key:
+                continue
+            if stable_only and self.candidates.get(name) != key:
+                self.candidates[name] = key
+                continue
+            self.candidates.pop(name, None)
+            self.submit(name)
+
+    def wait(self):
+        """Wait for the conversions in flight to be recorded."""
+        with self.lock:
+            while self.pending:
+                self.finished.wait()
+
+    def run(self, stop_event=None, poll_interval=1.0, use_inotify=True, stats_interval=None, report=None):
+        """Convert existing files, then new ones until stop_event is set.
+
+        New files are found with inotify when available, by polling the
+        directory every poll_interval seconds otherwise. With stats_interval,
+        report is called with get_stats every stats_interval seconds, by
+        default the stats are logged.
+        """
+        if report is None:
+            report = _log_stats
+        if stop_event is not None:
+            self.stop_event = stop_event
+        stop_event = self.stop_event
+        watcher = None
+        if use_inotify:
+            try:
+                watcher = _Inotify(self.directory)
+            except (OSError, AttributeError):
+                watcher = None
+        # watch before the first scan, so no file is missed in between
+        self.scan()
+        last_report = time.time()
+        try:
+            while not stop_event.is_set():
+                if watcher is not None:
+                    names = watcher.read(poll_interval)
+                    if names is None:
+                        # events were dropped, fall back to a full scan
+                        self.scan()
+                    for name in names or []:
+                        self.submit(name)
+                else:
+                    stop_event.wait(poll_interval)
+                    self.scan(stable_only=True)
+                if stats_interval is not None and time.time() - last_report >= stats_interval:
+                    report(self.get_stats())
+                    last_report = time.time()
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def get_stats(self):
+        """Return the queue depth, counters and throughput since the daemon started."""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['pending'] = len(self.pending)
+        elapsed = time.time() - self.started
+        stats['indexed'] = len(self.index)
+        stats['elapsed'] = elapsed
+        stats['files_per_second'] = stats['converted'] / elapsed if elapsed else 0.0
+        stats['bytes_per_second'] = stats['bytes'] / elapsed if elapsed else 0.0
+        return stats
+
+    def close(self):
+        """Wait for the conversions in flight and stop the workers."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,101 @@
+"""Helpers to scan the protobuf wire format without decoding messages."""
+
+__ALL__ = ['read_varint', 'iter_records', 'iter_fields', 'count_varints', 'iter_packed_varints',
+           'encode_varint', 'encode_field']
+
+import struct
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+DOUBLE = struct.Struct('<d')
+
+# every byte with the continuation bit set, deleted to count the bytes ending varints
+_CONTINUATION_BYTES = bytes(range(0x80, 0x100))
+
+
+def read_varint(data, pos):
+    """Decode the varint at data[pos], returning (value, position after it)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_records(data, start=0, end=None):
+    """Yield (field_number, wire_type, value, record_start, record_end) for the fields of a message.
+
+    value is the integer for varints, and the (start, end) offsets into data
+    for length delimited, fixed64 and fixed32 fields, which are skipped
+    without being read or copied. data[record_start:record_end] is the whole
+    encoded field, key included.
+    """
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        record_start = pos
+        key, pos = read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == VARINT:
+            value, pos = read_varint(data, pos)
+            yield field_number, wire_type, value, record_start, pos
+            continue
+        if wire_type == LENGTH_DELIMITED:
+            size, pos = read_varint(data, pos)
+        elif wire_type == FIXED64:
+            size = 8
+        elif wire_type == FIXED32:
+            size = 4
+        else:
+            raise ValueError("Unsupported wire type %d at offset %d" % (wire_type, pos))
+        if pos + size > end:
+            raise ValueError("Truncated field %d at offset %d" % (field_number, pos))
+        yield field_number, wire_type, (pos, pos + size), record_start, pos + size
+        pos += size
+
+
+def iter_fields(data, start=0, end=None):
+    """Yield (field_number, wire_type, value) for the fields of a message, see iter_records."""
+    for field_number, wire_type, value, _, _ in iter_records(data, start, end):
+        yield field_number, wire_type, value
+
+
+def count_varints(data, start, end):
+    """Count the varints packed in data[start:end] without decoding them."""
+    return len(bytes(data[start:end]).translate(None, _CONTINUATION_BYTES))
+
+
+def iter_packed_varints(data, start, end):
+    """Yield the varints packed in data[start:end]."""
+    pos = start
+    while pos < end:
+        value, pos = read_varint(data, pos)
+        yield value
+
+
+def encode_varint(value):
+    """Encode an integer as a varint, negative (int64) values in two's complement."""
+    value &= 0xffffffffffffffff
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_field(field_number, wire_type, value):
+    """Encode a field, value is an integer for varints and bytes otherwise."""
+    key = encode_varint(field_number << 3 | wire_type)
+    if wire_type == VARINT:
+        return key + encode_varint(value)
+    if wire_type == LENGTH_DELIMITED:
+        return key + encode_varint(len(value)) + value
+    return key + value
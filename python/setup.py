@@ -14,6 +14,9 @@ setuptools.setup(
     url="https://github.com/Netflix/nflxprofile",
     packages=setuptools.find_packages(),
     install_requires=['protobuf>=4.21.1'],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache Software License",
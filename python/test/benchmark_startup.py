@@ -0,0 +1,79 @@
+"""Time the CLI startup, with and without the modules it imports lazily.
+
+Run from the python directory::
+
+    python -m test.benchmark_startup [--repeat N] [--top N]
+
+Each import is timed in a fresh interpreter, keeping the best of repeat
+runs. The slowest modules imported by nflxprofile.cli are then listed, from
+python -X importtime.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what importing the CLI used to load before converters and stack processors were lazy
+EAGER_MODULES = ['nflxprofile.cli', 'nflxprofile.flamegraph', 'nflxprofile.convert.v8_cpuprofile',
+                 'nflxprofile.convert.folded', 'nflxprofile.convert.pprof', 'importlib.metadata']
+
+
+def run_python(code, *options):
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    return subprocess.run([sys.executable] + list(options) + ['-c', code], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+
+def time_import(modules, repeat):
+    """Return the best wall time, in seconds, of a fresh interpreter importing modules."""
+    code = 'import ' + ', '.join(modules)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_python(code)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def get_import_times(module):
+    """Return the (cumulative microseconds, name) of the modules importing module loads, slowest first."""
+    result = run_python('import ' + module, '-X', 'importtime')
+    times = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            # header line
+            continue
+        times.append((cumulative, fields[2].strip()))
+    return sorted(times, reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the nflxprofile CLI startup.")
+    parser.add_argument('--repeat', type=int, default=10, help="runs per measurement, the best one is kept")
+    parser.add_argument('--top', type=int, default=10, help="number of slowest imports listed")
+    args = parser.parse_args(argv)
+
+    interpreter = time_import(['sys'], args.repeat)
+    lazy = time_import(['nflxprofile.cli'], args.repeat)
+    eager = time_import(EAGER_MODULES, args.repeat)
+    print("interpreter startup       %7.1f ms" % (interpreter * 1000))
+    print("import nflxprofile.cli    %7.1f ms (+%.1f ms)" % (lazy * 1000, (lazy - interpreter) * 1000))
+    print("with eager imports        %7.1f ms (+%.1f ms)" % (eager * 1000, (eager - interpreter) * 1000))
+    print()
+    print("slowest imports of nflxprofile.cli, cumulative:")
+    for cumulative, module in get_import_times('nflxprofile.cli')[:args.top]:
+        print("  %7.1f ms  %s" % (cumulative / 1000., module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import io
+import unittest
+
+from nflxprofile.butterfly import get_butterfly
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import NodeJsStackProcessor
+
+
+FOLDED = """main;a;f;g 3
+main;b;f;f;h 2
+main;f 1
+main;c 5
+"""
+
+
+def summarize(node):
+    return {child['name']: (child['value'], summarize(child)) for child in node['children']}
+
+
+class TestButterfly(unittest.TestCase):
+
+    def test_butterfly(self):
+        profile = folded.parse(io.StringIO(FOLDED))
+        butterfly = get_butterfly(profile, None, 'f', use_sample_value=True)
+
+        self.assertEqual(butterfly['value'], 6)
+        self.assertEqual(summarize(butterfly['callers']), {
+            'a': (0, {'main': (3, {})}),
+            'b': (0, {'main': (2, {})}),
+            'main': (1, {}),
+        })
+        # recursive f;f is merged into f
+        self.assertEqual(summarize(butterfly['callees']), {
+            'g': (3, {}),
+            'h': (2, {}),
+        })
+        self.assertEqual(butterfly['callees']['value'], 1)
+
+    def test_indirect_recursion(self):
+        profile = folded.parse(io.StringIO("main;f;x;f;h 2\nmain;f;f;x;f;f;h 1\n"))
+        butterfly = get_butterfly(profile, None, 'f', use_sample_value=True)
+
+        self.assertEqual(butterfly['value'], 3)
+        self.assertEqual(summarize(butterfly['callers']), {'main': (3, {})})
+        self.assertEqual(summarize(butterfly['callees']), {'x': (0, {'f': (0, {'h': (3, {})})})})
+
+    def test_argument_adaptor(self):
+        profile = folded.parse(io.StringIO("main;ArgumentsAdaptorTrampoline;f;g 2\nmain;f;g 1\n"))
+        butterfly = get_butterfly(profile, None, 'g', use_sample_value=True, stack_processor=NodeJsStackProcessor)
+        self.assertEqual(butterfly['callers']['children'][0]['extras']['argumentAdaptor'], 2)
+
+        butterfly = get_butterfly(profile, None, 'main', use_sample_value=True, stack_processor=NodeJsStackProcessor)
+        self.assertEqual(butterfly['callees']['children'][0]['extras']['argumentAdaptor'], 2)
@@ -0,0 +1,103 @@
+import io
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.chunked import ChunkedProfileReader, write_chunked
+from nflxprofile.convert.v8_cpuprofile import parse
+from nflxprofile.flamegraph import get_cpu_utilization, get_flame_graph
+
+CPUPROFILE = {
+    'startTime': 1000000,
+    'endTime': 1004000,
+    'nodes': [
+        {'id': 1, 'callFrame': {'functionName': '(root)', 'url': '', 'lineNumber': -1, 'columnNumber': -1,
+                                'scriptId': '0'}, 'children': [2, 3]},
+        {'id': 2, 'callFrame': {'functionName': 'foo', 'url': '', 'lineNumber': -1, 'columnNumber': -1,
+                                'scriptId': '0'}},
+        {'id': 3, 'callFrame': {'functionName': '(idle)', 'url': '', 'lineNumber': -1, 'columnNumber': -1,
+                                'scriptId': '0'}},
+    ],
+    'samples': [2, 2, 3, 2],
+    'timeDeltas': [1000, 1000, 1000, 1000],
+}
+
+
+def make_profile():
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = 100.5
+    profile.end_time = 106.5
+    profile.params['has_parent'] = 'true'
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    for node_id, name in enumerate(['main', 'foo', 'bar'], 1):
+        profile.nodes[node_id].function_name = name
+        profile.nodes[node_id].hit_count = 0
+        profile.nodes[node_id].parent = 1 if node_id > 1 else 0
+    # one sample every half second, alternating between foo and bar
+    for index in range(12):
+        profile.samples.append(2 + index % 2)
+        profile.time_deltas.append(0.5)
+    return profile
+
+
+class TestChunked(unittest.TestCase):
+
+    def test_range(self):
+        profile = make_profile()
+        f = io.BytesIO()
+        write_chunked(profile, f, chunk_duration=2)
+
+        reader = ChunkedProfileReader(f)
+        self.assertEqual(len(reader.chunks), 4)
+        self.assertEqual(len(reader.get_chunks(range_start=2.6, range_end=4)), 1)
+
+        for range_start, range_end in [(None, None), (2, 3), (1, 5), (3.5, 6)]:
+            expected = get_flame_graph(profile, None, range_start=range_start, range_end=range_end)
+            self.assertDictEqual(reader.get_flame_graph(None, range_start=range_start, range_end=range_end),
+                                 expected)
+
+    def test_full_load(self):
+        profile = make_profile()
+        f = io.BytesIO()
+        write_chunked(profile, f, chunk_duration=2)
+
+        loaded = ChunkedProfileReader(f).load()
+        self.assertEqual(list(loaded.samples), list(profile.samples))
+        self.assertEqual(dict(loaded.nodes), dict(profile.nodes))
+        self.assertAlmostEqual(sum(loaded.time_deltas), sum(profile.time_deltas))
+
+    def test_node_delta(self):
+        profile = make_profile()
+        profile.nodes[4].function_name = 'baz'
+        profile.nodes[4].hit_count = 0
+        profile.nodes[4].parent = 1
+        profile.nodes[5].function_name = 'unused'
+        profile.nodes[5].hit_count = 0
+        profile.nodes[5].parent = 1
+        profile.samples[-1] = 4
+        f = io.BytesIO()
+        write_chunked(profile, f, chunk_duration=2)
+
+        reader = ChunkedProfileReader(f)
+        nodes = []
+        for chunk in reader.chunks:
+            f.seek(chunk.offset)
+            nodes.append(sorted(nflxprofile_pb2.Profile.FromString(f.read(chunk.nodes_size)).nodes))
+        self.assertEqual(nodes, [[0, 1, 2, 3], [], [], [4, 5]])
+        self.assertEqual(dict(reader.load().nodes), dict(profile.nodes))
+
+    def test_cpu_utilization(self):
+        profile = parse(CPUPROFILE)
+        f = io.BytesIO()
+        write_chunked(profile, f, chunk_duration=0.002)
+
+        reader = ChunkedProfileReader(f)
+        self.assertGreater(len(reader.chunks), 1)
+        loaded = reader.load()
+        self.assertEqual(loaded.idle_sample_count, 1)
+        self.assertEqual(get_cpu_utilization(loaded), 0.75)
+        # idle samples have no time, their count is unknown for a partial load
+        partial = reader.load(0, 0.001)
+        self.assertLess(len(reader.get_chunks(0, 0.001)), len(reader.chunks))
+        self.assertFalse(partial.HasField('idle_sample_count'))
+        self.assertIsNone(get_cpu_utilization(partial))
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from nflxprofile import columns, nflxprofile_pb2
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.profile_io import dump
+
+
+class TestColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            self.profile.ParseFromString(f.read())
+        # multi-byte varints
+        self.profile.samples_value.extend(2 ** (index % 64) for index in range(len(self.profile.samples)))
+
+    def assert_columns(self, columnar):
+        for column in list(columns.VARINT_COLUMNS) + columns.DOUBLE_COLUMNS:
+            self.assertEqual(list(getattr(columnar, column)), list(getattr(self.profile, column)))
+        self.assertEqual(len(columnar.nodes), len(self.profile.nodes))
+        self.assertEqual(columnar.params, self.profile.params)
+
+    def test_load_columns(self):
+        data = self.profile.SerializeToString()
+        self.assert_columns(columns.load_columns(data))
+        with mock.patch.object(columns, 'numpy', None):
+            self.assert_columns(columns.load_columns(data))
+
+    def test_flame_graph(self):
+        columnar = columns.load_columns(self.profile.SerializeToString())
+        for args in [{}, {'cpu': 0}, {'range_start': 0, 'range_end': 1}, {'use_sample_value': True}]:
+            self.assertEqual(get_flame_graph(columnar, None, **args), get_flame_graph(self.profile, None, **args))
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ['profile.nflxprofile', 'profile.nflxprofile.gz']:
+                path = os.path.join(directory, filename)
+                dump(self.profile, path)
+                self.assert_columns(columns.load(path))
@@ -0,0 +1,54 @@
+import io
+import os
+import tempfile
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.cli import main
+from nflxprofile.compact import compact
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.profile_io import load
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_node_stack(self):
+        profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            profile.ParseFromString(f.read())
+        profile.nodes[1000].function_name = 'unused'
+        profile.nodes[1000].hit_count = 0
+
+        compacted = compact(profile)
+        self.assertEqual(sorted(compacted.nodes), list(range(len(set(profile.samples)) + 1)))
+        self.assertEqual(compacted.params['has_dense_ids'], 'true')
+        for args in [{}, {'inverted': True}, {'package_name': True}]:
+            self.assertEqual(get_flame_graph(compacted, None, **args), get_flame_graph(profile, None, **args))
+
+    def test_parent(self):
+        profile = folded.parse(io.StringIO("main;a;b 3\nmain;c 2\n"))
+        # only main;c is sampled
+        del profile.samples[:]
+        del profile.samples_value[:]
+        del profile.time_deltas[:]
+        profile.samples.append(4)
+        profile.samples_value.append(2)
+        profile.time_deltas.append(0)
+
+        compacted = compact(profile)
+        self.assertEqual([compacted.nodes[node_id].function_name for node_id in range(len(compacted.nodes))],
+                         ['root', 'main', 'c'])
+        self.assertEqual((compacted.nodes[2].parent, list(compacted.samples)), (1, [2]))
+        for args in [{}, {'inverted': True}]:
+            self.assertEqual(get_flame_graph(compacted, None, **args), get_flame_graph(profile, None, **args))
+
+    def test_cli(self):
+        profile = folded.parse(io.StringIO("main;a;b 3\nmain;c 2\n"))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'profile.nflxprofile')
+            with open(filename, 'wb') as f:
+                f.write(profile.SerializeToString())
+            output = os.path.join(directory, 'compact.nflxprofile')
+            main(['compact', filename, '--output', output])
+            self.assertEqual(load(output), compact(profile))
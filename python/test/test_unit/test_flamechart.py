@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from nflxprofile import nflxprofile_pb2, ticks
+from nflxprofile.cli import main
+from nflxprofile.convert import folded
+from nflxprofile.flamechart import get_flame_chart, get_trace_events
+from nflxprofile.profile_io import dump
+
+
+def get_profile():
+    # nodes: 1 main, 2 main;a, 3 main;a;b, 4 main;c
+    profile = folded.parse(io.StringIO("main;a;b 1\nmain;a 1\nmain;c 1\n"))
+    del profile.samples[:]
+    del profile.samples_value[:]
+    del profile.time_deltas[:]
+    profile.start_time = 100.0
+    profile.samples.extend([3, 3, 2, 4, 4, 3])
+    profile.time_deltas.extend([0.5, 1, 1, 1, 1, 1])
+    profile.samples_tid.extend([1, 1, 1, 1, 1, 2])
+    profile.params['has_samples_tid'] = 'true'
+    profile.end_time = 106.0
+    return profile
+
+
+def get_spans(flame_chart, tid):
+    frames = flame_chart['frames']
+    lane = [lane for lane in flame_chart['lanes'] if lane['tid'] == tid][0]
+    return [(frames[frame_id][0], depth, start, end, value) for frame_id, depth, start, end, value in lane['spans']]
+
+
+class TestFlameChart(unittest.TestCase):
+
+    def test_spans(self):
+        flame_chart = get_flame_chart(get_profile(), None)
+        self.assertEqual(get_spans(flame_chart, 1), [
+            ('main', 0, 0.5, 5.5, 5),
+            ('a', 1, 0.5, 3.5, 3),
+            ('b', 2, 0.5, 2.5, 2),
+            ('c', 1, 3.5, 5.5, 2),
+        ])
+        # a single sample lasts the default interval of 0
+        self.assertEqual(get_spans(flame_chart, 2), [
+            ('main', 0, 5.5, 5.5, 1),
+            ('a', 1, 5.5, 5.5, 1),
+            ('b', 2, 5.5, 5.5, 1),
+        ])
+
+    def test_options(self):
+        profile = get_profile()
+        flame_chart = get_flame_chart(profile, None, interval=0.25, max_gap=1.5, range_start=0, range_end=5)
+        self.assertEqual(get_spans(flame_chart, 1)[0], ('main', 0, 0.5, 4.75, 5))
+        profile.time_deltas[3] = 2
+        flame_chart = get_flame_chart(profile, None, interval=0.25, max_gap=1.5)
+        self.assertEqual([span[:4] for span in get_spans(flame_chart, 1)], [
+            ('main', 0, 0.5, 2.75),
+            ('a', 1, 0.5, 2.75),
+            ('b', 2, 0.5, 2.5),
+            ('main', 0, 4.5, 5.75),
+            ('c', 1, 4.5, 5.75),
+        ])
+
+    def test_tick_runs(self):
+        profile = get_profile()
+        flame_chart = get_flame_chart(profile, None)
+        roots = [span for lane in flame_chart['lanes'] for span in lane['spans'] if span[1] == 0]
+        self.assertEqual(sum(span[4] for span in roots), len(profile.samples))
+        encoded = nflxprofile_pb2.Profile()
+        encoded.CopyFrom(profile)
+        ticks.encode(encoded, 0.5)
+        self.assertEqual(get_flame_chart(encoded, None), flame_chart)
+
+    def test_trace_events(self):
+        trace = get_trace_events(get_flame_chart(get_profile(), None), {0: 'node'})
+        events = trace['traceEvents']
+        self.assertEqual(events[0], {'name': 'process_name', 'ph': 'M', 'pid': 0, 'tid': 1,
+                                     'args': {'name': 'node'}})
+        self.assertEqual(events[1], {'name': 'main', 'cat': 'default', 'ph': 'X', 'ts': 0.5e6, 'dur': 5e6,
+                                     'pid': 0, 'tid': 1, 'args': {'value': 5}})
+        self.assertEqual(len(events), 8)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'profile.nflxprofile')
+            output = os.path.join(tmpdir, 'trace.json')
+            dump(get_profile(), filename)
+            main(['--output-format', 'trace', '--output', output, filename])
+            with open(output) as f:
+                self.assertEqual(len(json.load(f)['traceEvents']), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import io
+import unittest
+
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import get_flame_graph
+
+
+FOLDED = """main;foo;bar 3
+main;foo;baz_[k] 2
+main;qux 1
+main;foo;bar 4
+"""
+
+
+class TestFolded(unittest.TestCase):
+
+    def test_parse(self):
+        profile = folded.parse(io.StringIO(FOLDED))
+
+        # root + main, foo, bar, baz, qux
+        self.assertEqual(len(profile.nodes), 6)
+        self.assertEqual(len(profile.samples), 3)
+        self.assertEqual(sum(profile.samples_value), 10)
+
+        fg = get_flame_graph(profile, None, use_sample_value=True)
+        main = fg['children'][0]
+        self.assertEqual(main['name'], 'main')
+        foo = main['children'][0]
+        self.assertEqual([(c['name'], c['libtype'], c['value']) for c in foo['children']],
+                         [('bar', '', 7), ('baz', 'kernel', 2)])
+
+    def test_round_trip(self):
+        profile = folded.parse(io.StringIO(FOLDED))
+        out = io.StringIO()
+        folded.dump(profile, out)
+        self.assertEqual(sorted(out.getvalue().splitlines()),
+                         ['main;foo;bar 7', 'main;foo;baz_[k] 2', 'main;qux 1'])
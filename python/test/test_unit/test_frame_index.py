@@ -0,0 +1,78 @@
+import gc
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.columns import ColumnarProfile
+from nflxprofile.flamegraph import JavaStackProcessor, RuleStackProcessor, _frame_index_cache, get_flame_graph
+from nflxprofile.flamegraph import get_frame_index
+
+
+def make_profile():
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = profile.end_time = 0
+    profile.params['has_parent'] = 'true'
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    names = ['Lcom/netflix/Main;::run', 'Ljava/util/HashMap;::resize', 'Ljava/util/HashMap;::put', 'Lfoo/Bar;::baz']
+    parents = [0, 1, 2, 1]
+    for node_id, (name, parent) in enumerate(zip(names, parents), 1):
+        profile.nodes[node_id].function_name = name
+        profile.nodes[node_id].hit_count = 0
+        profile.nodes[node_id].libtype = 'jit'
+        profile.nodes[node_id].parent = parent
+    for sample in [2, 3, 3, 4]:
+        profile.samples.append(sample)
+        profile.time_deltas.append(0)
+    return profile
+
+
+class TestFrameIndex(unittest.TestCase):
+
+    def test_index(self):
+        profile = ColumnarProfile(make_profile(), {})
+        frame_index = get_frame_index(profile, stack_processor=JavaStackProcessor)
+        self.assertIs(frame_index, get_frame_index(profile, stack_processor=JavaStackProcessor))
+        self.assertEqual(frame_index.find('java.util.HashMap::resize'), {2, 3})
+        self.assertEqual(frame_index.search('^foo'), {4})
+
+        # the cache doesn't keep profiles alive
+        del profile
+        gc.collect()
+        self.assertEqual(len(_frame_index_cache), 0)
+
+    def test_message_cache(self):
+        profile = make_profile()
+        frame_index = get_frame_index(profile, stack_processor=JavaStackProcessor)
+        self.assertIs(frame_index, get_frame_index(profile, stack_processor=JavaStackProcessor))
+        self.assertIsNot(frame_index, get_frame_index(make_profile(), stack_processor=JavaStackProcessor))
+
+        # processor options are part of the key
+        first = get_frame_index(profile, stack_processor=RuleStackProcessor,
+                                rules=[{'action': 'group', 'pattern': 'HashMap', 'replacement': 'hashmap'}])
+        second = get_frame_index(profile, stack_processor=RuleStackProcessor,
+                                 rules=[{'action': 'group', 'pattern': 'HashMap', 'replacement': 'map'}])
+        self.assertEqual((first.find('hashmap'), second.find('map')), ({2, 3}, {2, 3}))
+        self.assertIs(first, get_frame_index(profile, stack_processor=RuleStackProcessor,
+                                             rules=[{'action': 'group', 'pattern': 'HashMap',
+                                                     'replacement': 'hashmap'}]))
+
+    def test_processed_stacks(self):
+        profile = make_profile()
+        rules = [{'action': 'group', 'pattern': 'HashMap', 'replacement': 'hashmap'}]
+        frame_index = get_frame_index(profile, stack_processor=RuleStackProcessor, rules=rules)
+        self.assertEqual(frame_index.find('hashmap'), {2, 3})
+        self.assertEqual(frame_index.find('Ljava/util/HashMap;::put'), set())
+
+        fg = get_flame_graph(profile, None, stack_processor=RuleStackProcessor, rules=rules, focus='^hashmap$',
+                             frame_index=frame_index)
+        self.assertEqual([(child['name'], child['value']) for child in fg['children'][0]['children']],
+                         [('hashmap', 3)])
+
+    def test_focus_exclude(self):
+        profile = make_profile()
+        fg = get_flame_graph(profile, None, stack_processor=JavaStackProcessor, focus='HashMap::put')
+        self.assertEqual(fg['children'][0]['children'][0]['children'][0]['value'], 2)
+        self.assertEqual(len(fg['children'][0]['children']), 1)
+
+        fg = get_flame_graph(profile, None, stack_processor=JavaStackProcessor, exclude='HashMap')
+        self.assertEqual([c['name'] for c in fg['children'][0]['children']], ['foo.Bar::baz'])
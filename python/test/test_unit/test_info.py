@@ -0,0 +1,50 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.cli import main
+from nflxprofile.info import get_info, read_info
+from nflxprofile.profile_io import dump
+
+
+class TestInfo(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            self.data = f.read()
+        self.profile.ParseFromString(self.data)
+
+    def test_get_info(self):
+        info = get_info(self.data)
+        self.assertEqual(info['start_time'], self.profile.start_time)
+        self.assertEqual(info['end_time'], self.profile.end_time)
+        self.assertEqual(info['params'], dict(self.profile.params))
+        self.assertEqual(info['node_count'], len(self.profile.nodes))
+        self.assertEqual(info['sample_count'], len(self.profile.samples))
+
+    def test_count_samples(self):
+        del self.profile.time_deltas[:]
+        self.profile.title = 'title'
+        data = self.profile.SerializeToString()
+
+        self.assertIsNone(get_info(data)['sample_count'])
+        info = get_info(data, count_samples=True)
+        self.assertEqual(info['sample_count'], len(self.profile.samples))
+        self.assertEqual(info['title'], 'title')
+
+    def test_read_info(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ['profile.nflxprofile', 'profile.nflxprofile.gz']:
+                path = os.path.join(directory, filename)
+                dump(self.profile, path)
+                self.assertEqual(read_info(path), get_info(self.data))
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                main(['info', path])
+            self.assertEqual(json.loads(output.getvalue())['node_count'], len(self.profile.nodes))
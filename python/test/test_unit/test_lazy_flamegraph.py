@@ -0,0 +1,72 @@
+import io
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.lazy_flamegraph import LazyFlameGraph, get_lazy_flame_graph
+
+
+FOLDED = """main;a;b 3
+main;a;c 2
+main;d 1
+"""
+
+
+def stack_frames(*frames):
+    stack = []
+    for function_name, libtype in frames:
+        frame = nflxprofile_pb2.StackFrame()
+        frame.function_name = function_name
+        frame.libtype = libtype
+        stack.append((frame, None))
+    return stack
+
+
+class TestLazyFlameGraph(unittest.TestCase):
+
+    def test_to_dict(self):
+        profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            profile.ParseFromString(f.read())
+
+        flame_graph = get_lazy_flame_graph(profile, None)
+        self.assertDictEqual(flame_graph.to_dict(), get_flame_graph(profile, None))
+        self.assertEqual(flame_graph.total, len(profile.samples))
+
+    def test_zoom(self):
+        profile = folded.parse(io.StringIO(FOLDED))
+        flame_graph = get_lazy_flame_graph(profile, None, use_sample_value=True)
+
+        self.assertEqual(flame_graph.total, 6)
+        self.assertEqual([(c['name'], c['total']) for c in flame_graph.children(['main'])], [('a', 5), ('d', 1)])
+        self.assertEqual(flame_graph.get_path(flame_graph.find(['main', 'a', 'c'])), ['main', 'a', 'c'])
+
+        subtree = flame_graph.to_dict(['main'], max_depth=1)
+        self.assertEqual(subtree['name'], 'main')
+        self.assertEqual([(c['name'], c['value'], c['children']) for c in subtree['children']],
+                         [('a', 5, []), ('d', 1, [])])
+
+    def test_find_frame_keys(self):
+        flame_graph = LazyFlameGraph()
+        flame_graph.add(stack_frames(('main', ''), ('f', 'jit')), 2)
+        flame_graph.add(stack_frames(('main', ''), ('f', 'kernel')), 1)
+        flame_graph.finish()
+
+        with self.assertRaises(KeyError):
+            flame_graph.find(['main', 'f'])
+        node = flame_graph.find(['main', ('f', 'kernel', '')])
+        self.assertEqual(flame_graph.totals[node], 1)
+        self.assertEqual(flame_graph.get_path(node, keys=True), [('main', '', ''), ('f', 'kernel', '')])
+        self.assertEqual(flame_graph.find(flame_graph.get_path(node, keys=True)), node)
+
+    def test_large_values(self):
+        flame_graph = LazyFlameGraph()
+        flame_graph.add(stack_frames(('main', ''), ('f', '')), 2 ** 63)
+        flame_graph.add(stack_frames(('main', ''), ('g', '')), 2 ** 63)
+        flame_graph.add(stack_frames(('main', ''), ('g', '')), 2 ** 63)
+        flame_graph.finish()
+
+        self.assertEqual(flame_graph.total, 3 * 2 ** 63)
+        self.assertEqual([(c['name'], c['total']) for c in flame_graph.children(['main'])],
+                         [('f', 2 ** 63), ('g', 2 ** 64)])
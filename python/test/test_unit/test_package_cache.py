@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import NodeJsPackageStackProcessor, PackageCache, get_flame_graph
+
+
+class TestPackageCache(unittest.TestCase):
+
+    def test_package_cache(self):
+        profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            profile.ParseFromString(f.read())
+
+        package_cache = PackageCache()
+        expected = get_flame_graph(profile, None, stack_processor=NodeJsPackageStackProcessor,
+                                   package_cache=package_cache)
+        misses = package_cache.misses
+        self.assertEqual(misses, len(package_cache.entries))
+        self.assertGreater(package_cache.hits, 0)
+
+        # a second run is served from the cache
+        fg = get_flame_graph(profile, None, stack_processor=NodeJsPackageStackProcessor,
+                             package_cache=package_cache)
+        self.assertEqual(fg, expected)
+        self.assertEqual(package_cache.misses, misses)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'packages.json')
+            package_cache.save(filename)
+            loaded = PackageCache()
+            loaded.load(filename)
+            self.assertEqual(loaded.entries, package_cache.entries)
+
+    def test_bounded(self):
+        package_cache = PackageCache(max_size=2)
+        for name in ['a', 'b', 'a', 'c']:
+            package_cache.get_package(name, 'kernel')
+        self.assertEqual(list(package_cache.entries), [('a', 'kernel'), ('c', 'kernel')])
+        self.assertEqual(package_cache.get_stats()['hit_rate'], 0.25)
@@ -0,0 +1,26 @@
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import NodeJsStackProcessor, get_flame_graph
+from nflxprofile.parallel import _worker_state, get_flame_graph_parallel
+
+
+def normalize(node):
+    node = dict(node)
+    node['children'] = sorted((normalize(child) for child in node['children']), key=lambda child: child['name'])
+    return node
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_parallel(self):
+        for processes in [1, 3]:
+            profile = nflxprofile_pb2.Profile()
+            with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+                profile.ParseFromString(f.read())
+
+            fg = get_flame_graph_parallel(profile, None, processes=processes, stack_processor=NodeJsStackProcessor)
+            expected = get_flame_graph(profile, None, stack_processor=NodeJsStackProcessor)
+            self.assertEqual(normalize(fg), normalize(expected))
+        # the single process path doesn't leave a worker profile behind
+        self.assertEqual(_worker_state, {})
@@ -0,0 +1,99 @@
+import gzip
+import io
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.convert import pprof
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.wire import LENGTH_DELIMITED, VARINT, encode_field, encode_varint
+
+
+def message(*fields):
+    return b''.join(
+        encode_field(number, VARINT, value) if isinstance(value, int)
+        else encode_field(number, LENGTH_DELIMITED, value)
+        for number, value in fields)
+
+
+def packed(*values):
+    return b''.join(encode_varint(value) for value in values)
+
+
+STRINGS = ['', 'samples', 'count', 'cpu', 'nanoseconds', 'main', 'handle', 'parse', 'main.go']
+
+# main -> handle, with parse inlined into handle
+PPROF = b''.join([
+    encode_field(1, LENGTH_DELIMITED, message((1, 1), (2, 2))),
+    encode_field(1, LENGTH_DELIMITED, message((1, 3), (2, 4))),
+    encode_field(2, LENGTH_DELIMITED, message((1, packed(2, 1)), (2, packed(1, 10)))),
+    encode_field(2, LENGTH_DELIMITED, message((1, packed(2, 1)), (2, packed(1, 5)))),
+    encode_field(2, LENGTH_DELIMITED, message((1, packed(1)), (2, packed(1, 7)))),
+    encode_field(2, LENGTH_DELIMITED, message((1, packed(1)), (2, packed(1, -3)))),
+    encode_field(4, LENGTH_DELIMITED, message((1, 1), (4, message((1, 1))))),
+    encode_field(4, LENGTH_DELIMITED, message((1, 2), (4, message((1, 3))), (4, message((1, 2))))),
+    encode_field(5, LENGTH_DELIMITED, message((1, 1), (2, 5), (4, 8), (5, 3))),
+    encode_field(5, LENGTH_DELIMITED, message((1, 2), (2, 6), (4, 8), (5, 20))),
+    encode_field(5, LENGTH_DELIMITED, message((1, 3), (2, 7), (4, 8), (5, 40))),
+] + [encode_field(6, LENGTH_DELIMITED, string.encode()) for string in STRINGS] + [
+    encode_field(9, VARINT, 2000000000),
+    encode_field(10, VARINT, 1500000000),
+])
+
+
+class TestPprof(unittest.TestCase):
+
+    def test_parse(self):
+        profile = pprof.parse(gzip.compress(PPROF))
+
+        self.assertEqual((profile.start_time, profile.end_time), (2, 3.5))
+        self.assertEqual(profile.params['sample_type'], 'cpu')
+        # two stacks, the negative sample is dropped
+        self.assertEqual(sorted(profile.samples_value), [7, 15])
+
+        fg = get_flame_graph(profile, None, use_sample_value=True)
+        main = fg['children'][0]
+        self.assertEqual((main['name'], main['value'], main['extras']['file']), ('main', 7, 'main.go:3'))
+        handle = main['children'][0]
+        self.assertEqual(handle['name'], 'handle')
+        parse = handle['children'][0]
+        self.assertEqual((parse['name'], parse['libtype'], parse['value']), ('parse', 'inlined', 15))
+
+        # node files are only used by profiles flagged with has_node_file
+        del profile.params['has_node_file']
+        self.assertNotIn('extras', get_flame_graph(profile, None, use_sample_value=True)['children'][0])
+
+        profile = pprof.parse(PPROF, sample_type='samples')
+        self.assertEqual(sorted(profile.samples_value), [2, 2])
+
+    def test_unsymbolized_locations(self):
+        data = b''.join([
+            encode_field(1, LENGTH_DELIMITED, message((1, 1), (2, 2))),
+            encode_field(2, LENGTH_DELIMITED, message((1, packed(3, 2, 1)), (2, packed(4)))),
+            encode_field(4, LENGTH_DELIMITED, message((1, 1), (4, message((1, 1))))),
+            # no line, and a line of a function missing from the profile
+            encode_field(4, LENGTH_DELIMITED, message((1, 2), (3, 0x4005d0))),
+            encode_field(4, LENGTH_DELIMITED, message((1, 3), (3, 0x4006ff), (4, message((1, 9))))),
+            encode_field(5, LENGTH_DELIMITED, message((1, 1), (2, 5), (4, 8), (5, 3))),
+        ] + [encode_field(6, LENGTH_DELIMITED, string.encode()) for string in STRINGS])
+        fg = get_flame_graph(pprof.parse(data), None, use_sample_value=True)
+
+        main = fg['children'][0]
+        self.assertEqual(main['name'], 'main')
+        address = main['children'][0]
+        self.assertEqual((address['name'], address['libtype']), ('0x4005d0', 'unknown'))
+        leaf = address['children'][0]
+        self.assertEqual((leaf['name'], leaf['libtype'], leaf['value']), ('0x4006ff', 'unknown', 4))
+
+    def test_round_trip(self):
+        profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            profile.ParseFromString(f.read())
+
+        f = io.BytesIO()
+        pprof.dump(profile, f)
+        converted = pprof.parse(f.getvalue())
+
+        def normalize(node):
+            return (node['name'], node['value'], sorted(normalize(child) for child in node['children']))
+        self.assertEqual(normalize(get_flame_graph(converted, None, use_sample_value=True)),
+                         normalize(get_flame_graph(profile, None)))
@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+from nflxprofile import nflxprofile_pb2, profile_io
+
+
+class TestProfileIO(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            self.profile.ParseFromString(f.read())
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        for extension in ['.nflxprofile', '.nflxprofile.gz', '.nflxprofile.xz']:
+            filename = os.path.join(self.tmpdir.name, 'profile' + extension)
+            profile_io.dump(self.profile, filename)
+            self.assertEqual(profile_io.load(filename), self.profile)
+
+    def test_magic_bytes(self):
+        filename = os.path.join(self.tmpdir.name, 'profile.nflxprofile')
+        profile_io.dump(self.profile, filename, compression='gzip')
+        with open(filename, 'rb') as f:
+            self.assertEqual(profile_io.get_compression(filename, f.read(6)), 'gzip')
+        self.assertEqual(profile_io.load(filename), self.profile)
@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from nflxprofile.registry import LazyRegistry
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLUGIN = """
+from nflxprofile.flamegraph import StackProcessor
+
+
+class UpperStackProcessor(StackProcessor):
+
+    def process_frame(self, frame):
+        frame, frame_extras = super().process_frame(frame)
+        frame.function_name = frame.function_name.upper()
+        return frame, frame_extras
+"""
+
+ENTRY_POINTS = """
+[nflxprofile.stack_processors]
+upper = nflxprofile_upper:UpperStackProcessor
+"""
+
+
+def run_python(code, path=()):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_DIR] + list(path)))
+    result = subprocess.run([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode('utf-8'))
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_lazy_lookup(self):
+        registry = LazyRegistry({'dumps': 'json:dumps', 'loads': json.loads})
+        self.assertIn('dumps', registry)
+        self.assertNotIn('missing', registry)
+        self.assertEqual(list(registry), ['dumps', 'loads'])
+        self.assertIs(registry['dumps'], json.dumps)
+        self.assertIs(registry['loads'], json.loads)
+        with self.assertRaises(KeyError):
+            registry['missing']
+
+    def test_startup_imports(self):
+        # the CLI only imports converters, flamegraph and protobuf once they are selected
+        modules = run_python(textwrap.dedent("""
+            import json, sys
+            import nflxprofile.cli
+            print(json.dumps(sorted(sys.modules)))
+        """))
+        for module in ['nflxprofile.flamegraph', 'nflxprofile.nflxprofile_pb2', 'nflxprofile.convert.v8_cpuprofile',
+                       'google.protobuf', 'importlib.metadata']:
+            self.assertNotIn(module, modules)
+
+    def test_startup_benchmark(self):
+        result = subprocess.run([sys.executable, '-m', 'test.benchmark_startup', '--repeat', '1', '--top', '50'],
+                                cwd=PACKAGE_DIR, stdout=subprocess.PIPE, check=True)
+        output = result.stdout.decode('utf-8')
+        self.assertIn('import nflxprofile.cli', output)
+        self.assertNotIn('nflxprofile.flamegraph', output)
+
+    def test_entry_point_plugin(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'nflxprofile_upper.py'), 'w') as f:
+                f.write(PLUGIN)
+            dist_info = os.path.join(tmpdir, 'nflxprofile_upper-1.0.dist-info')
+            os.mkdir(dist_info)
+            with open(os.path.join(dist_info, 'METADATA'), 'w') as f:
+                f.write("Metadata-Version: 2.1\nName: nflxprofile-upper\nVersion: 1.0\n")
+            with open(os.path.join(dist_info, 'entry_points.txt'), 'w') as f:
+                f.write(ENTRY_POINTS)
+
+            result = run_python(textwrap.dedent("""
+                import io, json
+                from nflxprofile.cli import STACK_PROCESSOR
+                from nflxprofile.convert import folded
+                from nflxprofile.flamegraph import get_flame_graph
+
+                profile = folded.parse(io.StringIO("main;foo 1\\n"))
+                tree = get_flame_graph(profile, None, stack_processor=STACK_PROCESSOR['upper'])
+                print(json.dumps([list(STACK_PROCESSOR), tree['children'][0]['name']]))
+            """), [tmpdir])
+        self.assertEqual(result, [['default', 'java', 'nodejs', 'nodejs-package', 'rules', 'upper'], 'MAIN'])
+
+
+if __name__ == '__main__':
+    unittest.main()
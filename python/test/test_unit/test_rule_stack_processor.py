@@ -0,0 +1,69 @@
+import io
+import unittest
+
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import RuleStackProcessor, get_flame_graph
+
+
+FOLDED = """main;Interpreter;a$$Lambda$1;lib/x.js:foo;lib/x.js:bar;leaf 1
+main;b;b;b;leaf 2
+"""
+
+RULES = [
+    {'action': 'skip', 'pattern': 'Interpreter'},
+    {'action': 'rename', 'pattern': r'\$\$Lambda.*', 'replacement': ''},
+    {'action': 'group', 'pattern': r'^(lib/[^:]+):', 'replacement': r'\1'},
+    {'action': 'collapse', 'pattern': '^b$'},
+]
+
+
+def get_paths(node, path=()):
+    paths = []
+    for child in node['children']:
+        child_path = path + (child['name'],)
+        if child['value']:
+            paths.append((child_path, child['value']))
+        paths.extend(get_paths(child, child_path))
+    return paths
+
+
+class TestRuleStackProcessor(unittest.TestCase):
+
+    def test_rules(self):
+        profile = folded.parse(io.StringIO(FOLDED))
+        fg = get_flame_graph(profile, None, use_sample_value=True, stack_processor=RuleStackProcessor, rules=RULES)
+        self.assertEqual(sorted(get_paths(fg)), [
+            (('main', 'a', 'lib/x.js', 'leaf'), 1),
+            (('main', 'b', 'leaf'), 2),
+        ])
+
+    def test_first_rule_wins(self):
+        processor = RuleStackProcessor(None, None, rules=[
+            {'action': 'rename', 'pattern': 'foo', 'replacement': 'bar'},
+            {'action': 'skip', 'pattern': 'foo'},
+        ])
+        self.assertEqual(processor.match_frame('a foo'), (0, 'a bar'))
+        self.assertEqual(processor.match_frame('baz'), (None, 'baz'))
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            RuleStackProcessor(None, None, rules=[{'action': 'drop', 'pattern': 'x'}])
+
+    def test_inline_flags(self):
+        processor = RuleStackProcessor(None, None, rules=[
+            {'action': 'rename', 'pattern': '(?i)foo', 'replacement': 'bar'},
+            {'action': 'skip', 'pattern': 'baz'},
+        ])
+        self.assertEqual(processor.match_frame('a FOO'), (0, 'a bar'))
+        # the flag doesn't leak into the next rule
+        self.assertEqual(processor.match_frame('BAZ'), (None, 'BAZ'))
+        self.assertEqual(processor.match_frame('baz'), (1, 'baz'))
+
+    def test_same_group_names(self):
+        processor = RuleStackProcessor(None, None, rules=[
+            {'action': 'group', 'pattern': r'^node_modules/(?P<pkg>[^/]+)/', 'replacement': r'\g<pkg>'},
+            {'action': 'group', 'pattern': r'^lib/(?P<pkg>[^/]+)/', 'replacement': r'lib \g<pkg>'},
+        ])
+        self.assertEqual(processor.match_frame('node_modules/express/index.js'), (0, 'express'))
+        self.assertEqual(processor.match_frame('lib/http/server.js'), (1, 'lib http'))
+        self.assertEqual(processor.match_frame('main'), (None, 'main'))
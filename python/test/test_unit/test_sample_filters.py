@@ -0,0 +1,48 @@
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import CPUSampleFilter, get_flame_graph
+
+
+def make_profile():
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = profile.end_time = 0
+    profile.params['has_parent'] = 'true'
+    profile.params['has_samples_cpu'] = 'true'
+    profile.params['has_samples_pid'] = 'true'
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    profile.nodes[1].function_name = 'main'
+    profile.nodes[1].hit_count = 0
+    for cpu in range(8):
+        profile.samples.append(1)
+        profile.time_deltas.append(0)
+        profile.samples_cpu.append(cpu)
+        profile.samples_pid.append(cpu % 2)
+    return profile
+
+
+class TestSampleFilters(unittest.TestCase):
+
+    def test_selections(self):
+        profile = make_profile()
+        tests = [
+            (0, [1, 0, 0, 0, 0, 0, 0, 0]),
+            ({1, 3}, [0, 1, 0, 1, 0, 0, 0, 0]),
+            (range(2, 4), [0, 0, 1, 1, 0, 0, 0, 0]),
+            ('0-2,7', [1, 1, 1, 0, 0, 0, 0, 1]),
+            ('!0-5', [0, 0, 0, 0, 0, 0, 1, 1]),
+        ]
+        for selection, expected in tests:
+            self.assertEqual(list(CPUSampleFilter(profile, cpu=selection).get_mask()), expected)
+
+    def test_combined_filters(self):
+        profile = make_profile()
+
+        def total(**args):
+            return get_flame_graph(profile, None, **args)['children'][0]['value']
+
+        self.assertEqual(total(pid=0), 4)
+        self.assertEqual(total(cpu=0), 1)
+        self.assertEqual(total(cpu='0-5', pid=1), 3)
+        self.assertEqual(total(cpu='!0-5', pid=[0, 1]), 2)
@@ -0,0 +1,56 @@
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.series import get_flame_graph_series
+
+
+def normalize(node):
+    node = dict(node)
+    node['children'] = sorted((normalize(child) for child in node['children']), key=lambda child: child['name'])
+    return node
+
+
+class TestSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            self.profile.ParseFromString(f.read())
+        self.duration = self.profile.end_time - int(self.profile.start_time)
+
+    def test_series(self):
+        window = self.duration / 3
+        step = self.duration / 7
+        frames = list(get_flame_graph_series(self.profile, None, window, step))
+
+        self.assertEqual(len(frames), 7)
+        for frame in frames:
+            expected = get_flame_graph(self.profile, None, range_start=frame['range_start'],
+                                       range_end=frame['range_end'])
+            self.assertEqual(normalize(frame['flame_graph']), normalize(expected))
+
+    def test_deltas(self):
+        window = step = self.duration / 4
+        frames = list(get_flame_graph_series(self.profile, None, window, step, deltas=True))
+
+        previous = {}
+        for frame in frames:
+            current = {}
+            paths = [tuple(change['path']) for change in frame['changes']]
+            self.assertEqual(len(set(paths)), len(paths))
+            for change in frame['changes']:
+                path = tuple(change['path'])
+                self.assertTrue(all(len(key) == 3 for key in path))
+                current[path] = previous.get(path, 0) + change['value']
+            for path, value in previous.items():
+                current.setdefault(path, value)
+            previous = current
+        # the last frame only has samples from the last quarter, non overlapping windows
+        total = sum(previous.values())
+        expected = get_flame_graph(self.profile, None, range_start=frames[-1]['range_start'],
+                                   range_end=frames[-1]['range_end'])
+
+        def count(node):
+            return node['value'] + sum(count(child) for child in node['children'])
+        self.assertEqual(total, count(expected))
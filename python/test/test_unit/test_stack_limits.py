@@ -0,0 +1,101 @@
+import io
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.convert import folded
+from nflxprofile.flamegraph import NodeJsPackageStackProcessor, RuleStackProcessor, get_flame_graph
+from nflxprofile.parallel import merge_flame_graphs
+
+
+def get_paths(node, path=()):
+    """Return {path: (value, extras)} for every node with a value or extras."""
+    paths = {}
+    for child in node['children']:
+        child_path = path + (child['name'],)
+        if child['value'] or child.get('extras'):
+            paths[child_path] = (child['value'], child.get('extras', {}))
+        paths.update(get_paths(child, child_path))
+    return paths
+
+
+def get_depth(node):
+    return max([get_depth(child) + 1 for child in node['children']] + [0])
+
+
+class TestStackLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = folded.parse(io.StringIO("main;f;f;f;g 2\nmain;f;f;h 1\nmain;i 1\n"))
+
+    def test_max_depth(self):
+        self.assertEqual(get_paths(get_flame_graph(self.profile, None, max_depth=2)), {
+            ('main', 'f'): (2, {}),
+            ('main', 'i'): (1, {}),
+        })
+
+    def test_max_depth_inverted(self):
+        self.assertEqual(get_paths(get_flame_graph(self.profile, None, max_depth=2, inverted=True)), {
+            ('g', 'f'): (1, {}),
+            ('h', 'f'): (1, {}),
+            ('i', 'main'): (1, {}),
+        })
+
+    def test_collapse_recursion(self):
+        self.assertEqual(get_paths(get_flame_graph(self.profile, None, collapse_recursion=True)), {
+            ('main', 'f'): (0, {'recursion': 2}),
+            ('main', 'f', 'g'): (1, {}),
+            ('main', 'f', 'h'): (1, {}),
+            ('main', 'i'): (1, {}),
+        })
+        inverted = get_flame_graph(self.profile, None, collapse_recursion=True, inverted=True, max_depth=2)
+        self.assertEqual(get_paths(inverted), {
+            ('g', 'f'): (1, {'recursion': 2}),
+            ('h', 'f'): (1, {'recursion': 1}),
+            ('i', 'main'): (1, {}),
+        })
+
+    def test_node_stack(self):
+        profile = nflxprofile_pb2.Profile()
+        with open("test/fixtures/nodejs1.nflxprofile", "rb") as f:
+            profile.ParseFromString(f.read())
+        full = get_flame_graph(profile, None)
+        self.assertGreater(get_depth(full), 3)
+        for inverted in [False, True]:
+            limited = get_flame_graph(profile, None, max_depth=3, inverted=inverted)
+            self.assertEqual(get_depth(limited), 3)
+            self.assertEqual(sum(value for value, _ in get_paths(limited).values()),
+                             sum(value for value, _ in get_paths(full).values()))
+        self.assertEqual(get_flame_graph(profile, None, max_depth=3)['children'][0]['name'],
+                         full['children'][0]['name'])
+
+    def test_merge_recursion(self):
+        first = get_flame_graph(self.profile, None, collapse_recursion=True)
+        second = get_flame_graph(folded.parse(io.StringIO("main;f;f;g 1\n")), None, collapse_recursion=True)
+        merged = merge_flame_graphs(first, second)
+        self.assertEqual(get_paths(merged)[('main', 'f')], (0, {'recursion': 2}))
+
+    def test_rule_recursion(self):
+        profile = folded.parse(io.StringIO("main;f;f;f;leaf 1\nmain;g1;g1;g2;leaf 1\n"))
+        rules = [{'action': 'skip', 'pattern': '^main$'}, {'action': 'group', 'pattern': '^g', 'replacement': 'g'}]
+        flame_graph = get_flame_graph(profile, None, collapse_recursion=True, stack_processor=RuleStackProcessor,
+                                      rules=rules)
+        self.assertEqual(get_paths(flame_graph), {
+            ('f',): (0, {'recursion': 2}),
+            ('f', 'leaf'): (1, {}),
+            ('g',): (0, {'recursion': 1}),
+            ('g', 'leaf'): (1, {}),
+        })
+
+    def test_package_recursion(self):
+        f = 'LazyCompile:*f /app/a.js:1'
+        profile = folded.parse(io.StringIO("main;%s;%s;%s;leaf 1\n" % (f, f, f)))
+        flame_graph = get_flame_graph(profile, None, collapse_recursion=True,
+                                      stack_processor=NodeJsPackageStackProcessor)
+        self.assertEqual(get_paths(flame_graph), {
+            ('(native)', '(app code)'): (0, {'recursion': 2}),
+            ('(native)', '(app code)', '(native)'): (1, {}),
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import io
+import unittest
+
+from nflxprofile import nflxprofile_pb2, ticks
+from nflxprofile.convert import folded, v8_cpuprofile
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.info import get_info
+
+
+def get_profile():
+    profile = folded.parse(io.StringIO("main;a;b 1\nmain;a 1\nmain;c 1\n"))
+    del profile.samples[:]
+    del profile.samples_value[:]
+    del profile.time_deltas[:]
+    profile.start_time = 100.0
+    # 10ms interval with a few gaps, runs of repeated stacks
+    samples = [3, 3, 3, 2, 2, 4, 3, 3, 4, 4, 4, 4, 2, 3, 3, 3]
+    deltas = [0.01] * 5 + [0.03] + [0.01] * 6 + [0.02] + [0.01] * 3
+    profile.samples.extend(samples)
+    profile.time_deltas.extend(deltas)
+    profile.samples_value.extend([1, 1, 1, 2, 2, 1, 1, 1, 3, 3, 3, 3, 1, 1, 1, 1])
+    profile.samples_cpu.extend([0] * 8 + [1] * 8)
+    profile.params['has_samples_cpu'] = 'true'
+    profile.end_time = profile.start_time + sum(deltas)
+    return profile
+
+
+def encoded(profile, tick_resolution=0.001):
+    copy = nflxprofile_pb2.Profile()
+    copy.CopyFrom(profile)
+    return ticks.encode(copy, tick_resolution)
+
+
+def call_frame(function_name):
+    return {'functionName': function_name, 'url': '', 'lineNumber': -1, 'columnNumber': -1, 'scriptId': '0'}
+
+
+class TestTicks(unittest.TestCase):
+
+    def test_encode_expand(self):
+        profile = get_profile()
+        encoded_profile = encoded(profile)
+        self.assertTrue(ticks.has_tick_runs(encoded_profile))
+        self.assertEqual(list(encoded_profile.samples), [3, 2, 4, 3, 4, 2, 3])
+        self.assertEqual(list(encoded_profile.sample_runs), [3, 2, 1, 2, 4, 1, 3])
+        self.assertEqual(list(encoded_profile.tick_deltas), [10, 30, 10, 20, 10])
+        self.assertEqual(list(encoded_profile.tick_delta_runs), [5, 1, 6, 1, 3])
+        self.assertEqual(len(encoded_profile.time_deltas), 0)
+
+        expanded = ticks.expand(encoded_profile)
+        self.assertFalse(ticks.has_tick_runs(expanded))
+        for column in ['samples', 'samples_value', 'samples_cpu']:
+            self.assertEqual(list(getattr(expanded, column)), list(getattr(profile, column)))
+        for expanded_delta, delta in zip(expanded.time_deltas, profile.time_deltas):
+            self.assertAlmostEqual(expanded_delta, delta)
+
+        samples = list(ticks.iter_samples(encoded_profile))
+        self.assertEqual([sample for sample, _, _ in samples], list(profile.samples))
+        self.assertAlmostEqual(samples[-1][1], profile.end_time)
+
+    def test_encode_coarse_resolution(self):
+        # 10ms deltas drift by more than half a 6ms tick
+        with self.assertRaises(ValueError):
+            encoded(get_profile(), 0.006)
+        # 20ms gaps on a 20ms tick are kept, 10ms deltas move by exactly half a tick
+        self.assertTrue(ticks.has_tick_runs(encoded(get_profile(), 0.02)))
+
+    def test_flame_graph(self):
+        profile = get_profile()
+        encoded_profile = encoded(profile)
+        for args in [
+            {},
+            {'inverted': True},
+            {'use_sample_value': True},
+            {'range_start': 0.035, 'range_end': 0.125},
+            {'range_start': 0.035, 'range_end': 0.125, 'use_sample_value': True},
+            {'cpu': 1},
+            {'cpu': 0, 'range_start': 0.015, 'range_end': 1.0},
+            {'focus': 'c'},
+        ]:
+            self.assertEqual(get_flame_graph(encoded_profile, None, **args), get_flame_graph(profile, None, **args))
+
+    def test_index_range(self):
+        encoded_profile = encoded(get_profile())
+        # samples at 10, 20, 30, 40, 50, 80, 90, ... 140, 160, 170, 180, 190 ticks
+        self.assertEqual(ticks.get_index_range(encoded_profile, 100.035, 100.125), (3, 10))
+        self.assertEqual(ticks.get_index_range(encoded_profile, 100.0, 100.01), (0, 0))
+        self.assertEqual(ticks.get_index_range(encoded_profile, 100.0, 100.0101), (0, 1))
+        self.assertEqual(ticks.get_index_range(encoded_profile, 101.0, 102.0), (16, 16))
+
+    def test_info(self):
+        data = encoded(get_profile()).SerializeToString()
+        self.assertEqual(get_info(data, count_samples=True)['sample_count'], 16)
+
+    def test_v8_cpuprofile(self):
+        cpuprofile = {
+            'startTime': 1000000,
+            'endTime': 1005000,
+            'nodes': [
+                {'id': 1, 'callFrame': call_frame('(root)'), 'children': [2]},
+                {'id': 2, 'callFrame': call_frame('foo')},
+            ],
+            'samples': [2, 2, 2, 2, 2],
+            'timeDeltas': [1000, 1000, 1000, 1000, 1000],
+        }
+        profile = v8_cpuprofile.parse(cpuprofile, tick_resolution=0.000001)
+        self.assertTrue(ticks.has_tick_runs(profile))
+        self.assertEqual(list(profile.sample_runs), [5])
+        self.assertEqual((list(profile.tick_deltas), list(profile.tick_delta_runs)), ([1000], [5]))
+        self.assertEqual(get_flame_graph(profile, None), get_flame_graph(v8_cpuprofile.parse(cpuprofile), None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import io
+import json
+import unittest
+
+from nflxprofile.tree_json import dump_tree
+
+
+class TestTreeJson(unittest.TestCase):
+
+    def test_identical_output(self):
+        with open("test/fixtures/nodejs1.json", "r") as f:
+            tree = json.loads(f.read())
+        tree['extras'] = {'unicode': 'café ☃', 'float': 0.1, 1: None, 'nested': [[], {}]}
+
+        for subtree_limit in [1, 4, 1024]:
+            out = io.StringIO()
+            dump_tree(tree, out, subtree_limit=subtree_limit)
+            self.assertEqual(out.getvalue(), json.dumps(tree))
+
+    def test_deep_tree(self):
+        tree = {'name': 'leaf', 'value': 1, 'children': [{'name': 'x%d' % i, 'children': []} for i in range(10)]}
+        for depth in range(300):
+            siblings = [{'name': 'y%d_%d' % (depth, i), 'children': []} for i in range(3)]
+            tree = {'name': 'd%d' % depth, 'value': depth, 'children': [tree] + siblings}
+
+        for subtree_limit in [1, 16, 1024]:
+            out = io.StringIO()
+            dump_tree(tree, out, subtree_limit=subtree_limit)
+            self.assertEqual(out.getvalue(), json.dumps(tree))
+
+    def test_wide_tree(self):
+        tree = {'name': 'root', 'children': [
+            {'name': 'f%d' % i, 'children': [{'name': 'g%d' % j, 'children': []} for j in range(i % 20)]}
+            for i in range(500)
+        ]}
+
+        for subtree_limit in [1, 16, 1024]:
+            out = io.StringIO()
+            dump_tree(tree, out, subtree_limit=subtree_limit)
+            self.assertEqual(out.getvalue(), json.dumps(tree))
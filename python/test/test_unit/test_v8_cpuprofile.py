@@ -0,0 +1,94 @@
+import copy
+import unittest
+
+from nflxprofile.convert.v8_cpuprofile import parse
+from nflxprofile.flamegraph import get_cpu_utilization, get_flame_graph
+from nflxprofile.hotspots import get_line_hotspots
+
+
+def call_frame(function_name, url='', line=-1):
+    return {'functionName': function_name, 'url': url, 'lineNumber': line, 'columnNumber': -1, 'scriptId': '0'}
+
+
+CPUPROFILE = {
+    'startTime': 1000000,
+    'endTime': 1004000,
+    'nodes': [
+        {'id': 1, 'callFrame': call_frame('(root)'), 'hitCount': 0, 'children': [2, 3]},
+        {'id': 2, 'callFrame': call_frame('(idle)'), 'hitCount': 1},
+        {'id': 3, 'callFrame': call_frame('foo', 'file:///app/index.js', 1), 'hitCount': 1, 'children': [4],
+         'positionTicks': [{'line': 3, 'ticks': 1}]},
+        {'id': 4, 'callFrame': call_frame('bar', 'file:///app/index.js', 9), 'hitCount': 2,
+         'positionTicks': [{'line': 10, 'ticks': 2}]},
+    ],
+    'samples': [3, 4, 2, 4],
+    'timeDeltas': [1000, 1000, 1000, 1000],
+}
+
+
+def without_samples(cpuprofile):
+    cpuprofile = copy.deepcopy(cpuprofile)
+    del cpuprofile['samples']
+    del cpuprofile['timeDeltas']
+    return cpuprofile
+
+
+class TestV8CpuProfile(unittest.TestCase):
+
+    def test_hit_count(self):
+        profile = parse(without_samples(CPUPROFILE))
+
+        self.assertEqual(len(profile.samples), 0)
+        self.assertEqual(profile.params['has_aggregated_samples'], 'true')
+        self.assertEqual(get_flame_graph(profile, None), get_flame_graph(parse(CPUPROFILE), None))
+
+        # V8 nodes have no value, their hit count is their weight
+        foo = get_flame_graph(profile, None, weighted=True)['children'][0]['children'][0]['children'][0]
+        self.assertEqual((foo['name'], foo['value'], foo['samples']), ('foo', 1, 1))
+        self.assertEqual((foo['children'][0]['value'], foo['children'][0]['samples']), (2, 2))
+
+    def test_line_hotspots(self):
+        for cpuprofile in [CPUPROFILE, without_samples(CPUPROFILE)]:
+            hotspots = get_line_hotspots(parse(cpuprofile))
+            self.assertEqual(hotspots, [
+                {'function_name': 'bar', 'file': '/app/index.js', 'line': 10, 'ticks': 2},
+                {'function_name': 'foo', 'file': '/app/index.js', 'line': 3, 'ticks': 1},
+            ])
+
+    def test_dedupe_stacks(self):
+        cpuprofiles = [CPUPROFILE, CPUPROFILE]
+        profile = parse(cpuprofiles)
+        deduped = parse(cpuprofiles, dedupe_stacks=True)
+
+        # root, foo and bar for each process vs shared
+        self.assertEqual(len(profile.nodes), 5)
+        self.assertEqual(len(deduped.nodes), 3)
+        self.assertEqual(sorted(deduped.samples_pid), [1, 1, 1, 2, 2, 2])
+        self.assertEqual(get_flame_graph(deduped, None), get_flame_graph(profile, None))
+        # position ticks of both processes are merged by line
+        self.assertEqual(sorted((line_ticks.line, line_ticks.ticks) for node in deduped.nodes.values()
+                                for line_ticks in node.line_ticks), [(3, 2), (10, 4)])
+        self.assertEqual(get_line_hotspots(deduped), get_line_hotspots(profile))
+
+    def test_idle_samples(self):
+        profile = parse(CPUPROFILE, histogram_interval=0.0025)
+
+        self.assertEqual(profile.idle_sample_count, 1)
+        self.assertEqual(profile.program_sample_count, 0)
+        # idle samples still advance the time of the following samples
+        self.assertAlmostEqual(sum(profile.time_deltas), 0.004)
+        self.assertEqual(list(profile.sample_histogram), [2, 1])
+        self.assertEqual(list(profile.idle_histogram), [0, 1])
+
+        self.assertEqual(get_cpu_utilization(profile), 0.75)
+        self.assertEqual(get_cpu_utilization(profile, 0, 0.0025), 1)
+        self.assertEqual(get_cpu_utilization(profile, 0.003, 0.004), 0.5)
+        self.assertEqual(get_flame_graph(profile, None, cpu_utilization=True)['cpu_utilization'], 0.75)
+
+        # samples of a run are counted once each
+        self.assertEqual(get_cpu_utilization(parse(CPUPROFILE, tick_resolution=1e-6)), 0.75)
+
+        aggregated = parse(without_samples(CPUPROFILE))
+        self.assertEqual(aggregated.idle_sample_count, 1)
+        self.assertEqual(get_cpu_utilization(aggregated), 0.75)
+        self.assertIsNone(get_cpu_utilization(aggregated, 0, 1))
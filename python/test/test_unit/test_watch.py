@@ -0,0 +1,170 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from nflxprofile.cli import main
+from nflxprofile.flamegraph import get_flame_graph
+from nflxprofile.profile_io import load
+from nflxprofile.watch import ConversionDaemon, ConversionIndex, _Inotify, _convert
+
+
+def call_frame(function_name):
+    return {'functionName': function_name, 'url': '', 'lineNumber': -1, 'columnNumber': -1, 'scriptId': '0'}
+
+
+def write_cpuprofile(filename, function_name='foo'):
+    cpuprofile = {
+        'startTime': 1000000,
+        'endTime': 1002000,
+        'nodes': [
+            {'id': 1, 'callFrame': call_frame('(root)'), 'children': [2]},
+            {'id': 2, 'callFrame': call_frame(function_name)},
+        ],
+        'samples': [2, 2],
+        'timeDeltas': [1000, 1000],
+    }
+    # written then moved, as the watcher only picks complete files
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(cpuprofile, f)
+    os.rename(filename + '.tmp', filename)
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.05)
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'spool')
+        self.output_directory = os.path.join(self.tmpdir.name, 'out')
+        self.index_file = os.path.join(self.tmpdir.name, 'index')
+        os.mkdir(self.directory)
+        os.mkdir(self.output_directory)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_daemon(self):
+        daemon = ConversionDaemon(self.directory, self.output_directory, workers=2, index_file=self.index_file)
+        self.addCleanup(daemon.close)
+        return daemon
+
+    def test_scan(self):
+        write_cpuprofile(os.path.join(self.directory, 'a.cpuprofile'))
+        write_cpuprofile(os.path.join(self.directory, 'copy.cpuprofile'))
+        with open(os.path.join(self.directory, 'notes.txt'), 'w') as f:
+            f.write('not a profile')
+
+        daemon = self.get_daemon()
+        daemon.scan()
+        daemon.wait()
+        stats = daemon.get_stats()
+        self.assertEqual((stats['converted'], stats['skipped'], stats['unsupported'], stats['pending']),
+                         (1, 1, 1, 0))
+        outputs = os.listdir(self.output_directory)
+        self.assertEqual(len(outputs), 1)
+        tree = get_flame_graph(load(os.path.join(self.output_directory, outputs[0])), None)
+        self.assertIn('"foo"', json.dumps(tree))
+
+        # restarted over the same files, nothing is hashed or converted again
+        self.assertEqual(len(ConversionIndex(self.index_file)), 1)
+        daemon = self.get_daemon()
+        daemon.scan()
+        daemon.wait()
+        self.assertEqual(daemon.get_stats()['converted'], 0)
+
+    def test_same_directory(self):
+        write_cpuprofile(os.path.join(self.directory, 'a.cpuprofile'))
+        with open(os.path.join(self.directory, 'notes.txt'), 'w') as f:
+            f.write('not a profile')
+
+        daemon = ConversionDaemon(self.directory, self.directory, workers=1, index_file=self.index_file)
+        self.addCleanup(daemon.close)
+        daemon.scan()
+        daemon.wait()
+        # the output and its temporary file are neither inputs nor unsupported
+        for name in os.listdir(self.directory):
+            daemon.submit(name)
+        daemon.scan()
+        daemon.wait()
+        stats = daemon.get_stats()
+        self.assertEqual((stats['converted'], stats['unsupported']), (1, 1))
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.nflxprofile')]), 1)
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.tmp')])
+
+    def test_stop_while_waiting(self):
+        write_cpuprofile(os.path.join(self.directory, 'a.cpuprofile'))
+        daemon = ConversionDaemon(self.directory, self.output_directory, workers=1, max_pending=1)
+        self.addCleanup(daemon.close)
+        # every slot is taken, submit waits until stopped
+        daemon.slots.acquire()
+        threading.Timer(0.2, daemon.stop_event.set).start()
+        self.assertIsNone(daemon.submit('a.cpuprofile'))
+        daemon.slots.release()
+
+        daemon.stop_event.clear()
+        daemon.scan()
+        daemon.wait()
+        self.assertEqual(daemon.get_stats()['converted'], 1)
+
+    def run_daemon(self, **args):
+        daemon = self.get_daemon()
+        stop_event = threading.Event()
+        thread = threading.Thread(target=daemon.run, args=(stop_event,), kwargs=dict(args, poll_interval=0.05))
+        thread.start()
+        try:
+            write_cpuprofile(os.path.join(self.directory, 'new.cpuprofile'), 'bar')
+            wait_for(lambda: daemon.get_stats()['converted'] == 1)
+            write_cpuprofile(os.path.join(self.directory, 'same.cpuprofile'), 'bar')
+            wait_for(lambda: daemon.get_stats()['skipped'] == 1)
+        finally:
+            stop_event.set()
+            thread.join()
+        self.assertEqual(daemon.get_stats()['converted'], 1)
+
+    def test_polling(self):
+        self.run_daemon(use_inotify=False)
+
+    def test_inotify(self):
+        try:
+            _Inotify(self.directory).close()
+        except (OSError, AttributeError):
+            self.skipTest("inotify is not available")
+        self.run_daemon()
+
+    def test_stats_logged(self):
+        with self.assertLogs('nflxprofile.watch', level='INFO'):
+            self.run_daemon(use_inotify=False, stats_interval=0)
+
+    def test_failed_conversion(self):
+        input_file = os.path.join(self.directory, 'a.cpuprofile')
+        write_cpuprofile(input_file)
+        # the output can't be replaced by the converted profile
+        output = os.path.join(self.output_directory, 'a.nflxprofile')
+        os.mkdir(output)
+        with self.assertRaises(OSError):
+            _convert('v8', input_file, output, {})
+        self.assertEqual(os.listdir(self.output_directory), ['a.nflxprofile'])
+
+    def test_cli_once(self):
+        write_cpuprofile(os.path.join(self.directory, 'a.cpuprofile'))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['watch', '--once', '--workers', '1', '--output-dir', self.output_directory, self.directory])
+        self.assertEqual(json.loads(output.getvalue())['converted'], 1)
+        self.assertEqual(len(ConversionIndex(os.path.join(self.output_directory, '.nflxprofile-index'))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
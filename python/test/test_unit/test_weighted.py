@@ -0,0 +1,50 @@
+import unittest
+
+from nflxprofile import nflxprofile_pb2
+from nflxprofile.flamegraph import get_flame_graph
+
+
+def make_profile(values=None):
+    profile = nflxprofile_pb2.Profile()
+    profile.start_time = 10.5
+    profile.end_time = 14.5
+    profile.params['has_parent'] = 'true'
+    profile.nodes[0].function_name = 'root'
+    profile.nodes[0].hit_count = 0
+    for node_id, name in enumerate(['main', 'alloc'], 1):
+        profile.nodes[node_id].function_name = name
+        profile.nodes[node_id].hit_count = 0
+        profile.nodes[node_id].parent = node_id - 1
+    for index in range(4):
+        profile.samples.append(1 + index % 2)
+        profile.time_deltas.append(1)
+    if values is not None:
+        profile.samples_value.extend(values)
+    return profile
+
+
+class TestWeighted(unittest.TestCase):
+
+    def test_weighted(self):
+        max_uint64 = 2 ** 64 - 1
+        profile = make_profile([1, max_uint64, 3, max_uint64])
+        main = get_flame_graph(profile, None, weighted=True)['children'][0]
+        self.assertEqual((main['value'], main['samples']), (4, 2))
+        alloc = main['children'][0]
+        self.assertEqual((alloc['value'], alloc['samples']), (2 * max_uint64, 2))
+
+        # hasValues isn't required
+        self.assertEqual(get_flame_graph(profile, None, use_sample_value=True)['children'][0]['value'], 4)
+
+    def test_weighted_range(self):
+        profile = make_profile([1, 2, 3, 4])
+        main = get_flame_graph(profile, None, weighted=True, range_start=1, range_end=3)['children'][0]
+        self.assertEqual((main['value'], main['samples']), (1, 1))
+        self.assertEqual(main['children'][0]['value'], 2)
+
+    def test_missing_values(self):
+        profile = make_profile()
+        with self.assertRaises(ValueError):
+            get_flame_graph(profile, None, weighted=True)
+        with self.assertRaises(ValueError):
+            get_flame_graph(profile, None, use_sample_value=True)